@@ -0,0 +1,424 @@
+"""
+Asyncio counterpart of FanarAPIClient for high-concurrency fan-out.
+
+All requests share one aiohttp connection pool, and a semaphore bounds the
+number of requests in flight, so hundreds of per-sentence translation or TTS
+calls can be issued with asyncio.gather without a thread per request. The
+methods return the same shapes as the synchronous client, and every request
+goes through the same process-wide rate limiters, response cache and tracing
+spans, so async and threaded callers share one quota and one cache.
+"""
+
+import asyncio
+import json
+import os
+import threading
+
+import aiohttp
+
+import tracing
+from dubbing_utils import (
+    DEFAULT_BASE_URL, DEFAULT_TIMEOUTS, RETRY_STATUS_CODES, AUDIO_MIME_TYPES, backoff_delay, parse_retry_after,
+    STT_UPLOAD_FORMAT, STT_UPLOAD_SAMPLE_RATE, UPLOAD_ENCODERS, UPLOAD_CHUNK_SIZE, DEFAULT_MAX_UPLOAD_MB,
+    DOWNLOAD_CHUNK_SIZE, wav_seconds, upload_passthrough
+)
+from audio_store import WavStreamDecoder
+from stage_cache import hash_file
+from rate_limiter import shared_limiters
+
+
+async def aiter_upload_audio(file_path, upload_format=STT_UPLOAD_FORMAT, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Async counterpart of dubbing_utils.iter_upload_audio, reading ffmpeg's stdout without blocking."""
+    if await asyncio.to_thread(upload_passthrough, file_path, upload_format):
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    encoder = UPLOAD_ENCODERS[upload_format]
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin', '-i', file_path, '-vn',
+        '-ac', '1', '-ar', str(STT_UPLOAD_SAMPLE_RATE), *encoder, 'pipe:1',
+        stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        while True:
+            chunk = await process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        stderr = await process.stderr.read()
+        if await process.wait() != 0:
+            raise Exception(f"FFMPEG error: {stderr.decode(errors='replace')}")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+async def save_response_async(response, output_file, on_chunk=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Async counterpart of dubbing_utils.save_response: write a response body
+    to a file as it arrives, renaming it into place once complete.
+
+    Returns:
+        int: Bytes received
+    """
+    temp_file = f"{output_file}.{os.getpid()}.{threading.get_ident()}.{id(response)}.part"
+    received = 0
+    try:
+        with open(temp_file, "wb") as f:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                f.write(chunk)
+                received += len(chunk)
+                if on_chunk is not None:
+                    on_chunk(chunk)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    return received
+
+
+class AsyncFanarAPIClient:
+    """Async client for interacting with Fanar API services."""
+
+    def __init__(self, api_key, max_in_flight=16, pool_size=None, timeouts=None,
+                 max_retries=3, backoff_base=1.0, backoff_max=60.0, response_cache=None, rate_limits=None,
+                 base_url=None, stt_upload_format=None, max_upload_mb=None):
+        """
+        Args:
+            api_key (str): Fanar API key
+            max_in_flight (int): Maximum number of concurrent requests from this client
+            pool_size (int): Maximum number of pooled connections (defaults to max_in_flight)
+            timeouts (dict): (connect, read) timeouts per endpoint, overriding DEFAULT_TIMEOUTS
+            max_retries (int): Retries on 429/5xx responses and connection errors
+            backoff_base (float): Base delay in seconds for exponential backoff
+            backoff_max (float): Upper bound in seconds for a single retry delay
+            response_cache (ResponseCache): Optional store of responses to identical requests
+            rate_limits (dict): (requests per second, burst) per endpoint for limiters not
+                created yet, defaulting to FANAR_RATE_LIMITS over DEFAULT_RATE_LIMITS; the
+                limiters are shared with every other client in the process
+            base_url (str): API root, defaulting to FANAR_BASE_URL or DEFAULT_BASE_URL
+            stt_upload_format (str): Format speech is transcoded to for transcription (see
+                UPLOAD_ENCODERS), defaulting to FANAR_STT_UPLOAD_FORMAT or STT_UPLOAD_FORMAT
+            max_upload_mb (float): Largest transcription upload, defaulting to
+                FANAR_MAX_UPLOAD_MB or DEFAULT_MAX_UPLOAD_MB; 0 disables the limit
+        """
+        if not api_key:
+            raise ValueError("API key is required")
+        self.api_key = api_key
+        self.base_url = base_url or os.getenv("FANAR_BASE_URL", DEFAULT_BASE_URL)
+        self.stt_upload_format = stt_upload_format or os.getenv("FANAR_STT_UPLOAD_FORMAT", STT_UPLOAD_FORMAT)
+        if max_upload_mb is None:
+            max_upload_mb = float(os.getenv("FANAR_MAX_UPLOAD_MB", DEFAULT_MAX_UPLOAD_MB))
+        self.max_upload_bytes = int(max_upload_mb * 1024 * 1024)
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.max_in_flight = max_in_flight
+        self.pool_size = pool_size or max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.response_cache = response_cache
+        self.limiters = shared_limiters(rate_limits)
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._session = None
+
+    def _get_session(self):
+        # Created lazily so the session binds to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(headers=self.headers, connector=connector)
+        return self._session
+
+    async def close(self):
+        """Close pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _post(self, endpoint, url, handle_response, build_form=None, **kwargs):
+        """
+        POST through the pooled session, retrying 429/5xx responses and
+        connection errors with jittered exponential backoff. Every attempt
+        waits for the endpoint's shared rate and concurrency limits.
+
+        Args:
+            endpoint (str): Endpoint name used to look up timeouts and limiters
+            url (str): Request URL
+            handle_response (coroutine function): Consumes a successful response
+                and returns the result
+            build_form (callable): Builds a fresh multipart body for each attempt
+            **kwargs: Passed on to aiohttp.ClientSession.post
+
+        Returns:
+            The value returned by handle_response
+        """
+        connect_timeout, read_timeout = self.timeouts[endpoint]
+        timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        session = self._get_session()
+
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                if build_form is not None:
+                    kwargs["data"] = build_form()
+                try:
+                    async with self.limiters[endpoint].async_slot() as record:
+                        async with session.post(url, timeout=timeout, **kwargs) as response:
+                            record(response.status)
+                            if response.status not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                                if response.status >= 400:
+                                    body = await response.text()
+                                    raise aiohttp.ClientResponseError(
+                                        response.request_info, response.history,
+                                        status=response.status, message=f"{response.reason}: {body}"
+                                    )
+                                return await handle_response(response)
+                            delay = parse_retry_after(response.headers.get("Retry-After"), self.backoff_max)
+                            if delay is None:
+                                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                            print(f"{endpoint} request returned {response.status}, retrying in {delay:.1f}s")
+                except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as e:
+                    # A streamed body that refused to go on (e.g. over the upload limit) fails for good
+                    if isinstance(e.__cause__, ValueError):
+                        raise e.__cause__
+                    if attempt == self.max_retries:
+                        raise
+                    delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                    print(f"{endpoint} request failed ({e}), retrying in {delay:.1f}s")
+                tracing.current_span().add(retries=1)
+                await asyncio.sleep(delay)
+
+    async def _post_json(self, endpoint, url, data):
+        """POST a JSON body and return the response body as bytes."""
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+        async def handle(response):
+            return await response.read()
+
+        content = await self._post(endpoint, url, handle, data=body, headers={"Content-Type": "application/json"})
+        tracing.current_span().add(bytes_out=len(body), bytes_in=len(content))
+        return content
+
+    async def _fetch(self, endpoint, model, payload, request):
+        """
+        Return the response body of request(), served from the response cache
+        when one is configured and an identical request was answered before.
+
+        Args:
+            endpoint (str): Endpoint name
+            model (str): Model name
+            payload (dict): Request parameters that determine the response
+            request (coroutine function): Sends the request and returns the body of a successful response
+
+        Returns:
+            bytes: Response body
+        """
+        with tracing.span(f"fanar.{endpoint}", kind="api", endpoint=endpoint, model=model, cached=True) as span:
+            async def upstream():
+                span.set(cached=False)
+                return await request()
+
+            if self.response_cache is None:
+                return await upstream()
+            key = self.response_cache.make_key(endpoint, model, payload)
+            return await self.response_cache.fetch_async(key, endpoint, upstream)
+
+    async def fanar_chat(self, messages, model="Fanar", max_tokens=1000):
+        """
+        Send a chat message to the Fanar API and get a response.
+
+        Args:
+            messages (list): List of message dictionaries with 'role' and 'content'
+            model (str): Model to use for chat
+            max_tokens (int): Maximum number of tokens in the response
+        Returns:
+            dict: API-like response with chat reply
+        """
+        url = f"{self.base_url}/chat/completions"
+
+        data = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens
+        }
+
+        async def request():
+            content = await self._post_json("chat", url, data)
+            if not json.loads(content).get('choices'):
+                raise Exception("No choices found in response")
+            return content
+
+        try:
+            result = json.loads(await self._fetch("chat", model, data, request))
+            return {"reply": result['choices'][0]['message']['content']}
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"Chat API request failed: {e}")
+
+    async def transcribe_audio_fanar(self, file_path, model="Fanar-Aura-STT-LF-1"):
+        """
+        Transcribe audio file to text.
+
+        Args:
+            file_path (str): Path to audio file
+            model (str): STT model to use
+
+        Returns:
+            dict: API response with transcription
+        """
+        url = f"{self.base_url}/audio/transcriptions"
+
+        if not os.path.exists(file_path):
+            raise Exception(f"Audio file not found: {file_path}")
+
+        # Speech is transcoded while it uploads; formats without an encoder go as they are
+        file_ext = os.path.splitext(file_path)[1].lower()
+        upload_format = self.stt_upload_format if self.stt_upload_format in UPLOAD_ENCODERS else file_ext
+        mime_type = AUDIO_MIME_TYPES.get(upload_format, 'audio/wav')
+        filename = os.path.splitext(os.path.basename(file_path))[0] + upload_format
+
+        async def upload_body():
+            sent = 0
+            async for chunk in aiter_upload_audio(file_path, upload_format):
+                sent += len(chunk)
+                if self.max_upload_bytes and sent > self.max_upload_bytes:
+                    raise ValueError(
+                        f"Upload exceeds {self.max_upload_bytes} bytes - use chunked transcription "
+                        f"or raise FANAR_MAX_UPLOAD_MB"
+                    )
+                yield chunk
+            tracing.current_span().add(bytes_out=sent)
+
+        def build_form():
+            # A retry needs a fresh form streaming the audio from the start
+            form = aiohttp.MultipartWriter('form-data')
+            form.append(model).set_content_disposition('form-data', name='model')
+            part = form.append(upload_body(), {'Content-Type': mime_type})
+            part.set_content_disposition('form-data', name='file', filename=filename)
+            return form
+
+        async def handle(response):
+            return await response.read()
+
+        async def request():
+            if tracing.enabled():
+                tracing.current_span().add(audio_seconds=wav_seconds(file_path))
+            content = await self._post("transcription", url, handle, build_form=build_form)
+            tracing.current_span().add(bytes_in=len(content))
+            return content
+
+        try:
+            # The audio is identified by its content hash and upload format, only computed when caching
+            payload = None
+            if self.response_cache is not None:
+                payload = {"file": await asyncio.to_thread(hash_file, file_path), "upload": upload_format}
+            return json.loads(await self._fetch("transcription", model, payload, request))
+        except asyncio.TimeoutError:
+            raise Exception("Request timed out - the audio file might be too large or the server is slow")
+        except aiohttp.ClientError as e:
+            raise Exception(f"Transcription API request failed: {e}")
+
+    async def translate_text(self, text, source_lang="en", target_lang="ar", model="Fanar-Shaheen-MT-1"):
+        """
+        Translate text between languages.
+
+        Args:
+            text (str): Text to translate
+            source_lang (str): Source language code
+            target_lang (str): Target language code
+            model (str): Translation model to use
+
+        Returns:
+            str: Translated text
+        """
+        url = f"{self.base_url}/translations"
+
+        data = {
+            "model": model,
+            "text": text,
+            "langpair": f"{source_lang}-{target_lang}",
+            "preprocessing": "default"
+        }
+
+        async def request():
+            content = await self._post_json("translation", url, data)
+            if not json.loads(content).get("text"):
+                raise Exception("No translated text found in response")
+            return content
+
+        try:
+            translated_text = json.loads(await self._fetch("translation", model, data, request)).get("text")
+            if not translated_text:
+                raise Exception("No translated text found in response")
+            return translated_text
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"Translation API request failed: {e}")
+
+    async def text_to_speech(self, text, output_file="output_speech.wav", model="Fanar-Aura-TTS-1", voice="default",
+                             on_samples=None):
+        """
+        Convert text to speech and save as audio file, streamed to disk as it arrives.
+
+        With a response cache, the stored copy is read back from output_file
+        once the stream is complete, so the download itself is never buffered.
+
+        Args:
+            text (str): Text to convert
+            output_file (str): Output audio file path
+            model (str): TTS model to use
+            voice (str): Voice to use
+            on_samples (callable): Optional; called with int16 arrays of shape
+                (frames, channels) as the audio is received
+
+        Returns:
+            str: Path to saved audio file
+        """
+        url = f"{self.base_url}/audio/speech"
+
+        payload = {
+            "model": model,
+            "input": text,
+            "voice": voice
+        }
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        decoder = WavStreamDecoder(on_samples) if on_samples is not None else None
+        streamed = False
+
+        async def handle(response):
+            return await save_response_async(response, output_file, decoder.feed if decoder else None)
+
+        async def request():
+            nonlocal streamed
+            received = await self._post("speech", url, handle, data=body,
+                                        headers={"Content-Type": "application/json"})
+            streamed = True
+            if tracing.enabled():
+                tracing.current_span().add(bytes_out=len(body), bytes_in=received,
+                                           audio_seconds=wav_seconds(output_file))
+            if self.response_cache is None:
+                return None
+            with open(output_file, "rb") as f:
+                return f.read()
+
+        try:
+            audio = await self._fetch("speech", model, payload, request)
+            if audio is not None and not streamed:
+                # Served by the response cache or by another caller's identical request
+                temp_file = f"{output_file}.{os.getpid()}.{id(audio)}.part"
+                with open(temp_file, "wb") as f:
+                    f.write(audio)
+                os.replace(temp_file, output_file)
+                if decoder is not None:
+                    decoder.feed(audio)
+            return os.path.abspath(output_file)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"TTS API request failed: {e}")
@@ -0,0 +1,272 @@
+"""
+Decode-once, memory-mapped access to the pipeline's audio files.
+
+Every stage used to read whole WAV files into fresh byte strings (or decode
+them again with pydub) just to look at their samples or their length. The
+PCM data of a 16-bit WAV already is an int16 array on disk, so AudioStore
+maps it read-only and hands out zero-copy views of frame ranges; only the
+ranges a stage converts to float32 are copied. Anything that is not 16-bit
+PCM WAV is decoded with ffmpeg into one in a temporary directory owned by
+the store, mapped from there, and deleted once no stage uses it. Duration,
+sample rate and channel count are answered from the header without
+touching the samples.
+"""
+
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import uuid
+import weakref
+
+import numpy as np
+
+
+DECODED_SUFFIX = ".pcm.wav"
+
+# WAVE_FORMAT_PCM and WAVE_FORMAT_EXTENSIBLE
+_PCM_FORMATS = (1, 0xFFFE)
+
+
+def read_wav_header(audio_file):
+    """
+    Parse the RIFF header of a WAV file.
+
+    Returns:
+        dict: format, channels, sample_rate, bits, data_offset, data_bytes and frames,
+            or None if the file is not a WAV file
+    """
+    try:
+        with open(audio_file, "rb") as f:
+            riff = f.read(12)
+            if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+                return None
+            file_size = os.fstat(f.fileno()).st_size
+            header = None
+            while True:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    return None
+                chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+                if chunk_id == b"fmt ":
+                    fmt = f.read(size)
+                    audio_format, channels, sample_rate = struct.unpack("<HHI", fmt[:8])
+                    bits = struct.unpack("<H", fmt[14:16])[0]
+                    header = {"format": audio_format, "channels": channels, "sample_rate": sample_rate, "bits": bits}
+                    f.seek(size % 2, os.SEEK_CUR)
+                elif chunk_id == b"data":
+                    if header is None:
+                        return None
+                    offset = f.tell()
+                    # Streamed writers leave the size unset (0 or 0xFFFFFFFF): use what is on disk
+                    available = file_size - offset
+                    data_bytes = size if 0 < size <= available else available
+                    frame_bytes = header["channels"] * header["bits"] // 8
+                    header.update(data_offset=offset, data_bytes=data_bytes,
+                                  frames=data_bytes // frame_bytes if frame_bytes else 0)
+                    return header
+                else:
+                    f.seek(size + size % 2, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+
+def is_pcm16(header):
+    return header is not None and header["format"] in _PCM_FORMATS and header["bits"] == 16
+
+
+class AudioBuffer:
+    """Read-only int16 samples of a 16-bit PCM WAV file, mapped from disk."""
+
+    def __init__(self, path, header):
+        self.path = path
+        self.sample_rate = header["sample_rate"]
+        self.channels = header["channels"]
+        self.frames = header["frames"]
+        if self.frames:
+            self.pcm = np.memmap(path, dtype=np.int16, mode="r", offset=header["data_offset"],
+                                 shape=(self.frames, self.channels))
+        else:
+            self.pcm = np.zeros((0, self.channels), dtype=np.int16)
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    def view(self, start=0, end=None):
+        """Zero-copy int16 view of frames [start, end), shape (frames, channels)."""
+        return self.pcm[start:end]
+
+    def blocks(self, block_frames):
+        """Yield consecutive zero-copy views of block_frames frames; the last may be shorter."""
+        for start in range(0, self.frames, block_frames):
+            yield self.pcm[start:start + block_frames]
+
+    def float32(self, start=0, end=None):
+        """Frames [start, end) as float32 in [-1, 1), shape (frames, channels)."""
+        return self.pcm[start:end].astype(np.float32) / 32768.0
+
+    def mono(self, start=0, end=None):
+        """Frames [start, end) downmixed to mono float32."""
+        pcm = self.pcm[start:end]
+        if self.channels == 1:
+            return pcm[:, 0].astype(np.float32) / 32768.0
+        return pcm.mean(axis=1, dtype=np.float32) / 32768.0
+
+
+class WavStreamDecoder:
+    """
+    Decode 16-bit PCM WAV bytes into int16 sample blocks as they arrive.
+
+    Feed it the chunks of a download; once the header has been seen, every
+    whole frame received is passed to on_samples as an array of shape
+    (frames, channels). Only the header and a partial frame are buffered.
+    """
+
+    def __init__(self, on_samples):
+        self.on_samples = on_samples
+        self.header = None
+        self._pending = b""
+
+    def feed(self, chunk):
+        data = self._pending + chunk
+        if self.header is None:
+            self.header, data = self._parse_header(data)
+            if self.header is None:
+                self._pending = data
+                return
+        frame_bytes = self.header["channels"] * 2
+        whole = len(data) - len(data) % frame_bytes
+        self._pending = data[whole:]
+        if whole:
+            self.on_samples(np.frombuffer(data[:whole], dtype=np.int16).reshape(-1, self.header["channels"]))
+
+    @staticmethod
+    def _parse_header(data):
+        """Return (header, bytes after the data chunk header), or (None, data) until it is complete."""
+        if len(data) < 12:
+            return None, data
+        if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+            raise ValueError("Not a WAV stream")
+        position, header = 12, None
+        while position + 8 <= len(data):
+            chunk_id, size = data[position:position + 4], struct.unpack("<I", data[position + 4:position + 8])[0]
+            position += 8
+            if chunk_id == b"data":
+                if not is_pcm16(header):
+                    raise ValueError("Only 16-bit PCM WAV streams can be decoded incrementally")
+                return header, data[position:]
+            if position + size > len(data):
+                break
+            if chunk_id == b"fmt ":
+                audio_format, channels, sample_rate = struct.unpack("<HHI", data[position:position + 8])
+                bits = struct.unpack("<H", data[position + 14:position + 16])[0]
+                header = {"format": audio_format, "channels": channels, "sample_rate": sample_rate, "bits": bits}
+            position += size + size % 2
+        return None, data
+
+
+class AudioStore:
+    """
+    Process-wide registry of mapped audio buffers, keyed by file identity.
+
+    Buffers are held weakly: stages opening the same file at the same time
+    share one mapping, and a mapping is released as soon as no stage uses
+    it, so deleting a temporary file frees its disk space. Decoded copies
+    live in the store's own temporary directory and are deleted when their
+    buffer is released, so they never outlive the job that needed them.
+    """
+
+    def __init__(self, temp_dir=None):
+        """
+        Args:
+            temp_dir (str): Directory for decoded copies, or None for a new
+                temporary directory removed when the store is
+        """
+        self._buffers = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._temp_dir = temp_dir
+
+    def _decoded_dir(self):
+        with self._lock:
+            if self._temp_dir is None:
+                self._temp_dir = tempfile.mkdtemp(prefix="audio-store-")
+                weakref.finalize(self, shutil.rmtree, self._temp_dir, ignore_errors=True)
+            else:
+                os.makedirs(self._temp_dir, exist_ok=True)
+            return self._temp_dir
+
+    def open(self, audio_file, sample_rate=None, channels=None):
+        """
+        Return the samples of an audio file as an AudioBuffer.
+
+        A 16-bit PCM WAV already at the requested rate and channel count is
+        mapped as it is. Anything else is decoded (and resampled) with ffmpeg
+        into a WAV in the store's temporary directory, which calls made while
+        the buffer is in use share and which is deleted when it is released.
+
+        Args:
+            audio_file (str): Path to any audio file ffmpeg can read
+            sample_rate (int): Required sample rate, or None to keep the source's
+            channels (int): Required channel count, or None to keep the source's
+
+        Returns:
+            AudioBuffer: Mapped samples
+        """
+        stat = os.stat(audio_file)
+        key = (os.path.abspath(audio_file), stat.st_size, stat.st_mtime_ns, sample_rate, channels)
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is not None:
+                return buffer
+
+        header = read_wav_header(audio_file)
+        native = (
+            is_pcm16(header)
+            and sample_rate in (None, header["sample_rate"])
+            and channels in (None, header["channels"])
+        )
+        buffer = AudioBuffer(audio_file, header) if native else self._decode(audio_file, sample_rate, channels)
+
+        with self._lock:
+            return self._buffers.setdefault(key, buffer)
+
+    def _decode(self, audio_file, sample_rate, channels):
+        suffix = "".join(f".{value}{unit}" for value, unit in ((sample_rate, "hz"), (channels, "ch")) if value)
+        # Unique per decode: a concurrent decode of the same file must not
+        # delete this copy when its own buffer is dropped
+        decoded_file = os.path.join(
+            self._decoded_dir(), f"{os.path.basename(audio_file)}.{uuid.uuid4().hex[:12]}{suffix}{DECODED_SUFFIX}"
+        )
+        command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-i', audio_file, '-c:a', 'pcm_s16le']
+        if sample_rate:
+            command += ['-ar', str(sample_rate)]
+        if channels:
+            command += ['-ac', str(channels)]
+        process = subprocess.run(command + [decoded_file], stdin=subprocess.DEVNULL,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            _remove(decoded_file)
+            raise Exception(f"FFMPEG error: {process.stderr.decode(errors='replace')}")
+        buffer = AudioBuffer(decoded_file, read_wav_header(decoded_file))
+        # Unlinking a mapped file is safe: the data stays readable through
+        # any views still held, and the space is freed once they are gone
+        weakref.finalize(buffer, _remove, decoded_file)
+        return buffer
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+store = AudioStore()
+
+
+def open_audio(audio_file, sample_rate=None, channels=None):
+    """Return the samples of audio_file from the process-wide store (see AudioStore.open)."""
+    return store.open(audio_file, sample_rate, channels)
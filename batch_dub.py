@@ -0,0 +1,328 @@
+"""
+Headless batch dubbing of a manifest of videos.
+
+    python batch_dub.py manifest.txt --jobs 2 --output-dir dubbed
+
+The manifest lists one YouTube URL or video file path per line; blank lines
+and lines starting with # are ignored. Every entry runs the same pipeline as
+the Streamlit app, in a pool of worker processes, inside its own workspace
+under --work-dir named after a hash of the entry.
+
+Each workspace holds a checkpoint journal (journal.jsonl) recording every
+stage as it starts and completes. Running the same manifest again skips
+entries whose journal ends in "completed" with the same output options
+(see OUTPUT_OPTIONS) and resumes or redoes the others: stages
+that already completed are restored from the stage cache, so a crashed or
+killed run continues at the first stage that did not finish.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+import tracing
+from dubbing_utils import FanarAPIClient
+from dubbing_pipeline import (
+    run_dubbing_job, dub_suffix, AUTO_MODEL, CHUNKED_MODE, TTS_SENTENCES, TTS_WHOLE, DEFAULT_TARGET_LANGUAGES
+)
+from job_manager import Job, JobWorkspace
+from stage_cache import StageCache, DEFAULT_CACHE_DIR
+from response_cache import ResponseCache, DEFAULT_CACHE_PATH
+from rate_limiter import configured_rate_limits
+from demucs_service import SeparationService, demucs_available
+from time_stretch import DEFAULT_MAX_RATIO
+from media_ingest import probe_media, has_stream
+from youtube_utils import YouTubeDownload, DEFAULT_DOWNLOAD_DIR, get_video_title, sanitize_filename, prune_downloads
+
+
+DEFAULT_WORK_DIR = "batch_jobs"
+DEFAULT_OUTPUT_DIR = "dubbed"
+JOURNAL_FILE = "journal.jsonl"
+
+TRANSCRIPTION_MODES = {
+    "auto": AUTO_MODEL,
+    "chunked": CHUNKED_MODE,
+    "short": "Fanar-Aura-STT-1",
+    "long": "Fanar-Aura-STT-LF-1",
+}
+TTS_MODES = {"sentences": TTS_SENTENCES, "whole": TTS_WHOLE}
+
+# Options that change the dubbed video; a completed entry is only skipped if they match
+OUTPUT_OPTIONS = ("transcription_model", "tts_mode", "max_stretch", "languages", "detect_music")
+
+
+class JournaledJob(Job):
+    """Job that appends every stage transition and message to a checkpoint journal."""
+
+    def __init__(self, job_id, workspace):
+        super().__init__(job_id, workspace)
+        self.journal_file = workspace.path(JOURNAL_FILE)
+
+    def record(self, event, **fields):
+        """Append one event to the journal; each line is flushed before returning."""
+        entry = {"time": time.time(), "event": event, **fields}
+        with open(self.journal_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def set_stage(self, stage):
+        previous = self.stage
+        super().set_stage(stage)
+        if previous:
+            self.record("stage_completed", stage=previous)
+        if stage:
+            self.record("stage_started", stage=stage)
+
+    def begin_stage(self, stage):
+        super().begin_stage(stage)
+        self.record("stage_started", stage=stage)
+
+    def end_stage(self, stage):
+        super().end_stage(stage)
+        self.record("stage_completed", stage=stage)
+
+    def log(self, level, message):
+        super().log(level, message)
+        self.record("message", level=level, message=message)
+
+
+def read_journal(journal_file):
+    """Return the events of a checkpoint journal, ignoring a truncated last line."""
+    events = []
+    if os.path.exists(journal_file):
+        with open(journal_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+    return events
+
+
+def options_hash(options):
+    """Hash of the OUTPUT_OPTIONS of a batch, recorded in the journal of every entry."""
+    payload = json.dumps({name: options[name] for name in OUTPUT_OPTIONS}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def read_manifest(manifest_file):
+    """Return the unique entries of a manifest file in order."""
+    entries = []
+    with open(manifest_file, encoding="utf-8") as f:
+        for line in f:
+            entry = line.strip()
+            if entry and not entry.startswith("#") and entry not in entries:
+                entries.append(entry)
+    return entries
+
+
+def is_youtube_url(source):
+    return source.startswith(("http://", "https://")) and ("youtube.com" in source or "youtu.be" in source)
+
+
+# Per-process resources, created once by _init_worker
+_worker = {}
+
+
+def _init_worker(options):
+    load_dotenv()
+    api_key = os.getenv("FANAR_API_KEY") or os.getenv("ALTERNATE_API_KEY")
+
+    # Rate limiters are shared within a process only: split the quota between the workers
+    jobs = options["jobs"]
+    rate_limits = {
+        endpoint: (rate / jobs, max(1, burst // jobs))
+        for endpoint, (rate, burst) in configured_rate_limits().items()
+    }
+    response_cache = None
+    if os.getenv("FANAR_RESPONSE_CACHE", "").lower() in ("1", "true", "yes"):
+        response_cache = ResponseCache(
+            os.getenv("FANAR_RESPONSE_CACHE_PATH", DEFAULT_CACHE_PATH),
+            max_bytes=int(float(os.getenv("FANAR_RESPONSE_CACHE_MAX_MB", "512")) * 1024 ** 2)
+        )
+    _worker["client"] = FanarAPIClient(
+        api_key,
+        max_retries=int(os.getenv("FANAR_MAX_RETRIES", "3")),
+        response_cache=response_cache,
+        rate_limits=rate_limits
+    )
+    tracing.set_enabled(options["trace"])
+    _worker["stage_cache"] = StageCache(options["cache_dir"])
+    _worker["separator"] = None
+    if options["demucs_workers"] and demucs_available():
+        _worker["separator"] = SeparationService(workers=options["demucs_workers"])
+
+
+def dub_entry(source, options):
+    """
+    Dub one manifest entry in a worker process, resuming from its journal.
+
+    Args:
+        source (str): YouTube URL or video file path
+        options (dict): Batch options from parse_args
+
+    Returns:
+        dict: source, job_id, status ("completed", "skipped" or "failed"), output, error, seconds,
+            the critical path of the stages, and per-stage timings when tracing is enabled
+    """
+    started = time.time()
+    job_id = hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+    job = JournaledJob(job_id, JobWorkspace(os.path.join(options["work_dir"], job_id)))
+    result = {"source": source, "job_id": job_id, "status": "failed", "output": None, "error": None}
+
+    events = read_journal(job.journal_file)
+    options_key = options_hash(options)
+    if (events and events[-1]["event"] == "completed" and events[-1].get("options_hash") == options_key
+            and os.path.exists(events[-1]["output"])):
+        result.update(status="skipped", output=events[-1]["output"], seconds=0.0)
+        return result
+    job.record("started", source=source, resumed=bool(events), options_hash=options_key)
+
+    try:
+        with job.traced():
+            source_audio_path = video_ready = None
+            if is_youtube_url(source):
+                # Audio first; the video downloads while the pipeline runs. Downloads
+                # finished by an earlier attempt or another entry are reused.
+                job.set_stage("Audio download")
+                download = YouTubeDownload(source, cache_dir=options["download_dir"],
+                                           log=lambda message: job.log("info", message))
+                source_audio_path = download.download_audio()
+                input_video_path = download.video_path
+                video_ready = download.wait_video
+                title = download.metadata["title"]
+            else:
+                input_video_path = os.path.abspath(source)
+                if not os.path.exists(input_video_path):
+                    raise FileNotFoundError(f"Video file not found: {source}")
+                # Header-only probe: fail early instead of after queueing for extraction
+                if not has_stream(probe_media(input_video_path), "audio"):
+                    raise ValueError(f"Video has no audio track: {source}")
+                title = get_video_title(input_video_path)
+
+            final_video_filename = f"{sanitize_filename(title)} - {dub_suffix(options['languages'])}.mp4"
+            output_file = run_dubbing_job(
+                job,
+                _worker["client"],
+                _worker["stage_cache"],
+                input_video_path,
+                final_video_filename,
+                transcription_model=options["transcription_model"],
+                tts_mode=options["tts_mode"],
+                max_stretch=options["max_stretch"],
+                separator=_worker["separator"],
+                detect_music=options["detect_music"],
+                stage_workers=options["stage_workers"],
+                source_audio_path=source_audio_path,
+                video_ready=video_ready,
+                auto_cleanup=not options["keep_files"],
+                target_languages=options["languages"]
+            )
+
+            os.makedirs(options["output_dir"], exist_ok=True)
+            destination = os.path.join(options["output_dir"], final_video_filename)
+            if os.path.exists(destination):
+                # Different videos can share a title
+                destination = os.path.join(options["output_dir"], f"{os.path.splitext(final_video_filename)[0]} ({job_id}).mp4")
+            shutil.move(output_file, destination)
+
+        job.record("completed", output=os.path.abspath(destination), options_hash=options_key)
+        result.update(status="completed", output=os.path.abspath(destination))
+    except Exception as e:
+        job.record("failed", stage=job.stage, error=str(e))
+        result["error"] = str(e)
+
+    if "timings" in job.outputs:
+        result["timings"] = job.outputs["timings"]
+    if "critical_path" in job.outputs:
+        result["critical_path"] = job.outputs["critical_path"]
+    result["seconds"] = round(time.time() - started, 1)
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Dub a manifest of YouTube URLs or video files into Arabic (or --languages).")
+    parser.add_argument("manifest", help="file with one YouTube URL or video path per line")
+    parser.add_argument("--jobs", type=int, default=2, help="videos processed in parallel (worker processes)")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="directory for the dubbed videos")
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="directory for job workspaces and journals")
+    parser.add_argument("--download-dir", default=os.getenv("YOUTUBE_CACHE_DIR", DEFAULT_DOWNLOAD_DIR),
+                        help="YouTube downloads and metadata, kept per video ID and reused")
+    parser.add_argument("--cache-dir", default=os.getenv("STAGE_CACHE_DIR", DEFAULT_CACHE_DIR),
+                        help="stage cache shared by all jobs; completed stages are resumed from it")
+    parser.add_argument("--transcription", choices=sorted(TRANSCRIPTION_MODES), default="auto")
+    parser.add_argument("--tts", choices=sorted(TTS_MODES), default="sentences")
+    parser.add_argument("--max-stretch", type=float, default=DEFAULT_MAX_RATIO)
+    parser.add_argument("--languages", default=",".join(DEFAULT_TARGET_LANGUAGES),
+                        help="comma-separated language codes to dub into, one audio track each (e.g. ar,fr)")
+    parser.add_argument("--stt-workers", type=int, help="concurrent transcription requests per video")
+    parser.add_argument("--text-workers", type=int, help="concurrent chat/translation requests per video")
+    parser.add_argument("--tts-workers", type=int, help="concurrent TTS requests per video")
+    parser.add_argument("--demucs-workers", type=int, default=0,
+                        help="warm Demucs worker processes per job process (0 runs the Demucs CLI)")
+    parser.add_argument("--no-music-detection", action="store_true", help="always run music separation")
+    parser.add_argument("--keep-files", action="store_true", help="keep intermediate files in the workspaces")
+    parser.add_argument("--results", help="write the per-video results as JSON to this file")
+    parser.add_argument("--trace", action="store_true", default=tracing.enabled(),
+                        help="record per-stage timings into the results and a trace.json in each workspace")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Checked here: a missing key raised in the worker initializer breaks the whole pool
+    load_dotenv()
+    if not (os.getenv("FANAR_API_KEY") or os.getenv("ALTERNATE_API_KEY")):
+        print("FANAR_API_KEY is not set (in the environment or .env)", file=sys.stderr)
+        return 2
+    entries = read_manifest(args.manifest)
+    stage_workers = {
+        stage: count for stage, count in
+        (("transcription", args.stt_workers), ("text", args.text_workers), ("tts", args.tts_workers))
+        if count
+    }
+    options = {
+        "jobs": max(1, args.jobs),
+        "output_dir": args.output_dir,
+        "work_dir": args.work_dir,
+        "download_dir": args.download_dir,
+        "cache_dir": args.cache_dir,
+        "transcription_model": TRANSCRIPTION_MODES[args.transcription],
+        "tts_mode": TTS_MODES[args.tts],
+        "max_stretch": args.max_stretch,
+        "languages": [code.strip() for code in args.languages.split(",") if code.strip()],
+        "stage_workers": stage_workers,
+        "demucs_workers": args.demucs_workers,
+        "detect_music": not args.no_music_detection,
+        "keep_files": args.keep_files,
+        "trace": args.trace,
+    }
+    print(f"Dubbing {len(entries)} video(s) with {options['jobs']} worker process(es)")
+    prune_downloads(options["download_dir"])
+
+    results = []
+    with ProcessPoolExecutor(max_workers=options["jobs"], initializer=_init_worker, initargs=(options,)) as executor:
+        futures = {executor.submit(dub_entry, source, options): source for source in entries}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            detail = result["output"] if result["status"] != "failed" else result["error"]
+            print(f"[{len(results)}/{len(entries)}] {result['status']}: {result['source']} -> {detail}")
+
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    failed = sum(1 for result in results if result["status"] == "failed")
+    print(f"Done: {len(results) - failed} succeeded, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
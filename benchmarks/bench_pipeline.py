@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark of the dubbing pipeline and its heavy stages.
+
+Runs on synthetic videos (benchmarks/make_test_video.py) against a local
+mock Fanar server (benchmarks/mock_fanar.py), so no API quota or network is
+used. Each case runs in its own process so its peak memory is measured in
+isolation:
+
+    extract   extract_audio_from_video
+    separate  music separation (warm Demucs workers, or the Demucs CLI)
+    mix       mix_music_and_tts on the extracted audio and a synthetic voice track
+    combine   combine_audio_video
+    pipeline  run_dubbing_job end to end, with per-stage timings and API latencies
+    fanout    per-sentence translation and TTS for the video's length, through
+              FanarAPIClient on a thread pool and AsyncFanarAPIClient with asyncio.gather
+
+Results are written as JSON and can be compared with an earlier run.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--minutes 1 10 60] [--cases extract mix pipeline]
+        [--repeats 3] [--latency 0.2] [--error-rate 0.02] [--output results.json] [--compare old.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from make_test_video import make_test_video, DEFAULT_VIDEO_DIR
+from mock_fanar import MockFanarServer
+
+
+CASES = ("extract", "separate", "mix", "combine", "pipeline", "fanout")
+SECONDS_PER_SENTENCE = 4
+DEFAULT_MINUTES = (1.0, 10.0, 60.0)
+
+
+def percentiles(values):
+    """min, p50, p90, p99, mean and max of a list of numbers, rounded."""
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return {}
+    summary = {"min": values.min(), "p50": np.percentile(values, 50), "p90": np.percentile(values, 90),
+               "p99": np.percentile(values, 99), "mean": values.mean(), "max": values.max()}
+    return {name: round(float(value), 4) for name, value in summary.items()}
+
+
+def _synthetic_voice(seconds, output_file, sample_rate=22050):
+    """Voice track the length of the video, standing in for the TTS output."""
+    from dubbing_utils import save_wav
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    voice = np.sin(2 * np.pi * (170 + 20 * np.sin(2 * np.pi * 0.4 * t)) * t)
+    envelope = np.clip(np.sin(2 * np.pi * 3 * t), 0, None) * (np.mod(t, 10) < 7)
+    save_wav(0.3 * voice * envelope, sample_rate, output_file)
+
+
+def run_case(case, video, repeats, options):
+    """
+    Run one case in this process and return its measurements.
+
+    Returns:
+        dict: wall_s percentiles plus case-specific details; "skipped" when the
+            case cannot run here
+    """
+    work_dir = tempfile.mkdtemp(prefix=f"bench_{case}_")
+    try:
+        return _run_case(case, video, repeats, options, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _run_case(case, video, repeats, options, work_dir):
+    from dubbing_utils import extract_audio_from_video, mix_music_and_tts, combine_audio_video, get_audio_duration
+
+    audio_file = os.path.join(work_dir, "audio.wav")
+    result = {}
+    timings = []
+
+    def timed(fn):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    if case == "extract":
+        for _ in range(repeats):
+            timed(lambda: extract_audio_from_video(video, audio_file))
+
+    elif case == "separate":
+        from demucs_service import SeparationService, demucs_available
+        if not demucs_available():
+            return {"skipped": "Demucs is not installed"}
+        extract_audio_from_video(video, audio_file)
+        if options["demucs_workers"]:
+            service = SeparationService(workers=options["demucs_workers"])
+            service.warm_up()
+            for _ in range(repeats):
+                timed(lambda: service.separate_file(audio_file, os.path.join(work_dir, "music.wav")))
+            service.close()
+        else:
+            from dubbing_utils import separate_music_with_demucs
+            for i in range(repeats):
+                timed(lambda: separate_music_with_demucs(audio_file, os.path.join(work_dir, f"demucs_{i}")))
+
+    elif case == "mix":
+        extract_audio_from_video(video, audio_file)
+        duration = get_audio_duration(audio_file)
+        voice_file = os.path.join(work_dir, "voice.wav")
+        _synthetic_voice(duration, voice_file)
+        for _ in range(repeats):
+            timed(lambda: mix_music_and_tts(audio_file, voice_file, os.path.join(work_dir, "mixed.wav"),
+                                            duration=duration))
+
+    elif case == "combine":
+        extract_audio_from_video(video, audio_file)
+        for _ in range(repeats):
+            timed(lambda: combine_audio_video(audio_file, video, os.path.join(work_dir, "combined.mp4")))
+
+    elif case == "pipeline":
+        result.update(_run_pipeline(video, repeats, options, work_dir, timings))
+
+    elif case == "fanout":
+        result.update(_run_fanout(video, repeats, options, work_dir, timings))
+
+    result["wall_s"] = percentiles(timings)
+    return result
+
+
+def _run_pipeline(video, repeats, options, work_dir, timings):
+    import tracing
+    from dubbing_utils import FanarAPIClient
+    from dubbing_pipeline import run_dubbing_job, AUTO_MODEL, CHUNKED_MODE
+    from job_manager import Job, JobWorkspace
+    from stage_cache import StageCache
+
+    tracing.set_enabled(True)
+    client = FanarAPIClient("benchmark", base_url=options["base_url"], backoff_base=0.05, backoff_max=1.0)
+    transcription_model = CHUNKED_MODE if options["transcription"] == "chunked" else AUTO_MODEL
+    latencies = {}
+    stages = critical_path = None
+    for i in range(repeats):
+        # A fresh stage cache per run, so nothing is restored from the previous one
+        job = Job(f"bench{i}", JobWorkspace(os.path.join(work_dir, f"job{i}")))
+        stage_cache = StageCache(os.path.join(work_dir, f"cache{i}"))
+        start = time.perf_counter()
+        with job.traced() as trace:
+            run_dubbing_job(job, client, stage_cache, video, "dubbed.mp4",
+                            transcription_model=transcription_model)
+        timings.append(time.perf_counter() - start)
+        stages = trace.stage_breakdown()
+        critical_path = job.outputs.get("critical_path")
+        for span in trace.spans:
+            if span.kind == "api" and not span.attrs.get("cached"):
+                latencies.setdefault(span.attrs["endpoint"], []).append(span.wall)
+    return {
+        "stages": stages,
+        "critical_path": critical_path,
+        "api_latency_s": {endpoint: {"count": len(values), **percentiles(values)}
+                          for endpoint, values in sorted(latencies.items())},
+    }
+
+
+def _run_fanout(video, repeats, options, work_dir, timings):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from async_fanar_client import AsyncFanarAPIClient
+    from dubbing_utils import FanarAPIClient
+    from media_ingest import probe_media
+
+    duration = probe_media(video)["duration"] or 60.0
+    count = max(int(duration / SECONDS_PER_SENTENCE), 1)
+    sentences = [f"Sentence {i} of the synthetic transcript." for i in range(count)]
+    workers = options["fanout_workers"]
+
+    def dub_sentence(client, i, sentence):
+        text = client.translate_text(sentence, "en", "ar")
+        client.text_to_speech(text, os.path.join(work_dir, f"threaded_{i:04d}.wav"))
+
+    def threaded():
+        client = FanarAPIClient("benchmark", base_url=options["base_url"], pool_size=workers,
+                                backoff_base=0.05, backoff_max=1.0)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda args: dub_sentence(client, *args), enumerate(sentences)))
+
+    async def dub_sentence_async(client, i, sentence):
+        text = await client.translate_text(sentence, "en", "ar")
+        await client.text_to_speech(text, os.path.join(work_dir, f"async_{i:04d}.wav"))
+
+    async def gathered():
+        async with AsyncFanarAPIClient("benchmark", max_in_flight=workers, base_url=options["base_url"],
+                                       backoff_base=0.05, backoff_max=1.0) as client:
+            await asyncio.gather(*(dub_sentence_async(client, i, s) for i, s in enumerate(sentences)))
+
+    threaded_timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        threaded()
+        threaded_timings.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        asyncio.run(gathered())
+        timings.append(time.perf_counter() - start)
+    return {"sentences": len(sentences), "workers": workers, "threaded_wall_s": percentiles(threaded_timings)}
+
+
+def _case_main(args):
+    """Entry point of the per-case child process: prints one JSON result."""
+    options = json.loads(args.case_options)
+    try:
+        result = run_case(args.case, args.video, args.repeats, options)
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    # Peak RSS of this process and of the largest child (ffmpeg, Demucs), in kilobytes on Linux.
+    # A child's figure can include pages inherited from this process before exec.
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    result["peak_child_rss_mb"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    print(json.dumps(result))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline_file):
+    """Print the p50 wall time change of every case present in both runs."""
+    with open(baseline_file, encoding="utf-8") as f:
+        baseline = {(r["case"], r["minutes"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_file}:")
+    for r in results:
+        old = baseline.get((r["case"], r["minutes"]))
+        if not old or not old.get("wall_s") or not r.get("wall_s"):
+            continue
+        before, after = old["wall_s"]["p50"], r["wall_s"]["p50"]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"  {r['case']:<9} {r['minutes']:>5g} min: {before:9.2f}s -> {after:9.2f}s ({change:+.1f}%)"
+              f"  peak RSS {old.get('peak_rss_mb')} -> {r.get('peak_rss_mb')} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=list(DEFAULT_MINUTES), help="Video lengths")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per stage case")
+    parser.add_argument("--pipeline-repeats", type=int, default=1, help="Runs per pipeline case")
+    parser.add_argument("--transcription", choices=("auto", "chunked"), default="chunked")
+    parser.add_argument("--demucs-workers", type=int, default=0, help="Warm Demucs workers (0 runs the CLI)")
+    parser.add_argument("--fanout-workers", type=int, default=32, help="Concurrent requests in the fanout case")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock API latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Mock API jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock API requests that fail")
+    parser.add_argument("--video-dir", default=DEFAULT_VIDEO_DIR, help="Cache of generated test videos")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    # Internal: run a single case in a child process
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--video", help=argparse.SUPPRESS)
+    parser.add_argument("--case-options", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        _case_main(args)
+        return
+
+    from demucs_service import demucs_available
+    server = MockFanarServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate).start()
+    options = {"base_url": server.url, "transcription": args.transcription, "demucs_workers": args.demucs_workers,
+               "fanout_workers": args.fanout_workers}
+    results = []
+    try:
+        for minutes in args.minutes:
+            for case in args.cases:
+                # Without Demucs the pipeline runs on a voice-only video, so music detection skips separation
+                music = case != "pipeline" or demucs_available()
+                video = make_test_video(minutes * 60, music=music, output_dir=args.video_dir)
+                repeats = args.pipeline_repeats if case == "pipeline" else args.repeats
+                command = [sys.executable, os.path.abspath(__file__), "--case", case, "--video", video,
+                           "--repeats", str(repeats), "--case-options", json.dumps(options)]
+                process = subprocess.run(command, capture_output=True, text=True)
+                try:
+                    result = json.loads(process.stdout.strip().splitlines()[-1])
+                except (IndexError, json.JSONDecodeError):
+                    result = {"error": process.stderr.strip()[-2000:] or f"exit code {process.returncode}"}
+
+                media_seconds = minutes * 60
+                result = {"case": case, "minutes": minutes, "media_seconds": media_seconds, "repeats": repeats,
+                          **result}
+                if result.get("wall_s"):
+                    result["throughput_x_realtime"] = round(media_seconds / result["wall_s"]["p50"], 2)
+                results.append(result)
+
+                if "wall_s" in result:
+                    print(f"{case:<9} {minutes:>5g} min: p50 {result['wall_s']['p50']:9.2f}s "
+                          f"({result['throughput_x_realtime']}x real time), peak RSS {result['peak_rss_mb']} MB, "
+                          f"child {result['peak_child_rss_mb']} MB")
+                else:
+                    print(f"{case:<9} {minutes:>5g} min: {result.get('skipped') or result.get('error')}")
+    finally:
+        mock_stats = server.stats()
+        server.stop()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "mock": {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate, **mock_stats},
+            "transcription": args.transcription,
+            "demucs_workers": args.demucs_workers,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
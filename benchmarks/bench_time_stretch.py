@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for time_stretch: stretches one minute of synthetic
+speech-like audio by several factors and reports the real-time factor.
+
+Usage:
+    python benchmarks/bench_time_stretch.py [--seconds 60] [--sample-rate 22050] [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from time_stretch import time_stretch
+
+
+def synthetic_speech(seconds, sample_rate):
+    """Harmonic signal with a gliding pitch and syllable-rate amplitude envelope."""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    f0 = 140 + 40 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 10))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 2
+    return (0.3 * voiced * envelope).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=60.0, help="Duration of the test signal")
+    parser.add_argument("--sample-rate", type=int, default=22050, help="Sample rate in Hz")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per factor; the fastest is reported")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    samples = synthetic_speech(args.seconds, args.sample_rate)
+    results = []
+    for factor in (0.75, 0.9, 1.1, 1.3):
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            time_stretch(samples, factor, args.sample_rate)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        results.append({
+            "factor": factor,
+            "audio_seconds": args.seconds,
+            "sample_rate": args.sample_rate,
+            "wall_seconds": round(best, 4),
+            "realtime_factor": round(args.seconds / best, 1),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(f"factor {r['factor']:.2f}: {r['wall_seconds'] * 1000:8.1f} ms "
+                  f"for {r['audio_seconds']:.0f}s audio ({r['realtime_factor']}x real time)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic test videos with ffmpeg's lavfi sources.
+
+The video is a small moving test pattern; the audio is speech-like (a
+gliding harmonic voice in syllable bursts, with pauses between phrases),
+optionally over a steady chord standing in for background music. Videos
+are cached by their parameters, so benchmarks only generate each length
+once.
+
+Usage:
+    python benchmarks/make_test_video.py --minutes 10 [--no-music] [--output-dir benchmarks/.videos]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dubbing_utils import run_ffmpeg
+
+
+DEFAULT_VIDEO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".videos")
+
+# Voice: pitch glides around 150 Hz, 4 syllables per second, a 1.5 s pause every 8 s
+VOICE_EXPR = ("0.25*(sin(2*PI*(150+30*sin(2*PI*0.3*t))*t)+0.5*sin(4*PI*(150+30*sin(2*PI*0.3*t))*t))"
+              "*pow(max(sin(2*PI*4*t),0),2)*lt(mod(t,8),6.5)")
+# Music: A minor chord, always on
+MUSIC_EXPR = "0.05*(sin(2*PI*220*t)+sin(2*PI*261.6*t)+sin(2*PI*329.6*t))"
+
+
+def test_video_path(seconds, music=True, width=320, height=240, output_dir=DEFAULT_VIDEO_DIR):
+    name = f"synthetic_{seconds:g}s_{width}x{height}{'_music' if music else ''}.mp4"
+    return os.path.join(output_dir, name)
+
+
+def make_test_video(seconds, music=True, width=320, height=240, fps=15, output_dir=DEFAULT_VIDEO_DIR):
+    """
+    Create (or reuse) a synthetic H.264/AAC test video.
+
+    Args:
+        seconds (float): Duration
+        music (bool): Mix a background chord under the voice
+        width (int): Frame width
+        height (int): Frame height
+        fps (int): Frame rate
+        output_dir (str): Directory caching the generated videos
+
+    Returns:
+        str: Path to the video
+    """
+    output_file = test_video_path(seconds, music, width, height, output_dir)
+    if os.path.exists(output_file):
+        return output_file
+    os.makedirs(output_dir, exist_ok=True)
+
+    expression = f"{VOICE_EXPR}+{MUSIC_EXPR}" if music else VOICE_EXPR
+    temp_file = f"{output_file}.{os.getpid()}.tmp.mp4"
+    run_ffmpeg([
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={fps}:duration={seconds}',
+        '-f', 'lavfi', '-i', f"aevalsrc='{expression}|{expression}':s=44100:d={seconds}",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '35', '-g', str(fps * 10),
+        '-c:a', 'aac', '-b:a', '96k',
+        '-shortest', temp_file
+    ])
+    os.replace(temp_file, output_file)
+    return output_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1.0], help="Lengths to generate")
+    parser.add_argument("--no-music", action="store_true", help="Voice only, no background chord")
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--height", type=int, default=240)
+    parser.add_argument("--output-dir", default=DEFAULT_VIDEO_DIR)
+    args = parser.parse_args()
+
+    for minutes in args.minutes:
+        try:
+            path = make_test_video(minutes * 60, not args.no_music, args.width, args.height,
+                                   output_dir=args.output_dir)
+        except Exception as e:
+            sys.exit(f"Could not generate a {minutes:g} minute video: {e}")
+        print(f"{minutes:g} min: {path} ({os.path.getsize(path) / 1024 ** 2:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Fanar API, for benchmarks that must not spend quota
+or depend on the network.
+
+Implements /chat/completions, /audio/transcriptions, /translations and
+/audio/speech with the response shapes of the real service. Every request
+waits a configurable latency (plus jitter and a per-second-of-audio cost),
+and a configurable fraction fails with a throttling status. Transcriptions
+are synthetic English sized to the uploaded audio, and speech is a
+synthetic harmonic WAV sized to the input text.
+
+Usage:
+    python benchmarks/mock_fanar.py [--port 8900] [--latency 0.2] [--jitter 0.1] [--error-rate 0.02]
+
+then point the app at it with FANAR_BASE_URL=http://127.0.0.1:8900/v1
+"""
+
+import argparse
+import io
+import json
+import random
+import re
+import struct
+import subprocess
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+SPEECH_SAMPLE_RATE = 22050
+SPEECH_SECONDS_PER_CHAR = 0.06
+WORDS_PER_SECOND = 2.5
+SENTENCE_WORDS = 12
+
+ENGLISH_WORDS = ("the", "video", "shows", "how", "we", "build", "a", "small", "model", "of", "our", "city",
+                 "and", "then", "test", "it", "with", "real", "data", "from", "last", "year")
+ARABIC_WORDS = ("الفيديو", "يوضح", "كيف", "نبني", "نموذجا", "صغيرا", "لمدينتنا", "ثم", "نختبره",
+                "ببيانات", "حقيقية", "من", "العام", "الماضي")
+
+
+def _audio_seconds(data):
+    """
+    Duration of the audio file in a multipart request body, or 0.
+
+    WAV is measured from its header; compressed uploads (FLAC or Opus
+    streamed from a pipe carry no length) are decoded with ffmpeg.
+    """
+    start = data.find(b"RIFF")
+    if start >= 0:
+        try:
+            with wave.open(io.BytesIO(data[start:]), "rb") as wav:
+                return wav.getnframes() / wav.getframerate()
+        except (wave.Error, EOFError, struct.error):
+            return 0.0
+    start = data.find(b"\r\n\r\n", data.find(b'name="file"'))
+    end = data.rfind(b"\r\n--")
+    if start < 0 or end <= start:
+        return 0.0
+    process = subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+                              "-f", "s16le", "-ac", "1", "-ar", "8000", "pipe:1"],
+                             input=data[start + 4:end], capture_output=True)
+    return len(process.stdout) / 16000 if process.returncode == 0 else 0.0
+
+
+def synthetic_transcript(seconds, rng):
+    """English sentences at a speaking rate of WORDS_PER_SECOND."""
+    words = [rng.choice(ENGLISH_WORDS) for _ in range(max(1, int(seconds * WORDS_PER_SECOND)))]
+    sentences = [" ".join(words[i:i + SENTENCE_WORDS]) for i in range(0, len(words), SENTENCE_WORDS)]
+    return " ".join(sentence[0].upper() + sentence[1:] + "." for sentence in sentences)
+
+
+def pseudo_translate(text, rng):
+    """Replace every word with an Arabic word, keeping sentence punctuation."""
+    return re.sub(r"[A-Za-z']+", lambda match: rng.choice(ARABIC_WORDS), text)
+
+
+def synthetic_speech(text):
+    """16-bit mono WAV with a gliding harmonic tone, SPEECH_SECONDS_PER_CHAR per character."""
+    n = max(1, int(len(text) * SPEECH_SECONDS_PER_CHAR * SPEECH_SAMPLE_RATE))
+    t = np.arange(n) / SPEECH_SAMPLE_RATE
+    phase = 2 * np.pi * np.cumsum(160 + 30 * np.sin(2 * np.pi * 0.5 * t)) / SPEECH_SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 + 0.5 * np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    pcm = (0.2 * voiced * envelope * 32767).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SPEECH_SAMPLE_RATE)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+class MockFanarServer:
+    """Threaded HTTP server answering the four Fanar endpoints."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, jitter=0.1, audio_latency=0.01,
+                 error_rate=0.0, error_status=503, seed=0):
+        """
+        Args:
+            host (str): Interface to listen on
+            port (int): Port, 0 for any free port
+            latency (float): Seconds every request waits before answering
+            jitter (float): Extra random wait of up to this many seconds
+            audio_latency (float): Extra seconds per second of audio transcribed or synthesized
+            error_rate (float): Fraction of requests answered with error_status
+            error_status (int): Status code of failed requests (429, 503, ...)
+            seed (int): Seed of the random generator, for repeatable runs
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.audio_latency = audio_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = {}
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Serve from a daemon thread and return self."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-fanar", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _draw(self):
+        # The generator is shared by all handler threads
+        with self._lock:
+            return self._rng.random(), random.Random(self._rng.random())
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self._read_body()
+                if body is None:
+                    # The client gave up part way through a streamed upload
+                    self.close_connection = True
+                    return
+                endpoint = self.path.rstrip("/").rsplit("/v1/", 1)[-1]
+                draw, rng = server._draw()
+                with server._lock:
+                    server.requests[endpoint] = server.requests.get(endpoint, 0) + 1
+
+                try:
+                    content_type, reply, audio_seconds = server.answer(endpoint, body, rng)
+                except KeyError:
+                    self._send(404, "application/json", b'{"error": "unknown endpoint"}')
+                    return
+                except (ValueError, json.JSONDecodeError) as e:
+                    self._send(400, "application/json", json.dumps({"error": str(e)}).encode())
+                    return
+
+                time.sleep(server.latency + rng.random() * server.jitter + audio_seconds * server.audio_latency)
+                if draw < server.error_rate:
+                    with server._lock:
+                        server.errors += 1
+                    self._send(server.error_status, "application/json", b'{"error": "overloaded"}',
+                               {"Retry-After": "0"})
+                    return
+                self._send(200, content_type, reply)
+
+            def _read_body(self):
+                if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+                    return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                # Streamed uploads arrive in chunked transfer encoding
+                parts = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line.strip():
+                        return None
+                    size = int(line.split(b";", 1)[0], 16)
+                    if size == 0:
+                        while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                            pass
+                        return b"".join(parts)
+                    parts.append(self.rfile.read(size))
+                    self.rfile.readline()
+
+            def _send(self, status, content_type, payload, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def answer(self, endpoint, body, rng):
+        """
+        Build the response to one request.
+
+        Returns:
+            tuple: (content type, body bytes, seconds of audio involved)
+        """
+        if endpoint == "chat/completions":
+            messages = json.loads(body)["messages"]
+            # Answer with the text the prompt is about: its last paragraph
+            text = messages[-1]["content"].rsplit("\n\n", 1)[-1]
+            text = text.split("\n", 1)[-1] if text.startswith("النص:") else text
+            reply = {"choices": [{"message": {"role": "assistant", "content": text}}]}
+            return "application/json", json.dumps(reply, ensure_ascii=False).encode("utf-8"), 0.0
+        if endpoint == "audio/transcriptions":
+            seconds = _audio_seconds(body)
+            reply = {"text": synthetic_transcript(seconds, rng)}
+            return "application/json", json.dumps(reply).encode("utf-8"), seconds
+        if endpoint == "translations":
+            text = json.loads(body)["text"]
+            reply = {"text": pseudo_translate(text, rng)}
+            return "application/json", json.dumps(reply, ensure_ascii=False).encode("utf-8"), 0.0
+        if endpoint == "audio/speech":
+            text = json.loads(body)["input"]
+            return "audio/wav", synthetic_speech(text), len(text) * SPEECH_SECONDS_PER_CHAR
+        raise KeyError(endpoint)
+
+    def stats(self):
+        """Requests per endpoint and the number answered with an error."""
+        with self._lock:
+            return {"requests": dict(self.requests), "errors": self.errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds every request waits")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Extra random wait of up to this many seconds")
+    parser.add_argument("--audio-latency", type=float, default=0.01, help="Extra seconds per second of audio")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="Status code of failed requests")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockFanarServer(args.host, args.port, args.latency, args.jitter, args.audio_latency,
+                             args.error_rate, args.error_status, args.seed)
+    print(f"Mock Fanar API listening on {server.url}")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats()))
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
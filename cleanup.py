@@ -30,7 +30,11 @@ def cleanup_temp_files():
     # Directories to remove
     temp_dirs = [
         "__pycache__",
-        "demucs_output"
+        "demucs_output",
+        "jobs",
+        "batch_jobs",
+        ".youtube_cache",
+        ".uploads"
     ]
     
     # Remove files
@@ -0,0 +1,197 @@
+"""
+Warm, in-process Demucs music separation.
+
+The Demucs CLI reloads the model weights for every job and separates the
+whole file in one process. SeparationService instead keeps a pool of worker
+processes that each load the model once and stay alive. Long audio is split
+into overlapping segments that are separated across the workers in
+parallel, then stitched back together with linear crossfades.
+
+demucs and torch are optional: when they are not installed, the pipeline
+falls back to the Demucs CLI.
+"""
+
+import importlib.util
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from audio_store import open_audio
+from dubbing_utils import save_wav
+
+
+DEFAULT_MODEL = "htdemucs"
+DEFAULT_SEGMENT_SECONDS = 30
+DEFAULT_OVERLAP_SECONDS = 2
+
+# Model loaded once per worker process by _init_worker
+_worker_model = None
+
+
+def demucs_available():
+    """Return True if demucs and torch can be imported."""
+    return all(importlib.util.find_spec(name) is not None for name in ("demucs", "torch"))
+
+
+def _init_worker(model_name, num_threads):
+    global _worker_model
+    import torch
+    from demucs.pretrained import get_model
+
+    torch.set_num_threads(num_threads)
+    _worker_model = get_model(model_name)
+    _worker_model.eval()
+
+
+def _worker_ready():
+    return _worker_model is not None
+
+
+def _separate_segment(segment):
+    """
+    Separate one normalized segment in a worker process.
+
+    Args:
+        segment (numpy.ndarray): float32 audio of shape (channels, samples)
+
+    Returns:
+        numpy.ndarray: Sum of all non-vocal stems, same shape as segment
+    """
+    import torch
+    from demucs.apply import apply_model
+
+    with torch.no_grad():
+        mix = torch.from_numpy(segment)[None]
+        sources = apply_model(_worker_model, mix, split=True, overlap=0.25, progress=False)[0]
+    vocals = _worker_model.sources.index("vocals")
+    keep = [i for i in range(len(_worker_model.sources)) if i != vocals]
+    return sources[keep].sum(dim=0).numpy()
+
+
+def _crossfade_window(index, starts, lengths, overlap, total):
+    """Gain curve of one segment; the overlapping linear ramps of neighbouring segments sum to one."""
+    start, length = starts[index], lengths[index]
+    window = np.ones(length, dtype=np.float32)
+    ramp = min(overlap, length)
+    if index > 0:
+        window[:ramp] = np.linspace(0.0, 1.0, ramp, endpoint=False, dtype=np.float32)
+    if index < len(starts) - 1 and start + length < total:
+        window[-ramp:] = np.minimum(window[-ramp:], np.linspace(1.0, 0.0, ramp, endpoint=False, dtype=np.float32))
+    return window
+
+
+class SeparationService:
+    """Long-lived Demucs workers that keep the model loaded between jobs."""
+
+    def __init__(self, model_name=DEFAULT_MODEL, workers=None, segment_seconds=DEFAULT_SEGMENT_SECONDS,
+                 overlap_seconds=DEFAULT_OVERLAP_SECONDS):
+        """
+        Args:
+            model_name (str): Pretrained Demucs model name
+            workers (int): Number of worker processes (defaults to half the CPU cores)
+            segment_seconds (float): Length of the segments separated in parallel
+            overlap_seconds (float): Overlap between neighbouring segments for crossfading
+        """
+        cores = os.cpu_count() or 1
+        self.model_name = model_name
+        self.workers = workers or max(1, cores // 2)
+        self.segment_seconds = segment_seconds
+        self.overlap_seconds = overlap_seconds
+        self.sample_rate = 44100
+        self.channels = 2
+        # spawn, not fork: forking a process that already runs torch threads can deadlock
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, max(1, cores // self.workers))
+        )
+
+    def warm_up(self, block=True):
+        """
+        Start every worker and load the model, so the first job does not pay for it.
+
+        Args:
+            block (bool): Wait until every worker has loaded the model
+        """
+        futures = [self._executor.submit(_worker_ready) for _ in range(self.workers)]
+        if block:
+            wait(futures)
+
+    def separate(self, audio):
+        """
+        Separate the music stem from audio.
+
+        Args:
+            audio (numpy.ndarray): float32 audio of shape (samples, 2) at 44.1 kHz
+
+        Returns:
+            numpy.ndarray: float32 music (no vocals) stem of the same shape
+        """
+        mix = np.ascontiguousarray(audio.T, dtype=np.float32)
+        total = mix.shape[1]
+
+        # Same normalization as the Demucs CLI, computed over the whole track
+        reference = mix.mean(axis=0)
+        mean, std = float(reference.mean()), float(reference.std()) or 1.0
+        mix = (mix - mean) / std
+
+        segment = int(self.segment_seconds * self.sample_rate)
+        overlap = int(self.overlap_seconds * self.sample_rate)
+        step = max(segment - overlap, 1)
+        starts = list(range(0, max(total - overlap, 1), step))
+        lengths = [min(segment, total - start) for start in starts]
+
+        # At most one segment more than there are workers is in flight, so only
+        # those segments and their results are held besides the track itself
+        music = np.zeros_like(mix)
+        running = {}
+        segments = iter(range(len(starts)))
+        while True:
+            for index in segments:
+                start, length = starts[index], lengths[index]
+                segment_mix = np.ascontiguousarray(mix[:, start:start + length])
+                running[self._executor.submit(_separate_segment, segment_mix)] = index
+                if len(running) > self.workers:
+                    break
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            while done:
+                future = done.pop()
+                index = running.pop(future)
+                start, length = starts[index], lengths[index]
+                music[:, start:start + length] += future.result() * _crossfade_window(
+                    index, starts, lengths, overlap, total
+                )
+                # Stitched: the segment's result is not kept alive until the next wait
+                del future
+
+        return (music * std + mean).T
+
+    def separate_file(self, audio_file, output_file):
+        """
+        Separate the music stem of an audio file.
+
+        Args:
+            audio_file (str): Path to input audio file
+            output_file (str): Path for the music (no vocals) stem
+
+        Returns:
+            str: Path to the music stem
+        """
+        # Mapped without a copy when already at the model's rate and layout, decoded to a temporary copy otherwise
+        audio = open_audio(audio_file, self.sample_rate, self.channels).float32()
+
+        music = self.separate(audio)
+        output_dir = os.path.dirname(output_file)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        save_wav(music, self.sample_rate, output_file)
+        return output_file
+
+    def close(self):
+        """Shut the worker processes down."""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,646 @@
+"""
+English-to-Arabic dubbing pipeline, run as a background job.
+
+The steps mirror the original Streamlit flow, but every artifact is written
+into the job's workspace and progress is reported through the Job object
+instead of Streamlit widgets, so several jobs can run side by side. A job
+can dub into several languages at once: extraction, separation and
+transcription run once, and the translation-to-mix steps run concurrently
+for each language, ending in one video with an audio track per language.
+
+The steps are stages of a StageGraph, each starting as soon as its inputs
+are ready: music separation runs alongside transcription, translation and
+TTS, which only meet it again at the music mix.
+"""
+
+import json
+import os
+import re
+import shutil
+
+from audio_store import open_audio
+from dubbing_utils import (
+    extract_audio_from_video, separate_music_with_demucs, mix_music_and_tts, remix_regions,
+    get_audio_duration, select_transcription_model, save_text_to_file, save_wav, combine_audio_video,
+    EXTRACT_SAMPLE_RATE, EXTRACT_CHANNELS, MUSIC_GAIN_DB, DUCKED_GAIN_DB
+)
+from music_detection import detect_music as detect_background_music
+from text_chunking import chunk_text, map_chunks, join_chunks, estimate_tokens, DEFAULT_MAX_WORKERS as TEXT_MAX_WORKERS
+from stt_chunking import transcribe_chunked, MAX_CHUNK_SECONDS, DEFAULT_MAX_WORKERS as STT_MAX_WORKERS
+from tts_timeline import (
+    split_sentences, align_sentences, realign_sentences, synthesize_sentences, synthesize_and_place, patch_timeline,
+    DEFAULT_MAX_WORKERS as TTS_MAX_WORKERS
+)
+from time_stretch import fit_to_duration, DEFAULT_MAX_RATIO
+from stage_graph import StageGraph, PipelineError
+
+
+AUTO_MODEL = "Auto-select (Recommended)"
+CHUNKED_MODE = "Chunked parallel (timestamps)"
+
+TTS_SENTENCES = "Sentence-level (parallel, timed)"
+TTS_WHOLE = "Whole text (single request)"
+
+GRAMMAR_SYSTEM_PROMPT = "You are a helpful assistant."
+GRAMMAR_PROMPT = "Add grammar to the following transcription:\n\n{text}"
+GRAMMAR_CONTEXT_PROMPT = "For context only, this is the text that comes right before (do not include it in your answer):\n\n{context}\n\n"
+
+REFORMULATION_SYSTEM_PROMPT = "أنت مساعد لغوي مختص بتحسين النصوص لتحويلها إلى كلام (TTS) بطريقة طبيعية وسلسة."
+REFORMULATION_PROMPT = """قم بإعادة صياغة هذا النص ليكون أكثر سلاسة وطبيعية عند النطق لتحسين أداء تحويل النص إلى كلام (TTS)، ويجب أن يكون النص الناتج أكثر إيجازًا واختصارًا من النص الأصلي، مع الحفاظ على المعنى الأساسي. استخدم جملاً قصيرة، وتجنّب التعقيد أو الكلمات الزائدة. لا تضف مقدمات أو تعليقات أو اقتباسات — فقط أرجع النص المحسّن النهائي.\n\nالنص:\n{text}"""
+REFORMULATION_CONTEXT_PROMPT = "للسياق فقط، هذا هو النص الذي يسبق النص المطلوب مباشرة (لا تُدرجه في إجابتك):\n\n{context}\n\n"
+
+# Used for every target language other than Arabic
+GENERIC_REFORMULATION_SYSTEM_PROMPT = "You are a language assistant who rewrites text so that it sounds natural when read aloud by text-to-speech (TTS)."
+GENERIC_REFORMULATION_PROMPT = "Rewrite this {language} text so that it is smoother and more natural when spoken by text-to-speech (TTS). It must be more concise than the original while keeping its core meaning. Use short sentences and avoid complex or unnecessary words. Do not add introductions, comments or quotes - reply in {language} with the final improved text only.\n\nText:\n{text}"
+GENERIC_REFORMULATION_CONTEXT_PROMPT = "For context only, this is the text that comes right before (do not include it in your answer):\n\n{context}\n\n"
+
+TRANSLATION_MODEL = "Fanar-Shaheen-MT-1"
+
+SOURCE_LANGUAGE = "en"
+DEFAULT_TARGET_LANGUAGES = ("ar",)
+
+# Display name and ISO 639-2 code (audio track metadata) of the dubbing languages
+LANGUAGES = {
+    "ar": ("Arabic", "ara"),
+    "en": ("English", "eng"),
+    "fr": ("French", "fra"),
+    "es": ("Spanish", "spa"),
+    "de": ("German", "deu"),
+    "tr": ("Turkish", "tur"),
+    "ur": ("Urdu", "urd"),
+}
+
+
+def language_info(code):
+    """(display name, ISO 639-2 code) of a target language; unknown codes are used as they are."""
+    return LANGUAGES.get(code, (code, code))
+
+
+def dub_suffix(target_languages=None):
+    """Suffix naming the dubbed languages in output file names, e.g. "arabic dub"."""
+    return "-".join(language_info(lang)[0].lower() for lang in target_languages or DEFAULT_TARGET_LANGUAGES) + " dub"
+
+
+def reformulation_prompts(code):
+    """
+    Return the (system prompt, prompt, context prompt) that rewrite a translation for TTS.
+
+    Arabic keeps its Arabic prompts; other languages share an English prompt
+    that asks for a reply in the target language.
+    """
+    if code == "ar":
+        return REFORMULATION_SYSTEM_PROMPT, REFORMULATION_PROMPT, REFORMULATION_CONTEXT_PROMPT
+    # Only {text} is left for chat_in_chunks to fill in
+    prompt = GENERIC_REFORMULATION_PROMPT.format(language=language_info(code)[0], text="{text}")
+    return GENERIC_REFORMULATION_SYSTEM_PROMPT, prompt, GENERIC_REFORMULATION_CONTEXT_PROMPT
+
+
+def extract_speech_text(text):
+    """
+    Extract quoted text for TTS.
+
+    Args:
+        text (str): TTS-optimized text
+
+    Returns:
+        str: Joined quoted passages, or an empty string if there are none
+    """
+    quoted_texts = re.findall(r'"([^"]+)"|"([^"]+)"|«([^»]+)»', text)
+    # Flatten and join all non-empty matches
+    return ' '.join([t for group in quoted_texts for t in group if t])
+
+
+def match_audio_duration(reference_file, tts_file, max_stretch=DEFAULT_MAX_RATIO):
+    """
+    Fit the TTS audio in place to the reference duration: time-stretch it by
+    up to max_stretch without changing pitch, then pad with silence or trim
+    whatever difference remains.
+
+    Returns:
+        float: Applied stretch factor (output duration / input duration)
+    """
+    # The reference length comes from its header; the TTS samples are mapped, not decoded again
+    reference_duration = get_audio_duration(reference_file)
+    tts_audio = open_audio(tts_file)
+    target_length = int(round(reference_duration * tts_audio.sample_rate))
+
+    adjusted, factor = fit_to_duration(tts_audio.float32(), target_length, tts_audio.sample_rate,
+                                       max_ratio=max_stretch)
+
+    # Save adjusted audio
+    save_wav(adjusted, tts_audio.sample_rate, tts_file)
+    return factor
+
+
+def _cached(job, message, cache_hit):
+    job.log("success", message + (" (cached)" if cache_hit else ""))
+
+
+def chat_in_chunks(client, stage_cache, text, system_prompt, prompt, context_prompt, model="Fanar",
+                   max_workers=TEXT_MAX_WORKERS):
+    """
+    Apply a chat prompt to token-budgeted chunks of text concurrently.
+
+    Each chunk is sent with the end of the previous chunk as context and a
+    max_tokens budget proportional to its length, and is cached on its own,
+    so an edit to the text only re-runs the chunks it touches.
+
+    Returns:
+        tuple: (joined replies, number of chunks, True if every chunk was cached)
+    """
+    def process(chunk):
+        content = prompt.format(text=chunk["text"])
+        if chunk["context"]:
+            content = context_prompt.format(context=chunk["context"]) + content
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": content}
+        ]
+        max_tokens = 2 * estimate_tokens(chunk["text"]) + 256
+        key = stage_cache.make_key("chat", model, messages, max_tokens)
+        reply, cache_hit = stage_cache.cached_text(
+            key,
+            lambda: client.fanar_chat(messages, model=model, max_tokens=max_tokens).get("reply", "")
+        )
+        return reply or chunk["text"], cache_hit
+
+    chunks = chunk_text(text)
+    results = map_chunks(chunks, process, max_workers)
+    return join_chunks(reply for reply, _ in results), len(chunks), all(hit for _, hit in results)
+
+
+def translate_in_chunks(client, stage_cache, text, source_lang="en", target_lang="ar", model=TRANSLATION_MODEL,
+                        max_workers=TEXT_MAX_WORKERS):
+    """
+    Translate token-budgeted chunks of text concurrently.
+
+    The translation endpoint has no way to pass read-only context, so the
+    chunks do not overlap; they still end on sentence boundaries.
+
+    Returns:
+        tuple: (joined translation, number of chunks, True if every chunk was cached)
+    """
+    def process(chunk):
+        key = stage_cache.make_key("translate", model, source_lang, target_lang, chunk["text"])
+        return stage_cache.cached_text(
+            key,
+            lambda: client.translate_text(chunk["text"], source_lang=source_lang, target_lang=target_lang,
+                                          model=model)
+        )
+
+    chunks = chunk_text(text, overlap_sentences=0)
+    results = map_chunks(chunks, process, max_workers)
+    return join_chunks(translation for translation, _ in results), len(chunks), all(hit for _, hit in results)
+
+
+def _load_timeline(timeline_file):
+    """The speech timeline saved by the previous run in this workspace, or None."""
+    try:
+        with open(timeline_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _chunked(message, n_chunks):
+    return message if n_chunks <= 1 else f"{message[:-1]} in {n_chunks} parallel chunks{message[-1]}"
+
+
+def run_dubbing_job(job, client, stage_cache, input_video_path, final_video_filename,
+                    transcription_model=AUTO_MODEL, tts_mode=TTS_SENTENCES,
+                    max_stretch=DEFAULT_MAX_RATIO, separator=None, detect_music=True, stage_workers=None,
+                    source_audio_path=None, video_ready=None, auto_cleanup=True, target_languages=None,
+                    edited_texts=None):
+    """
+    Run the full dubbing pipeline for one video inside the job's workspace.
+
+    Independent stages run concurrently (see stage_graph). The stages that set
+    the run's length are published as the "critical_path" output.
+
+    Args:
+        job (Job): Job whose workspace receives all files and which records progress
+        client (FanarAPIClient): Fanar API client
+        stage_cache (StageCache): Cache of stage artifacts shared between jobs
+        input_video_path (str): Path to the source video
+        final_video_filename (str): File name of the dubbed video
+        transcription_model (str): STT model name, AUTO_MODEL to pick by duration, or
+            CHUNKED_MODE to transcribe silence-separated chunks in parallel
+        tts_mode (str): TTS_SENTENCES to synthesize sentences concurrently and place
+            them on the timeline, or TTS_WHOLE for one request fitted to the source length
+        max_stretch (float): Maximum speed change applied when fitting speech to its time slot
+        separator (SeparationService): Warm Demucs workers, or None to run the Demucs CLI
+        detect_music (bool): Skip music separation and mixing when the source has no background music
+        stage_workers (dict): Concurrent requests per stage ("transcription", "text", "tts");
+            missing stages use their module defaults. Each target language gets its own
+            "text" and "tts" workers; the client's rate limiters bound the total.
+        source_audio_path (str): Source audio downloaded separately from the video; when
+            given, audio is extracted from it and the video is only needed for the final mux
+        video_ready (callable): Blocks until input_video_path is complete, for videos that
+            are still downloading while the earlier stages run
+        auto_cleanup (bool): Remove intermediate files once the video is produced
+        target_languages (list): Language codes to dub into (see LANGUAGES), defaulting to
+            DEFAULT_TARGET_LANGUAGES. The video gets one audio track per language, the first
+            being the default; per-language outputs are published as "<output>.<code>".
+        edited_texts (dict): TTS-optimized text corrected by the user, per language code,
+            replacing the reformulation output. Sentence-level TTS then re-synthesizes only
+            the sentences that differ from the previous run in this workspace and patches
+            their time ranges in its speech track and mix.
+
+    Returns:
+        str: Path to the dubbed video
+    """
+    workspace = job.workspace
+    workers = {"transcription": STT_MAX_WORKERS, "text": TEXT_MAX_WORKERS, "tts": TTS_MAX_WORKERS,
+               **(stage_workers or {})}
+
+    # File paths
+    audio_file = workspace.path("english_audio.wav")
+    transcription_file = workspace.path("transcription.txt")
+    segments_file = workspace.path("segments.json")
+    demucs_dir = workspace.path("demucs_output")
+    music_path = os.path.join(demucs_dir, "no_vocals.wav")
+    output_file = workspace.path(final_video_filename)
+
+    languages = list(dict.fromkeys(target_languages or DEFAULT_TARGET_LANGUAGES))
+    fan_out = len(languages) > 1
+    language_files = {
+        lang: {
+            "translation": workspace.path(f"translation_{lang}.txt"),
+            "speech": workspace.path(f"{language_info(lang)[0].lower()}_speech.wav"),
+            "mix": workspace.path(f"{language_info(lang)[0].lower()}_speech_with_music.wav"),
+            "clips": workspace.path(f"tts_clips_{lang}"),
+            "timeline": workspace.path(f"tts_timeline_{lang}.json"),
+        }
+        for lang in languages
+    }
+    job.set_output("languages", languages)
+
+    # Each stage starts once the values it reads are available, so separation overlaps
+    # the API stages and the languages of a multi-language job run side by side
+    graph = StageGraph({"has_music": True} if not detect_music else None)
+
+    # Step 1: Extract audio
+    def extract():
+        audio_source = source_audio_path or input_video_path
+        source_hash = stage_cache.hash_file(audio_source)
+        extract_key = stage_cache.make_key("extract_audio", source_hash, EXTRACT_SAMPLE_RATE, EXTRACT_CHANNELS)
+        cache_hit = stage_cache.cached_files(
+            extract_key,
+            {"audio.wav": audio_file},
+            lambda: extract_audio_from_video(audio_source, audio_file)
+        )
+        _cached(job, "Audio extracted!", cache_hit)
+        audio_duration = get_audio_duration(audio_file)
+        if audio_duration:
+            job.log("info", f"Audio duration: {audio_duration:.1f} seconds")
+        return extract_key, audio_duration
+
+    graph.add("Audio extraction", extract, outputs=("extract_key", "audio_duration"))
+
+    if video_ready is not None:
+        # The video is only needed for the final mux; it finishes downloading meanwhile
+        graph.add("Video download", video_ready, outputs=("video",))
+
+    # Step 1.4: Check whether there is background music worth separating
+    def detect(extract_key):
+        detection_key = stage_cache.make_key("detect_music", extract_key)
+        detection, cache_hit = stage_cache.cached_text(
+            detection_key, lambda: json.dumps(detect_background_music(audio_file))
+        )
+        detection = json.loads(detection)
+        verdict = "Background music detected" if detection["has_music"] else "No background music detected, skipping separation"
+        _cached(job, f"{verdict} (score {detection['score']:.2f}, confidence {detection['confidence']:.0%})", cache_hit)
+        job.set_output("music_detection", detection)
+        return detection["has_music"]
+
+    if detect_music:
+        graph.add("Music detection", detect, inputs=("extract_key",), outputs=("has_music",))
+
+    # Step 1.5: Separate music from English audio using Demucs
+    def separate(extract_key):
+        def run_separation():
+            if separator is not None:
+                separator.separate_file(audio_file, music_path)
+                return
+            separated_path = separate_music_with_demucs(audio_file, output_dir=demucs_dir)
+            if os.path.abspath(separated_path) != os.path.abspath(music_path):
+                shutil.copyfile(separated_path, music_path)
+
+        engine = separator.model_name if separator is not None else "cli"
+        separation_key = stage_cache.make_key("separate_music", extract_key, engine)
+        cache_hit = stage_cache.cached_files(separation_key, {"no_vocals.wav": music_path}, run_separation)
+        _cached(job, "Music separated from English audio!", cache_hit)
+        return separation_key
+
+    graph.add("Music separation", separate, inputs=("extract_key",), outputs=("separation_key",), when="has_music")
+
+    # Step 2: Transcribe audio
+    def transcribe(extract_key, audio_duration):
+        segments = None
+        if transcription_model == CHUNKED_MODE:
+            job.log("info", f"Transcribing silence-separated chunks of up to {MAX_CHUNK_SECONDS}s in parallel")
+
+            def run_chunked_transcription():
+                result = transcribe_chunked(client, audio_file, workspace.path("stt_chunks"),
+                                            max_workers=workers["transcription"])
+                return json.dumps(result, ensure_ascii=False)
+
+            transcription_key = stage_cache.make_key("transcribe_chunked", extract_key, MAX_CHUNK_SECONDS)
+            result_json, cache_hit = stage_cache.cached_text(transcription_key, run_chunked_transcription)
+            result = json.loads(result_json)
+            transcription_text = result["text"]
+            segments = result["segments"]
+            with open(segments_file, "w", encoding="utf-8") as f:
+                json.dump(segments, f, ensure_ascii=False, indent=2)
+            job.set_output("segments", segments)
+        else:
+            if transcription_model == AUTO_MODEL:
+                selected_model = select_transcription_model(audio_duration)
+                job.log("info", f"Auto-selected model: {selected_model}")
+            else:
+                selected_model = transcription_model
+                job.log("info", f"Manually selected model: {selected_model}")
+
+            def run_transcription():
+                transcription_result = client.transcribe_audio_fanar(audio_file, model=selected_model)
+                return transcription_result.get("text", "") or str(transcription_result)
+
+            transcription_key = stage_cache.make_key("transcribe", extract_key, selected_model)
+            transcription_text, cache_hit = stage_cache.cached_text(transcription_key, run_transcription)
+        save_text_to_file(transcription_text, transcription_file)
+        job.set_output("transcription", transcription_text)
+        _cached(job, "Transcription complete!", cache_hit)
+        return transcription_text, segments
+
+    graph.add("Transcription", transcribe, inputs=("extract_key", "audio_duration"),
+              outputs=("transcription", "segments"))
+
+    # Step 3: Add grammar to transcription
+    def improve_grammar(transcription_text):
+        grammar_text, n_chunks, cache_hit = chat_in_chunks(
+            client, stage_cache, transcription_text,
+            GRAMMAR_SYSTEM_PROMPT, GRAMMAR_PROMPT, GRAMMAR_CONTEXT_PROMPT, max_workers=workers["text"]
+        )
+        if not grammar_text:
+            grammar_text = transcription_text
+        save_text_to_file(grammar_text, transcription_file)
+        job.set_output("grammar", grammar_text)
+        _cached(job, _chunked("Grammar improved!", n_chunks), cache_hit)
+        return grammar_text
+
+    graph.add("Grammar improvement", improve_grammar, inputs=("transcription",), outputs=("grammar",))
+
+    # Steps 4-6.6 once per target language; their values are named "<value>.<code>"
+    def add_language(lang):
+        name = language_info(lang)[0]
+        files = language_files[lang]
+        tts_output_file = files["speech"]
+        edited_text = (edited_texts or {}).get(lang)
+        prefix = f"{name}: " if fan_out else ""
+
+        def stage_name(base):
+            return f"{base} ({name})" if fan_out else base
+
+        def output(output_name, value):
+            job.set_output(f"{output_name}.{lang}", value)
+
+        # Step 4: Translate
+        def translate(grammar_text):
+            translated_text, n_chunks, cache_hit = translate_in_chunks(
+                client, stage_cache, grammar_text, source_lang=SOURCE_LANGUAGE, target_lang=lang,
+                max_workers=workers["text"]
+            )
+            save_text_to_file(translated_text, files["translation"])
+            output("translation", translated_text)
+            _cached(job, prefix + _chunked("Translation complete!", n_chunks), cache_hit)
+            return translated_text
+
+        translation = "grammar"
+        if lang != SOURCE_LANGUAGE:
+            translation = f"translation.{lang}"
+            graph.add(stage_name("Translation"), translate, inputs=("grammar",), outputs=(translation,))
+
+        # Step 5: Improve the translation for TTS
+        def improve(translated_text):
+            if edited_text is not None:
+                tts_text = edited_text
+                job.log("info", f"Using the edited {name} text.")
+            else:
+                system_prompt, prompt, context_prompt = reformulation_prompts(lang)
+                tts_text, n_chunks, cache_hit = chat_in_chunks(
+                    client, stage_cache, translated_text, system_prompt, prompt, context_prompt,
+                    max_workers=workers["text"]
+                )
+                if not tts_text:
+                    tts_text = translated_text
+                _cached(job, _chunked(f"{name} improved for TTS!", n_chunks), cache_hit)
+            save_text_to_file(tts_text, files["translation"])
+            output("tts_text", tts_text)
+
+            # Step 5.5: Extract quoted text for TTS, or use full text if no quotes found
+            speech_text = extract_speech_text(tts_text)
+            if not speech_text:
+                # If no quoted text found, use the full improved text
+                speech_text = tts_text
+                job.log("info", prefix + "No text found in quotation marks. Using full text for TTS.")
+                output("speech_source", "full text")
+            else:
+                output("speech_source", "from quotes only")
+            output("speech_text", speech_text)
+            if not speech_text:
+                raise PipelineError("TTS", f"No {name} text available for TTS")
+            return speech_text
+
+        graph.add(f"{name} TTS improvement", improve, inputs=(translation,),
+                  outputs=(f"speech_text.{lang}",))
+
+        # Step 6: Text-to-Speech, placing sentences on the timeline
+        def synthesize_timeline(speech_text, audio_duration, segments):
+            sentences = split_sentences(speech_text)
+            clips = speech_patch = None
+            previous = _load_timeline(files["timeline"]) if edited_text is not None else None
+            if (previous and previous["audio_duration"] == audio_duration and previous["max_stretch"] == max_stretch
+                    and stage_cache.get_files(previous["speech_key"], {"speech.wav": tts_output_file})):
+                # Re-dub: keep the previous speech track and redo only the sentences that changed
+                timeline, speech_gaps = realign_sentences(previous["entries"], sentences, audio_duration or 0.0)
+                changed = [entry for _, _, entries in speech_gaps for entry in entries]
+                job.log("info", prefix + f"{len(changed)} of {len(timeline)} sentences changed, "
+                                         f"re-synthesizing only those")
+                synthesized = {clip["index"]: clip for clip in synthesize_sentences(
+                    client, changed, files["clips"], stage_cache=stage_cache, max_workers=workers["tts"]
+                )}
+                speech_gaps = [(start, end, [synthesized[entry["index"]] for entry in entries])
+                               for start, end, entries in speech_gaps]
+                patched = patch_timeline(tts_output_file, speech_gaps, max_stretch=max_stretch)
+                if patched is None:
+                    job.log("info", prefix + "The edited sentences do not fit where the old ones were, "
+                                             "rebuilding the speech track")
+                else:
+                    placed = dict(zip((entry["index"] for entry in changed), patched))
+                    clips = [
+                        {**synthesized[entry["index"]], "placed_start": placed[entry["index"]][0],
+                         "placed_end": placed[entry["index"]][1]} if entry["index"] in placed else entry
+                        for entry in timeline
+                    ]
+                    # The mix is patched in the same time ranges
+                    speech_patch = (previous["speech_key"], [(start, end) for start, end, _ in speech_gaps])
+            if clips is None:
+                # Synthesize sentences concurrently, placing each at its start time as it completes
+                timeline = align_sentences(sentences, audio_duration or 0.0, segments)
+                job.log("info", prefix + f"Synthesizing {len(timeline)} sentences in parallel")
+                clips, placements = synthesize_and_place(
+                    client, timeline, files["clips"], audio_duration, tts_output_file, stage_cache=stage_cache,
+                    max_workers=workers["tts"], max_stretch=max_stretch
+                )
+                clips = [{**clip, "placed_start": start, "placed_end": end}
+                         for clip, (start, end) in zip(clips, placements)]
+            drift = max((clip["placed_start"] - clip["start"] for clip in clips), default=0.0)
+            if drift > 1.0:
+                job.log("warning", prefix + f"Speech runs up to {drift:.1f}s behind the original timing")
+
+            # Stored, so a re-dub of this workspace can start from this track
+            entries = [
+                {"text": clip["text"], "start": clip["start"], "end": clip["end"], "key": clip["key"],
+                 "placed_start": round(clip["placed_start"], 3), "placed_end": round(clip["placed_end"], 3)}
+                for clip in clips
+            ]
+            speech_key = stage_cache.make_key(
+                "tts_timeline", [(e["key"], e["placed_start"], e["placed_end"]) for e in entries], audio_duration,
+                max_stretch
+            )
+            stage_cache.put_files(speech_key, {"speech.wav": tts_output_file})
+            with open(files["timeline"], "w", encoding="utf-8") as f:
+                json.dump({"speech_key": speech_key, "audio_duration": audio_duration, "max_stretch": max_stretch,
+                           "entries": entries}, f, ensure_ascii=False, indent=2)
+            output("tts_timeline", [
+                {"start": e["placed_start"], "end": e["placed_end"], "text": e["text"]} for e in entries
+            ])
+            # The player streams the file itself; it is kept through cleanup for that
+            output("tts_audio", tts_output_file)
+            _cached(job, prefix + "TTS complete!", False)
+            return speech_key, speech_patch
+
+        # Step 6: Text-to-Speech in one request
+        def synthesize_whole(speech_text):
+            tts_key = stage_cache.make_key("tts", "Fanar-Aura-TTS-1", "default", speech_text)
+            cache_hit = stage_cache.cached_files(
+                tts_key,
+                {"speech.wav": tts_output_file},
+                lambda: client.text_to_speech(speech_text, tts_output_file)
+            )
+            _cached(job, prefix + "TTS complete!", cache_hit)
+            return tts_key
+
+        # Step 6.5: Match TTS audio duration to original audio
+        def adjust_duration(tts_key, extract_key, audio_duration):
+            speech_key = stage_cache.make_key("match_duration", tts_key, extract_key, max_stretch)
+            stage_cache.cached_files(
+                speech_key,
+                {"speech.wav": tts_output_file},
+                lambda: match_audio_duration(audio_file, tts_output_file, max_stretch)
+            )
+            if audio_duration:
+                job.log("info", prefix + f"TTS audio adjusted to {audio_duration:.2f} seconds to match original audio.")
+            output("tts_audio", tts_output_file)
+            return speech_key, None
+
+        speech = (f"speech_key.{lang}", f"speech_patch.{lang}")
+        if tts_mode == TTS_SENTENCES:
+            graph.add(stage_name("TTS"), synthesize_timeline,
+                      inputs=(f"speech_text.{lang}", "audio_duration", "segments"), outputs=speech)
+        else:
+            graph.add(stage_name("TTS"), synthesize_whole, inputs=(f"speech_text.{lang}",),
+                      outputs=(f"tts_key.{lang}",))
+            graph.add(stage_name("Audio duration adjustment"), adjust_duration,
+                      inputs=(f"tts_key.{lang}", "extract_key", "audio_duration"), outputs=speech)
+
+        # Step 6.6: Mix separated music with the TTS audio
+        def mix(speech_key, speech_patch, separation_key, audio_duration):
+            mixed_path = files["mix"]
+
+            def mix_key_for(speech):
+                return stage_cache.make_key("mix", separation_key, speech, audio_duration,
+                                            MUSIC_GAIN_DB, DUCKED_GAIN_DB)
+
+            def run_mix():
+                # After a patched re-dub, only the time ranges whose speech changed are re-mixed
+                if speech_patch is not None and stage_cache.get_files(
+                        mix_key_for(speech_patch[0]), {"mixed.wav": mixed_path}):
+                    remix_regions(music_path, tts_output_file, mixed_path, speech_patch[1])
+                else:
+                    mix_music_and_tts(music_path, tts_output_file, mixed_path, duration=audio_duration)
+
+            mix_key = mix_key_for(speech_key)
+            stage_cache.cached_files(mix_key, {"mixed.wav": mixed_path}, run_mix)
+            job.log("success", f"Music mixed with {name} TTS audio, ducked under speech!")
+            return mix_key
+
+        graph.add(stage_name("Music mixing"), mix, inputs=(*speech, "separation_key", "audio_duration"),
+                  outputs=(f"mix_key.{lang}",), when="has_music")
+
+    for lang in languages:
+        add_language(lang)
+
+    # Step 7: Combine audio and video, one audio track per language
+    def combine(extract_key, *keys):
+        speech_keys, mix_keys = keys[:len(languages)], keys[len(languages):2 * len(languages)]
+        # Use mixed audio for the final video where there is music
+        tracks = [
+            (language_files[lang]["mix"], mix_key) if mix_key is not None
+            else (language_files[lang]["speech"], speech_key)
+            for lang, speech_key, mix_key in zip(languages, speech_keys, mix_keys)
+        ]
+        track_languages = [(language_info(lang)[1], language_info(lang)[0]) for lang in languages]
+        combine_key = stage_cache.make_key("combine", [key for _, key in tracks], extract_key, track_languages)
+        cache_hit = stage_cache.cached_files(
+            combine_key,
+            {"video.mp4": output_file},
+            # The source video's frames are stream-copied; its audio track is not mapped
+            lambda: combine_audio_video([audio for audio, _ in tracks], input_video_path, output_file,
+                                        languages=track_languages)
+        )
+        _cached(job, "Dubbed video created!", cache_hit)
+
+    graph.add(
+        "Audio-video combination", combine,
+        inputs=("extract_key", *(f"speech_key.{lang}" for lang in languages),
+                *(f"mix_key.{lang}" for lang in languages), *(("video",) if video_ready is not None else ()))
+    )
+
+    # Stages started by the caller (e.g. a download) end here
+    job.set_stage(None)
+    graph.run(job)
+
+    critical_path = graph.critical_path()
+    summary = graph.summary()
+    job.set_output("critical_path", critical_path)
+    job.log("info", f"Stages took {summary['stage_s']:.1f}s in {summary['wall_s']:.1f}s; critical path "
+                    f"({summary['critical_path_s']:.1f}s): " + " → ".join(row["stage"] for row in critical_path))
+
+    # Automatic cleanup of temporary files
+    if auto_cleanup:
+        temp_files = [
+            audio_file,
+            transcription_file,
+            segments_file,
+            *(files[name] for files in language_files.values() for name in ("translation", "mix"))
+        ]
+        removed = [path for path in temp_files if _remove_file(path)]
+        temp_dirs = [demucs_dir, workspace.path("stt_chunks"), *(files["clips"] for files in language_files.values())]
+        for temp_dir in temp_dirs:
+            if os.path.exists(temp_dir):
+                shutil.rmtree(temp_dir, ignore_errors=True)
+        job.log("info", f"🧹 Cleaned up {len(removed)} temporary files")
+
+    return output_file
+
+
+def _remove_file(path):
+    if not os.path.exists(path):
+        return False
+    try:
+        os.remove(path)
+        return True
+    except OSError as e:
+        print(f"Could not remove {path}: {e}")
+        return False
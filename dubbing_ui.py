@@ -1,172 +1,20 @@
 import streamlit as st
 import os
-from dubbing_utils import FanarAPIClient, extract_audio_from_video, save_text_to_file, load_text_from_file, combine_audio_video
+import time
+from dubbing_utils import FanarAPIClient
+from dubbing_pipeline import (
+    run_dubbing_job, language_info, dub_suffix, AUTO_MODEL, CHUNKED_MODE, TTS_SENTENCES, TTS_WHOLE, LANGUAGES,
+    DEFAULT_TARGET_LANGUAGES
+)
+from job_manager import JobManager, DEFAULT_JOBS_DIR, DEFAULT_MAX_WORKERS, STATUS_PENDING, STATUS_QUEUED, STATUS_COMPLETED, STATUS_FAILED
+from stage_cache import StageCache, DEFAULT_CACHE_DIR
+from response_cache import ResponseCache, DEFAULT_CACHE_PATH
+from rate_limiter import limiter_stats
+from tracing import start_metrics_server
+from demucs_service import SeparationService, demucs_available
 from dotenv import load_dotenv
-import re
-from pydub import AudioSegment
-import subprocess
-import glob
-from pytubefix import YouTube
-from pytubefix.cli import on_progress
-import shutil
-
-def separate_music_with_demucs(audio_file, output_dir='demucs_output'):
-    os.makedirs(output_dir, exist_ok=True)
-    cmd = [
-        'demucs', '--two-stems=vocals', '-o', output_dir, audio_file
-    ]
-    subprocess.run(cmd, check=True)
-    # Find the model subfolder (e.g., htdemucs)
-    model_dir = next(
-        d for d in os.listdir(output_dir)
-        if os.path.isdir(os.path.join(output_dir, d))
-    )
-    # Search for no_vocals.wav in all subfolders
-    search_path = os.path.join(output_dir, model_dir, '*', 'no_vocals.wav')
-    matches = glob.glob(search_path)
-    if not matches:
-        raise FileNotFoundError(f"No 'no_vocals.wav' found in {search_path}")
-    return matches[0]
-
-def mix_music_and_tts(music_path, tts_path, output_path):
-    music = AudioSegment.from_file(music_path)
-    tts = AudioSegment.from_file(tts_path)
-    # Lower music volume for clarity
-    music = music - 10
-    # Overlay TTS on music
-    mixed = music.overlay(tts)
-    mixed.export(output_path, format='wav')
-
-def download_youtube_video(url, output_path="downloaded_youtube_video.mp4"):
-    """Download a YouTube video and return the path to the downloaded file using pytubefix."""
-    try:
-        # Basic URL validation
-        if not url or 'youtube.com' not in url and 'youtu.be' not in url:
-            raise ValueError("Please provide a valid YouTube URL")
-            
-        # Clean up URL (remove extra parameters)
-        if '&' in url:
-            url = url.split('&')[0]
-            
-        yt = YouTube(url, on_progress_callback=on_progress)
-        
-        # Show video info
-        try:
-            st.info(f"Video Title: {yt.title}")
-            st.info(f"Duration: {yt.length} seconds")
-        except:
-            st.info("Video info loading...")
-        
-        # Get the highest resolution stream
-        stream = yt.streams.get_highest_resolution()
-        if not stream:
-            raise RuntimeError("No suitable video stream found")
-        st.info(f"Downloading: {stream.resolution} quality")
-        
-        # Download the video
-        stream.download(filename=output_path)
-        
-        # Verify the file was downloaded
-        if not os.path.exists(output_path):
-            raise RuntimeError("Download completed but file not found")
-            
-        # Get file size
-        file_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
-        st.info(f"Download completed! File size: {file_size:.2f} MB")
-            
-        return output_path
-    except Exception as e:
-        error_msg = str(e)
-        if "HTTP Error 400" in error_msg:
-            raise RuntimeError("YouTube API error. This might be due to region restrictions or video availability. Try a different video or check if the video is publicly available.")
-        elif "Video unavailable" in error_msg:
-            raise RuntimeError("This video is not available for download. It might be private, age-restricted, or region-blocked.")
-        else:
-            raise RuntimeError(f"Failed to download YouTube video: {error_msg}")
-
-def get_audio_duration(audio_file):
-    """Get the duration of an audio file in seconds."""
-    try:
-        audio = AudioSegment.from_file(audio_file)
-        return len(audio) / 1000  # Convert milliseconds to seconds
-    except Exception as e:
-        st.warning(f"Could not determine audio duration: {e}")
-        return None
-
-def select_transcription_model(audio_duration):
-    """Select the appropriate transcription model based on audio duration."""
-    if audio_duration is None:
-        # Default to short-form model if duration cannot be determined
-        return "Fanar-Aura-STT-1"
-    
-    # Use long-form model for audio longer than 30 seconds
-    if audio_duration > 30:
-        return "Fanar-Aura-STT-LF-1"
-    else:
-        return "Fanar-Aura-STT-1"
-
-def get_video_title(input_video_path, youtube_url=None):
-    """Extract video title from YouTube URL or use filename for uploaded videos."""
-    if youtube_url:
-        try:
-            yt = YouTube(youtube_url)
-            if yt.title and yt.title.strip():
-                return yt.title.strip()
-        except Exception as e:
-            st.warning(f"Could not extract YouTube title: {e}")
-    
-    # For uploaded videos, use the filename without extension
-    if input_video_path:
-        base_name = os.path.splitext(os.path.basename(input_video_path))[0]
-        # Remove common prefixes/suffixes
-        base_name = base_name.replace("uploaded_video", "").replace("downloaded_youtube_video", "")
-        if base_name.strip():
-            return base_name.strip()
-    
-    return "video"
-
-def sanitize_filename(filename):
-    """Remove invalid characters from filename."""
-    # Remove or replace invalid characters
-    invalid_chars = '<>:"/\\|?*'
-    for char in invalid_chars:
-        filename = filename.replace(char, '_')
-    
-    # Limit length
-    if len(filename) > 100:
-        filename = filename[:100]
-    
-    return filename
-
-def cleanup_temp_files(temp_files_list, keep_final_video=True):
-    """Clean up temporary files after processing."""
-    cleaned_files = []
-    for file_path in temp_files_list:
-        if os.path.exists(file_path):
-            try:
-                # Don't delete the final video if keep_final_video is True
-                if keep_final_video and file_path.endswith('.mp4') and 'arabic dub' in file_path:
-                    continue
-                    
-                os.remove(file_path)
-                cleaned_files.append(file_path)
-            except Exception as e:
-                st.warning(f"Could not remove {file_path}: {e}")
-    
-    if cleaned_files:
-        st.info(f"🧹 Cleaned up {len(cleaned_files)} temporary files")
-    
-    return cleaned_files
-
-def cleanup_demucs_output():
-    """Clean up Demucs output directory."""
-    demucs_dir = "demucs_output"
-    if os.path.exists(demucs_dir):
-        try:
-            shutil.rmtree(demucs_dir)
-            st.info("🧹 Cleaned up Demucs output directory")
-        except Exception as e:
-            st.warning(f"Could not remove Demucs directory: {e}")
+from youtube_utils import YouTubeDownload, DEFAULT_DOWNLOAD_DIR, get_video_title, sanitize_filename, prune_downloads
+from media_ingest import ingest_upload, probe_media, has_stream, DEFAULT_UPLOAD_DIR
 
 # Load environment variables
 load_dotenv()
@@ -181,10 +29,87 @@ if not fanar_api_key:
     st.error("FANAR_API_KEY not found in environment variables. Please set it in your .env file.")
     st.stop()
 
-client = FanarAPIClient(fanar_api_key)
+
+@st.cache_resource
+def get_job_manager():
+    """Job manager shared by every session on this server."""
+    return JobManager(
+        jobs_dir=os.getenv("DUBBING_JOBS_DIR", DEFAULT_JOBS_DIR),
+        max_workers=int(os.getenv("DUBBING_MAX_JOBS", str(DEFAULT_MAX_WORKERS)))
+    )
+
+
+@st.cache_resource
+def get_stage_cache():
+    """Stage artifact cache, so reruns restore unchanged stages instead of recomputing them."""
+    return StageCache(
+        cache_dir=os.getenv("STAGE_CACHE_DIR", DEFAULT_CACHE_DIR),
+        max_bytes=int(float(os.getenv("STAGE_CACHE_MAX_GB", "5")) * 1024 ** 3),
+        max_age=int(float(os.getenv("STAGE_CACHE_MAX_AGE_DAYS", "7")) * 24 * 3600)
+    )
+
+
+@st.cache_resource
+def get_client(api_key):
+    """Fanar client shared by every session, so its connection pool is reused across reruns."""
+    response_cache = None
+    if os.getenv("FANAR_RESPONSE_CACHE", "").lower() in ("1", "true", "yes"):
+        response_cache = ResponseCache(
+            os.getenv("FANAR_RESPONSE_CACHE_PATH", DEFAULT_CACHE_PATH),
+            max_bytes=int(float(os.getenv("FANAR_RESPONSE_CACHE_MAX_MB", "512")) * 1024 ** 2)
+        )
+    return FanarAPIClient(
+        api_key,
+        pool_size=int(os.getenv("FANAR_POOL_SIZE", "10")),
+        max_retries=int(os.getenv("FANAR_MAX_RETRIES", "3")),
+        response_cache=response_cache
+    )
+
+
+@st.cache_resource
+def get_separation_service():
+    """Warm Demucs workers shared by every session, or None to fall back to the Demucs CLI."""
+    if not demucs_available():
+        return None
+    service = SeparationService(
+        workers=int(os.getenv("DEMUCS_WORKERS", "0")) or None,
+        segment_seconds=float(os.getenv("DEMUCS_SEGMENT_SECONDS", "30"))
+    )
+    service.warm_up(block=False)
+    return service
+
+
+@st.cache_resource
+def get_metrics_server():
+    """Prometheus metrics endpoint, started once per server when DUBBING_METRICS_PORT is set."""
+    port = os.getenv("DUBBING_METRICS_PORT")
+    host = os.getenv("DUBBING_METRICS_HOST", "127.0.0.1")
+    return start_metrics_server(int(port), host) if port else None
+
+
+client = get_client(fanar_api_key)
+job_manager = get_job_manager()
+stage_cache = get_stage_cache()
+separation_service = get_separation_service()
+get_metrics_server()
+
+# Workspaces of jobs finished more than a day ago are removed
+job_manager.prune(max_age=24 * 3600)
+
+
+def get_input_job(input_key):
+    """Return the job for the current input, creating a new one when the input changes."""
+    job = job_manager.get(st.session_state.get("job_id", ""))
+    if job is None or st.session_state.get("input_key") != input_key:
+        job = job_manager.create_job()
+        st.session_state["job_id"] = job.job_id
+        st.session_state["input_key"] = input_key
+        for name in ("input_video_path", "source_audio_path", "youtube_download", "upload_name", "media_probe"):
+            st.session_state.pop(name, None)
+    return job
+
 
 st.subheader("Step 1: Choose Video Input")
-input_video_path = None
 
 # YouTube URL input
 youtube_url = st.text_input("Paste a YouTube video URL", placeholder="https://www.youtube.com/watch?v=...")
@@ -197,40 +122,93 @@ if youtube_url and video_file:
     st.warning("Both YouTube URL and file upload detected. YouTube URL will take precedence.")
     video_file = None
 
+job = None
 if youtube_url:
-    if st.button("Download from YouTube"):
-        with st.spinner("Downloading video from YouTube..."):
+    job = get_input_job(("youtube", youtube_url))
+    if "input_video_path" not in st.session_state and st.button("Download from YouTube"):
+        with st.spinner("Downloading audio from YouTube..."):
             try:
-                input_video_path = download_youtube_video(youtube_url)
-                st.success(f"YouTube video downloaded successfully!")
-                st.info(f"Video saved as: {input_video_path}")
+                youtube_cache_dir = os.getenv("YOUTUBE_CACHE_DIR", DEFAULT_DOWNLOAD_DIR)
+                # Downloads unused for a week, or beyond the size budget, are removed
+                prune_downloads(youtube_cache_dir)
+                # Audio first, so dubbing can start while the video keeps downloading
+                download = YouTubeDownload(youtube_url, cache_dir=youtube_cache_dir, log=st.info)
+                st.session_state["source_audio_path"] = download.download_audio()
+                st.session_state["input_video_path"] = download.video_path
+                st.session_state["youtube_download"] = download
+                st.success("YouTube audio downloaded! The video keeps downloading in the background.")
             except Exception as e:
                 st.error(f"Download failed: {str(e)}")
                 st.stop()
 elif video_file:
-    input_video_path = "uploaded_video.mp4"
-    with open(input_video_path, "wb") as f:
-        f.write(video_file.read())
-    st.success("Video uploaded successfully!")
-
-# Process the video if we have one
-if input_video_path and os.path.exists(input_video_path):
+    job = get_input_job(("upload", video_file.file_id))
+    if "input_video_path" not in st.session_state:
+        # Copied in blocks and hashed in the same pass; identical uploads are stored once
+        uploaded_path, upload_hash, existed = ingest_upload(
+            video_file, upload_dir=os.getenv("DUBBING_UPLOAD_DIR", DEFAULT_UPLOAD_DIR)
+        )
+        stage_cache.remember_file_hash(uploaded_path, upload_hash)
+        try:
+            media_probe = probe_media(uploaded_path)
+        except Exception as e:
+            st.error(f"Could not read the uploaded video: {str(e)}")
+            st.stop()
+        if not has_stream(media_probe, "audio"):
+            st.error("The uploaded video has no audio track to dub.")
+            st.stop()
+        st.session_state["input_video_path"] = uploaded_path
+        st.session_state["upload_name"] = video_file.name
+        st.session_state["media_probe"] = media_probe
+        st.success("Video already uploaded earlier, reusing it!" if existed else "Video uploaded successfully!")
+
+input_video_path = st.session_state.get("input_video_path") if job else None
+source_audio_path = st.session_state.get("source_audio_path") if job else None
+youtube_download = st.session_state.get("youtube_download") if job else None
+media_probe = st.session_state.get("media_probe") if job else None
+
+# Process the video if we have one (a YouTube video may still be downloading)
+if input_video_path and (youtube_download is not None or os.path.exists(input_video_path)):
     st.success("✅ Video ready for processing!")
     
     # Extract video title for final filename
-    video_title = get_video_title(input_video_path, youtube_url)
+    if youtube_download is not None:
+        video_title = youtube_download.metadata["title"]
+    else:
+        video_title = get_video_title(st.session_state.get("upload_name") or input_video_path, log=st.warning)
     sanitized_title = sanitize_filename(video_title)
-    final_video_filename = f"{sanitized_title} - arabic dub.mp4"
+    target_languages = st.multiselect(
+        "Dub into:",
+        list(LANGUAGES),
+        default=list(DEFAULT_TARGET_LANGUAGES),
+        format_func=lambda code: language_info(code)[0],
+        help="Each language gets its own audio track in the video; the first one is played by default",
+        disabled=job.is_active
+    ) or list(DEFAULT_TARGET_LANGUAGES)
+    final_video_filename = f"{sanitized_title} - {dub_suffix(target_languages)}.mp4"
     
     # Show video info
-    file_size = os.path.getsize(input_video_path) / (1024 * 1024)  # MB
-    st.info(f"📁 Video file: {input_video_path} ({file_size:.2f} MB)")
+    if os.path.exists(input_video_path):
+        file_size = os.path.getsize(input_video_path) / (1024 * 1024)  # MB
+        st.info(f"📁 Video file: {input_video_path} ({file_size:.2f} MB)")
+    else:
+        st.info("📥 Video stream is still downloading; dubbing can start from the audio already")
+    if media_probe is not None:
+        streams = ", ".join(
+            f"{stream['type']} ({stream['codec']})" for stream in media_probe["streams"] if stream["type"] in ("audio", "video")
+        )
+        duration = f"{media_probe['duration']:.1f} s" if media_probe["duration"] is not None else "unknown duration"
+        st.info(f"⏱️ {duration}, streams: {streams}")
     st.info(f"🎬 Video title: {video_title}")
     st.info(f"📝 Final output will be: {final_video_filename}")
     
     # Optional: Show video preview
     if st.checkbox("Show video preview"):
-        st.video(input_video_path)
+        if youtube_download is None:
+            st.video(input_video_path)
+        elif youtube_download.video_done:
+            st.video(youtube_download.muxed_path())
+        else:
+            st.info("The preview is available once the video has downloaded.")
     
     st.subheader("Step 2: Processing Pipeline")
     
@@ -238,216 +216,144 @@ if input_video_path and os.path.exists(input_video_path):
     st.write("**Processing Options:**")
     auto_cleanup = st.checkbox("🧹 Enable automatic cleanup of temporary files", value=True, 
                               help="Automatically remove temporary files after processing is complete")
+    detect_music = st.checkbox("🎵 Skip music separation when no background music is detected", value=True,
+                               help="A quick spectral check decides whether Demucs separation and music mixing are needed")
     
-    # File paths
-    audio_file = "english_audio.wav"
-    transcription_file = "transcription.txt"
-    translation_file = "translation.txt"
-    tts_output_file = "arabic_speech.wav"
-    audioless_video_file = "audioless_video.mp4"
-    output_file = final_video_filename
-
-    # Step 1: Extract audio
-    with st.spinner("Extracting audio from video..."):
-        try:
-            extract_audio_from_video(input_video_path, audio_file)
-            st.success("Audio extracted!")
-        except Exception as e:
-            st.error(f"Audio extraction failed: {e}")
-            st.stop()
-
-    # Step 1.5: Separate music from English audio using Demucs
-    with st.spinner("Separating music from English audio..."):
-        try:
-            music_path = separate_music_with_demucs(audio_file)
-            st.success("Music separated from English audio!")
-        except Exception as e:
-            st.error(f"Music separation failed: {e}")
-            st.stop()
-
-    # Step 2: Transcribe audio
-    with st.spinner("Transcribing audio to text..."):
-        try:
-            # Determine audio duration and select appropriate model
-            audio_duration = get_audio_duration(audio_file)
-            auto_selected_model = select_transcription_model(audio_duration)
-            
-            if audio_duration:
-                st.info(f"Audio duration: {audio_duration:.1f} seconds")
-            
-            # Allow user to override model selection
-            st.subheader("Transcription Model Selection")
-            st.write("**Available Models:**")
-            st.write("- **Fanar-Aura-STT-1**: Optimized for short audio clips (up to 20-30 seconds)")
-            st.write("- **Fanar-Aura-STT-LF-1**: Optimized for long-form transcription of longer audio files")
-            
-            model_options = ["Auto-select (Recommended)", "Fanar-Aura-STT-1", "Fanar-Aura-STT-LF-1"]
-            selected_model_option = st.selectbox(
-                "Choose transcription model:",
-                model_options,
-                index=0
-            )
-            
-            if selected_model_option == "Auto-select (Recommended)":
-                selected_model = auto_selected_model
-                st.info(f"Auto-selected model: {selected_model}")
-            else:
-                selected_model = selected_model_option
-                st.info(f"Manually selected model: {selected_model}")
-            
-            transcription_result = client.transcribe_audio_fanar(audio_file, model=selected_model)
-            transcription_text = transcription_result.get("text", "")
-            if not transcription_text:
-                transcription_text = str(transcription_result)
-            save_text_to_file(transcription_text, transcription_file)
-            st.success("Transcription complete!")
-            st.text_area("Transcription (English)", transcription_text, height=150)
-        except Exception as e:
-            st.error(f"Transcription failed: {e}")
-            st.stop()
-
-    # Step 3: Add grammar to transcription
-    with st.spinner("Improving transcription grammar..."):
-        try:
-            messages = [
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": f"Add grammar to the following transcription:\n\n{transcription_text}"}
-            ]
-            grammar_result = client.fanar_chat(messages, model="Fanar")
-            grammar_text = grammar_result.get("reply", "")
-            if not grammar_text:
-                grammar_text = transcription_text
-            save_text_to_file(grammar_text, transcription_file)
-            st.success("Grammar improved!")
-            st.text_area("Grammar-Enhanced Transcription", grammar_text, height=150)
-        except Exception as e:
-            st.error(f"Grammar improvement failed: {e}")
-            st.stop()
-
-    # Step 4: Translate to Arabic
-    with st.spinner("Translating to Arabic..."):
-        try:
-            translated_text = client.translate_text(grammar_text)
-            save_text_to_file(translated_text, translation_file)
-            st.success("Translation complete!")
-            st.text_area("Translation (Arabic)", translated_text, height=150)
-        except Exception as e:
-            st.error(f"Translation failed: {e}")
-            st.stop()
-
-    # Step 5: Improve Arabic for TTS
-    with st.spinner("Improving Arabic for TTS..."):
-        try:
-            messages = [
-                {"role": "system", "content": "أنت مساعد لغوي مختص بتحسين النصوص لتحويلها إلى كلام (TTS) بطريقة طبيعية وسلسة."},
-                {"role": "user", "content": f"""قم بإعادة صياغة هذا النص ليكون أكثر سلاسة وطبيعية عند النطق لتحسين أداء تحويل النص إلى كلام (TTS)، ويجب أن يكون النص الناتج أكثر إيجازًا واختصارًا من النص الأصلي، مع الحفاظ على المعنى الأساسي. استخدم جملاً قصيرة، وتجنّب التعقيد أو الكلمات الزائدة. لا تضف مقدمات أو تعليقات أو اقتباسات — فقط أرجع النص المحسّن النهائي.\n\nالنص:\n{translated_text}"""}
-            ]
-            grammar_result = client.fanar_chat(messages, model="Fanar")
-            grammar_text = grammar_result.get("reply", "")
-            if not grammar_text:
-                grammar_text = translated_text
-            save_text_to_file(grammar_text, translation_file)
-            st.success("Arabic improved for TTS!")
-            st.text_area("TTS-Optimized Arabic", grammar_text, height=150)
-        except Exception as e:
-            st.error(f"Arabic TTS improvement failed: {e}")
-            st.stop()
+    # Allow user to override model selection
+    st.write("**Transcription Model Selection**")
+    st.write("- **Fanar-Aura-STT-1**: Optimized for short audio clips (up to 20-30 seconds)")
+    st.write("- **Fanar-Aura-STT-LF-1**: Optimized for long-form transcription of longer audio files")
+    st.write("- **Chunked parallel**: Splits audio at silences into clips of up to 30 seconds and transcribes them concurrently, with timestamps")
+    model_options = [AUTO_MODEL, "Fanar-Aura-STT-1", "Fanar-Aura-STT-LF-1", CHUNKED_MODE]
+    selected_model_option = st.selectbox(
+        "Choose transcription model:",
+        model_options,
+        index=0,
+        disabled=job.is_active
+    )
 
-    # Step 5.5: Extract quoted text for TTS, or use full text if no quotes found
-    quoted_texts = re.findall(r'"([^"]+)"|"([^"]+)"|«([^»]+)»', grammar_text)
-    # Flatten and join all non-empty matches
-    speech_text = ' '.join([t for group in quoted_texts for t in group if t])
-    
-    if not speech_text:
-        # If no quoted text found, use the full improved text
-        speech_text = grammar_text
-        st.info("No text found in quotation marks. Using full text for TTS.")
-        st.text_area("Text to be used for TTS (full text)", speech_text, height=100)
-    else:
-        st.text_area("Text to be used for TTS (from quotes only)", speech_text, height=100)
+    tts_mode = st.radio(
+        "Speech synthesis:",
+        [TTS_SENTENCES, TTS_WHOLE],
+        help="Sentence-level TTS synthesizes sentences concurrently and places each at its original time",
+        disabled=job.is_active
+    )
 
-    # Step 6: Text-to-Speech
-    if speech_text:
-        with st.spinner("Converting Arabic text to speech..."):
-            try:
-                output_audio = client.text_to_speech(speech_text, tts_output_file)
-                st.success("TTS complete!")
-                audio_file_display = open(tts_output_file, 'rb')
-                st.audio(audio_file_display.read(), format='audio/wav')
-            except Exception as e:
-                st.error(f"TTS failed: {e}")
-                st.stop()
-    else:
-        st.error("No text available for TTS. This should not happen.")
-        st.stop()
-
-    # Step 6.5: Match TTS audio duration to original audio
-    try:
-        # Load original and TTS audio
-        original_audio = AudioSegment.from_file(audio_file)
-        tts_audio = AudioSegment.from_file(tts_output_file)
-        target_duration = len(original_audio)  # in milliseconds
-        tts_duration = len(tts_audio)
-
-        if tts_duration < target_duration:
-            # Pad with silence at the end
-            silence = AudioSegment.silent(duration=target_duration - tts_duration)
-            adjusted_audio = tts_audio + silence
-        else:
-            # Trim to target duration
-            adjusted_audio = tts_audio[:target_duration]
-
-        # Save adjusted audio
-        adjusted_audio.export(tts_output_file, format="wav")
-        st.info(f"TTS audio adjusted to {target_duration/1000:.2f} seconds to match original audio.")
-    except Exception as e:
-        st.error(f"Audio duration adjustment failed: {e}")
-        st.stop()
-
-    # Step 6.6: Mix separated music with Arabic TTS audio
-    if music_path:
-        try:
-            mixed_tts_music_path = "arabic_speech_with_music.wav"
-            mix_music_and_tts(music_path, tts_output_file, mixed_tts_music_path)
-            tts_output_file = mixed_tts_music_path  # Use mixed audio for final video
-            st.success("Music mixed with Arabic TTS audio!")
-        except Exception as e:
-            st.error(f"Mixing music with TTS audio failed: {e}")
-            st.stop()
+    max_stretch = st.slider(
+        "Maximum speech speed change",
+        min_value=1.0, max_value=1.5, value=1.3, step=0.05,
+        help="Speech longer than its time slot is sped up by at most this factor without changing pitch",
+        disabled=job.is_active
+    )
 
-    # Step 7: Combine audio and video
-    with st.spinner("Combining dubbed audio with video..."):
-        try:
-            combine_audio_video(tts_output_file, "audioless_video.mp4", output_file)
-            st.success("Dubbed video created!")
+    pipeline_options = dict(
+        transcription_model=selected_model_option,
+        tts_mode=tts_mode,
+        max_stretch=max_stretch,
+        separator=separation_service,
+        detect_music=detect_music,
+        source_audio_path=source_audio_path,
+        video_ready=youtube_download.wait_video if youtube_download is not None else None,
+        auto_cleanup=auto_cleanup,
+        target_languages=target_languages
+    )
+    start_label = "Start dubbing" if job.status not in (STATUS_COMPLETED, STATUS_FAILED) else "Run again"
+    if st.button(start_label, disabled=job.is_active):
+        job_manager.submit(
+            job,
+            run_dubbing_job,
+            client,
+            stage_cache,
+            input_video_path,
+            final_video_filename,
+            **pipeline_options
+        )
+
+    # Show job progress; the job runs in the background, so reruns only re-render its status
+    state = job.snapshot()
+    if state["status"] != STATUS_PENDING:
+        outputs = state["outputs"]
+        job_languages = outputs.get("languages", [])
+        for level, message in state["messages"]:
+            getattr(st, level, st.info)(message)
+        for name, label in (("transcription", "Transcription (English)"), ("grammar", "Grammar-Enhanced Transcription")):
+            if name in outputs:
+                st.text_area(label, outputs[name], height=150)
+        if "segments" in outputs:
+            with st.expander("Transcription segments"):
+                st.dataframe(outputs["segments"])
+        # Per-language outputs are published as "<output>.<language code>"
+        for lang in job_languages:
+            language = language_info(lang)[0]
+            if len(job_languages) > 1:
+                st.markdown(f"**{language}**")
+            if f"translation.{lang}" in outputs:
+                st.text_area(f"Translation ({language})", outputs[f"translation.{lang}"], height=150)
+            if f"tts_text.{lang}" in outputs and state["status"] != STATUS_COMPLETED:
+                # Editable once the job completes, for re-dubbing
+                st.text_area(f"TTS-Optimized {language}", outputs[f"tts_text.{lang}"], height=150)
+            if f"speech_text.{lang}" in outputs:
+                st.text_area(
+                    f"Text to be used for {language} TTS ({outputs[f'speech_source.{lang}']})",
+                    outputs[f"speech_text.{lang}"],
+                    height=100
+                )
+            if f"tts_timeline.{lang}" in outputs:
+                with st.expander(f"Speech timeline ({language})"):
+                    st.dataframe(outputs[f"tts_timeline.{lang}"])
+            if os.path.exists(outputs.get(f"tts_audio.{lang}") or ""):
+                # A path: Streamlit serves the file without it being held in the job's outputs
+                st.audio(outputs[f"tts_audio.{lang}"], format='audio/wav')
+        if state["outputs"].get("timings"):
+            with st.expander("Stage timings", expanded=state["status"] == STATUS_COMPLETED):
+                st.dataframe(state["outputs"]["timings"])
+                if state["outputs"].get("critical_path"):
+                    # Stages overlap; only these set the job's length
+                    st.caption("Critical path")
+                    st.dataframe(state["outputs"]["critical_path"])
+                if "trace" in state["outputs"]:
+                    st.caption(f"Full trace: `{state['outputs']['trace']}` (open in chrome://tracing or Perfetto)")
+
+        if job.is_active:
+            position = f" ({job_manager.queue_depth()} job(s) queued)" if state["status"] == STATUS_QUEUED else ""
+            st.info(f"⏳ Job {state['job_id']} is {state['status']}{position}: {state['stage'] or 'waiting for a worker'}")
+            with st.expander("Fanar API limits"):
+                st.dataframe([{"endpoint": endpoint, **stats} for endpoint, stats in limiter_stats().items()])
+            time.sleep(1)
+            st.rerun()
+        elif state["status"] == STATUS_FAILED:
+            st.error(state["error"])
+        elif state["status"] == STATUS_COMPLETED:
+            output_file = state["result"]
+            # Named after the languages this job ran with, which the selection above may no longer match
+            job_video_filename = f"{sanitized_title} - {dub_suffix(job_languages)}.mp4"
             with open(output_file, "rb") as f:
-                st.download_button("Download Dubbed Video", f, file_name=final_video_filename)
-            
-            # Automatic cleanup of temporary files
+                st.download_button("Download Dubbed Video", f, file_name=job_video_filename)
+
+            # Fixing a few words re-synthesizes only the sentences that changed
+            edited_texts = {}
+            for lang in job_languages:
+                tts_text = outputs.get(f"tts_text.{lang}", "")
+                edited_text = st.text_area(
+                    f"TTS-Optimized {language_info(lang)[0]} (edit and re-dub)", tts_text, height=150,
+                    key=f"edit_{job.job_id}_{lang}_{hash(tts_text)}"
+                )
+                if edited_text.strip() != tts_text.strip():
+                    edited_texts[lang] = edited_text
+            if st.button("Re-dub with edited text", disabled=not edited_texts):
+                job_manager.submit(
+                    job,
+                    run_dubbing_job,
+                    client,
+                    stage_cache,
+                    input_video_path,
+                    job_video_filename,
+                    **{**pipeline_options, "target_languages": job_languages},
+                    edited_texts=edited_texts
+                )
+                st.rerun()
             if auto_cleanup:
-                st.subheader("🧹 Cleanup")
-                temp_files = [
-                    audio_file,
-                    transcription_file,
-                    translation_file,
-                    tts_output_file,
-                    audioless_video_file,
-                    "arabic_speech_with_music.wav"
-                ]
-                
-                # Add music path if it exists
-                if 'music_path' in locals() and music_path and os.path.exists(music_path):
-                    temp_files.append(music_path)
-                
-                # Clean up temporary files
-                cleaned_files = cleanup_temp_files(temp_files, keep_final_video=True)
-                cleanup_demucs_output()
-                
                 st.success("✅ Processing complete! Temporary files have been cleaned up.")
             else:
                 st.success("✅ Processing complete! Temporary files have been preserved.")
-                st.info("💡 You can run the cleanup script later: `python cleanup.py`")
-            
-        except Exception as e:
-            st.error(f"Combining audio and video failed: {e}")
-            st.stop()
\ No newline at end of file
+                st.info(f"💡 Job files are in `{job.workspace.root}`. You can run the cleanup script later: `python cleanup.py`")
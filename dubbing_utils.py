@@ -1,19 +1,344 @@
+import json
 import requests
+from requests.adapters import HTTPAdapter
 import os
-from moviepy import VideoFileClip, AudioFileClip
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
+from pydub import AudioSegment
 import subprocess
+import glob
+import wave
+from contextlib import closing
+import numpy as np
+
+import tracing
+from audio_store import open_audio, read_wav_header, WavStreamDecoder
+from media_ingest import probe_media
+from stage_cache import hash_file
+from rate_limiter import shared_limiters
+
+
+# Fanar API root; FANAR_BASE_URL points the clients elsewhere (e.g. the benchmark mock server)
+DEFAULT_BASE_URL = "https://api.fanar.qa/v1"
+
+# (connect, read) timeouts in seconds per endpoint
+DEFAULT_TIMEOUTS = {
+    "chat": (10, 120),
+    "transcription": (10, 300),
+    "translation": (10, 120),
+    "speech": (10, 180),
+}
+
+# MIME types of audio formats accepted by the transcription endpoint
+AUDIO_MIME_TYPES = {
+    '.wav': 'audio/wav',
+    '.mp3': 'audio/mpeg',
+    '.m4a': 'audio/m4a',
+    '.flac': 'audio/flac',
+    '.ogg': 'audio/ogg',
+    '.webm': 'audio/webm'
+}
+
+# Status codes worth retrying: throttling and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Speech is uploaded for transcription as 16 kHz mono, transcoded on the fly into one
+# of these formats (keys of AUDIO_MIME_TYPES); other formats upload the file unchanged
+STT_UPLOAD_FORMAT = '.flac'
+STT_UPLOAD_SAMPLE_RATE = 16000
+UPLOAD_ENCODERS = {
+    '.flac': ['-c:a', 'flac', '-f', 'flac'],
+    '.ogg': ['-c:a', 'libopus', '-b:a', '32k', '-application', 'voip', '-f', 'ogg'],
+    '.webm': ['-c:a', 'libopus', '-b:a', '32k', '-application', 'voip', '-f', 'webm'],
+}
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Binary responses (synthesized speech) are written to disk in blocks of this size
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_UPLOAD_MB = 50
+
+
+def backoff_delay(attempt, base, maximum):
+    """Full-jitter exponential backoff delay in seconds for a retry attempt."""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+def parse_retry_after(value, maximum):
+    """
+    Parse a Retry-After header value into a delay in seconds.
+    
+    Args:
+        value (str): Header value, either seconds or an HTTP date
+        maximum (float): Upper bound for the returned delay
+        
+    Returns:
+        float: Delay in seconds, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0), maximum)
+
+
+def upload_passthrough(file_path, upload_format=STT_UPLOAD_FORMAT):
+    """
+    Whether a file can be uploaded for transcription as it is: formats without
+    an encoder always are, other files only when they are already in
+    upload_format with a single 16 kHz mono audio stream.
+    """
+    if upload_format not in UPLOAD_ENCODERS:
+        return True
+    if os.path.splitext(file_path)[1].lower() != upload_format:
+        return False
+    try:
+        streams = probe_media(file_path)["streams"]
+    except Exception:
+        # Unreadable header: ffmpeg decides while transcoding
+        return False
+    return (len(streams) == 1 and streams[0]["type"] == "audio"
+            and streams[0]["sample_rate"] == STT_UPLOAD_SAMPLE_RATE and streams[0]["channels"] == 1)
+
+
+def iter_upload_audio(file_path, upload_format=STT_UPLOAD_FORMAT, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Yield the audio of a file as it should be uploaded for transcription.
+    
+    The audio is transcoded by ffmpeg to 16 kHz mono in upload_format and read
+    from its stdout as it is encoded, so no transcoded file is written. Files
+    already in that form (see upload_passthrough), or formats without an
+    encoder, are read as they are.
+    
+    Args:
+        file_path (str): Path to any audio file ffmpeg can read
+        upload_format (str): Extension of the upload format, a key of UPLOAD_ENCODERS
+        chunk_size (int): Bytes per yielded chunk
+        
+    Yields:
+        bytes: Consecutive chunks of the encoded audio
+    """
+    if upload_passthrough(file_path, upload_format):
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+    
+    encoder = UPLOAD_ENCODERS[upload_format]
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin', '-i', file_path, '-vn',
+               '-ac', '1', '-ar', str(STT_UPLOAD_SAMPLE_RATE)] + encoder + ['pipe:1']
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise Exception(f"FFMPEG error: {stderr.decode(errors='replace')}")
+    finally:
+        # Also reached when the upload is abandoned part way
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def multipart_stream(fields, file_field, filename, mime_type, chunks, boundary):
+    """
+    Yield a multipart/form-data body whose file part is streamed from chunks.
+    
+    Args:
+        fields (dict): Plain form fields
+        file_field (str): Name of the file field
+        filename (str): File name sent with the file part
+        mime_type (str): Content type of the file part
+        chunks (iterable): Bytes of the file
+        boundary (str): Multipart boundary, also set in the Content-Type header
+    """
+    for name, value in fields.items():
+        yield f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+    yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+           f'Content-Type: {mime_type}\r\n\r\n').encode('utf-8')
+    yield from chunks
+    yield f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+
+def save_response(response, output_file, on_chunk=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Write a streamed response body to a file as it arrives.
+    
+    The body is written aside and renamed into place once complete, so a
+    failed download never leaves a truncated file and an existing file
+    that is still mapped stays valid. Memory holds one chunk at a time.
+    
+    Args:
+        response (requests.Response): Response opened with stream=True
+        output_file (str): Destination path
+        on_chunk (callable): Called with every chunk after it is written
+        chunk_size (int): Bytes per read
+        
+    Returns:
+        int: Bytes received
+    """
+    temp_file = f"{output_file}.{os.getpid()}.{threading.get_ident()}.part"
+    received = 0
+    try:
+        with open(temp_file, "wb") as f:
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+                received += len(chunk)
+                if on_chunk is not None:
+                    on_chunk(chunk)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    return received
 
 
 class FanarAPIClient:
     """Client for interacting with Fanar API services."""
     
-    def __init__(self, api_key):
+    def __init__(self, api_key, pool_size=10, timeouts=None, max_retries=3, backoff_base=1.0, backoff_max=60.0,
+                 response_cache=None, rate_limits=None, base_url=None, stt_upload_format=None,
+                 max_upload_mb=None):
+        """
+        Args:
+            api_key (str): Fanar API key
+            pool_size (int): Maximum number of kept-alive connections
+            timeouts (dict): (connect, read) timeouts per endpoint, overriding DEFAULT_TIMEOUTS
+            max_retries (int): Retries on 429/5xx responses and connection errors
+            backoff_base (float): Base delay in seconds for exponential backoff
+            backoff_max (float): Upper bound in seconds for a single retry delay
+            response_cache (ResponseCache): Optional store of responses to identical requests
+            rate_limits (dict): (requests per second, burst) per endpoint for limiters not
+                created yet, defaulting to FANAR_RATE_LIMITS over DEFAULT_RATE_LIMITS; the
+                limiters are shared by every client in the process
+            base_url (str): API root, defaulting to FANAR_BASE_URL or DEFAULT_BASE_URL
+            stt_upload_format (str): Format speech is transcoded to for transcription (see
+                UPLOAD_ENCODERS), defaulting to FANAR_STT_UPLOAD_FORMAT or STT_UPLOAD_FORMAT
+            max_upload_mb (float): Largest transcription upload, defaulting to
+                FANAR_MAX_UPLOAD_MB or DEFAULT_MAX_UPLOAD_MB; 0 disables the limit
+        """
         if not api_key:
             raise ValueError("API key is required")
         self.api_key = api_key
-        self.base_url = "https://api.fanar.qa/v1"
+        self.base_url = base_url or os.getenv("FANAR_BASE_URL", DEFAULT_BASE_URL)
+        self.stt_upload_format = stt_upload_format or os.getenv("FANAR_STT_UPLOAD_FORMAT", STT_UPLOAD_FORMAT)
+        if max_upload_mb is None:
+            max_upload_mb = float(os.getenv("FANAR_MAX_UPLOAD_MB", DEFAULT_MAX_UPLOAD_MB))
+        self.max_upload_bytes = int(max_upload_mb * 1024 * 1024)
         self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.response_cache = response_cache
+        self.limiters = shared_limiters(rate_limits)
+
+        # One pooled session reuses TCP+TLS connections across calls
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(self.headers)
+    
+    def close(self):
+        """Close pooled connections."""
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _post(self, endpoint, url, build_body=None, **kwargs):
+        """
+        POST through the pooled session, retrying 429/5xx responses and
+        connection errors with jittered exponential backoff. Every attempt
+        waits for the endpoint's shared rate and concurrency limits.
+        
+        Args:
+            endpoint (str): Endpoint name used to look up timeouts
+            url (str): Request URL
+            build_body (callable): Builds a fresh streamed body (an iterable of bytes)
+                for each attempt, since a generator cannot be rewound
+            **kwargs: Passed on to requests.Session.post
+            
+        Returns:
+            requests.Response: The last response received
+        """
+        kwargs.setdefault("timeout", self.timeouts[endpoint])
+        for attempt in range(self.max_retries + 1):
+            # Rewind uploaded files so a retry sends the whole body again
+            for file_spec in (kwargs.get("files") or {}).values():
+                if isinstance(file_spec, tuple) and hasattr(file_spec[1], "seek"):
+                    file_spec[1].seek(0)
+            if build_body is not None:
+                kwargs["data"] = build_body()
+            
+            try:
+                with self.limiters[endpoint].slot() as record:
+                    response = self.session.post(url, **kwargs)
+                    record(response.status_code)
+                if tracing.enabled():
+                    # Streamed bodies count their own bytes as they are sent or received
+                    body = response.request.body
+                    tracing.current_span().add(bytes_out=len(body) if isinstance(body, (bytes, str)) else 0,
+                                               bytes_in=0 if kwargs.get("stream") else len(response.content))
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == self.max_retries:
+                    raise
+                tracing.current_span().add(retries=1)
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                print(f"{endpoint} request failed ({e}), retrying in {delay:.1f}s")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+                delay = parse_retry_after(response.headers.get("Retry-After"), self.backoff_max)
+                if delay is None:
+                    delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                print(f"{endpoint} request returned {response.status_code}, retrying in {delay:.1f}s")
+                tracing.current_span().add(retries=1)
+                response.close()
+            time.sleep(delay)
+    
+    def _fetch(self, endpoint, model, payload, request):
+        """
+        Return the response body of request(), served from the response cache
+        when one is configured and an identical request was answered before.
+        
+        Args:
+            endpoint (str): Endpoint name
+            model (str): Model name
+            payload (dict): Request parameters that determine the response
+            request (callable): Sends the request and returns the body of a successful response
+            
+        Returns:
+            bytes: Response body
+        """
+        with tracing.span(f"fanar.{endpoint}", kind="api", endpoint=endpoint, model=model, cached=True) as span:
+            def upstream():
+                span.set(cached=False)
+                return request()
+
+            if self.response_cache is None:
+                return upstream()
+            key = self.response_cache.make_key(endpoint, model, payload)
+            return self.response_cache.fetch(key, endpoint, upstream)
     
     def fanar_chat(self, messages, model="Fanar", max_tokens=1000):
         """
@@ -30,17 +355,19 @@ class FanarAPIClient:
         
         data = {
             "model": model,
-            "messages": messages
+            "messages": messages,
+            "max_tokens": max_tokens
         }
         
-        try:
-            response = requests.post(url, headers=self.headers, json=data)
+        def request():
+            response = self._post("chat", url, json=data)
             response.raise_for_status()
-            result = response.json()
-            
-            if 'choices' not in result or len(result['choices']) == 0:
+            if not response.json().get('choices'):
                 raise Exception("No choices found in response")
-                
+            return response.content
+        
+        try:
+            result = json.loads(self._fetch("chat", model, data, request))
             reply = result['choices'][0]['message']['content']
             return {"reply": reply}
         except requests.exceptions.RequestException as e:
@@ -66,50 +393,49 @@ class FanarAPIClient:
             if not os.path.exists(file_path):
                 raise Exception(f"Audio file not found: {file_path}")
             
-            # Get file size to help choose the right model
-            file_size = os.path.getsize(file_path)
-            print(f"Audio file size: {file_size} bytes")
-            
-            # Detect file type from extension
+            # Speech is transcoded while it uploads; formats without an encoder go as they are
             file_ext = os.path.splitext(file_path)[1].lower()
+            upload_format = self.stt_upload_format if self.stt_upload_format in UPLOAD_ENCODERS else file_ext
+            mime_type = AUDIO_MIME_TYPES.get(upload_format, 'audio/wav')
+            filename = os.path.splitext(os.path.basename(file_path))[0] + upload_format
+            boundary = os.urandom(16).hex()
+            print(f"Audio file size: {os.path.getsize(file_path)} bytes, uploading as {upload_format}")
             
-            # Set appropriate MIME type
-            mime_types = {
-                '.wav': 'audio/wav',
-                '.mp3': 'audio/mpeg',
-                '.m4a': 'audio/m4a',
-                '.flac': 'audio/flac',
-                '.ogg': 'audio/ogg',
-                '.webm': 'audio/webm'
-            }
-            
-            mime_type = mime_types.get(file_ext, 'audio/wav')
+            def upload_body():
+                sent = 0
+                for chunk in iter_upload_audio(file_path, upload_format):
+                    sent += len(chunk)
+                    if self.max_upload_bytes and sent > self.max_upload_bytes:
+                        raise ValueError(
+                            f"Upload exceeds {self.max_upload_bytes} bytes - use chunked transcription "
+                            f"or raise FANAR_MAX_UPLOAD_MB"
+                        )
+                    yield chunk
+                tracing.current_span().add(bytes_out=sent)
             
-            with open(file_path, 'rb') as audio_file:
-                files = {
-                    'file': (os.path.basename(file_path), audio_file, mime_type)
-                }
-                
-                data = {
-                    'model': model
-                }
-                
-                response = requests.post(
+            def request():
+                if tracing.enabled():
+                    tracing.current_span().add(audio_seconds=wav_seconds(file_path))
+                response = self._post(
+                    "transcription",
                     url,
-                    headers=self.headers,
-                    files=files,
-                    data=data,
-                    timeout=300 
+                    build_body=lambda: multipart_stream({'model': model}, 'file', filename, mime_type,
+                                                        upload_body(), boundary),
+                    headers={'Content-Type': f'multipart/form-data; boundary={boundary}'}
                 )
                 
                 print(f"Response status code: {response.status_code}")
-                print(f"Response headers: {dict(response.headers)}")
                 
                 if response.status_code != 200:
                     print(f"Error response content: {response.text}")
                 
                 response.raise_for_status()
-                return response.json()
+                return response.content
+            
+            # The audio is identified by its content hash and upload format, only computed when caching
+            payload = ({"file": hash_file(file_path), "upload": upload_format}
+                       if self.response_cache is not None else None)
+            return json.loads(self._fetch("transcription", model, payload, request))
             
         except requests.exceptions.Timeout:
             raise Exception("Request timed out - the audio file might be too large or the server is slow")
@@ -159,10 +485,15 @@ class FanarAPIClient:
             "preprocessing": "default"
         }
         
-        try:
-            response = requests.post(url, headers=self.headers, json=data)
+        def request():
+            response = self._post("translation", url, json=data)
             response.raise_for_status()
-            result = response.json()
+            if not response.json().get("text"):
+                raise Exception("No translated text found in response")
+            return response.content
+        
+        try:
+            result = json.loads(self._fetch("translation", model, data, request))
             
             translated_text = result.get("text")
             if not translated_text:
@@ -173,15 +504,22 @@ class FanarAPIClient:
         except requests.exceptions.RequestException as e:
             raise Exception(f"Translation API request failed: {e}")
     
-    def text_to_speech(self, text, output_file="output_speech.wav", model="Fanar-Aura-TTS-1", voice="default"):
+    def text_to_speech(self, text, output_file="output_speech.wav", model="Fanar-Aura-TTS-1", voice="default",
+                       on_samples=None):
         """
         Convert text to speech and save as audio file.
         
+        The audio is streamed to output_file as it arrives, so memory stays
+        bounded however long the clip is. With a response cache, the stored
+        copy is read back from output_file once the stream is complete.
+        
         Args:
             text (str): Text to convert
             output_file (str): Output audio file path
             model (str): TTS model to use
             voice (str): Voice to use
+            on_samples (callable): Optional; called with int16 arrays of shape
+                (frames, channels) as the audio is received, before synthesis finishes
             
         Returns:
             str: Path to saved audio file
@@ -193,13 +531,33 @@ class FanarAPIClient:
             "input": text,
             "voice": voice
         }
+        decoder = WavStreamDecoder(on_samples) if on_samples is not None else None
+        streamed = False
+        
+        def request():
+            nonlocal streamed
+            response = self._post("speech", url, json=payload, stream=True)
+            with closing(response):
+                response.raise_for_status()
+                received = save_response(response, output_file, decoder.feed if decoder else None)
+            streamed = True
+            if tracing.enabled():
+                tracing.current_span().add(bytes_in=received, audio_seconds=wav_seconds(output_file))
+            if self.response_cache is None:
+                return None
+            with open(output_file, "rb") as f:
+                return f.read()
         
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
-            response.raise_for_status()
-            
-            with open(output_file, "wb") as f:
-                f.write(response.content)
+            audio = self._fetch("speech", model, payload, request)
+            if audio is not None and not streamed:
+                # Served by the response cache or by another caller's identical request
+                temp_file = f"{output_file}.{os.getpid()}.{threading.get_ident()}.part"
+                with open(temp_file, "wb") as f:
+                    f.write(audio)
+                os.replace(temp_file, output_file)
+                if decoder is not None:
+                    decoder.feed(audio)
                 
             return os.path.abspath(output_file)
             
@@ -207,21 +565,36 @@ class FanarAPIClient:
             raise Exception(f"TTS API request failed: {e}")
 
 
-def extract_audio_from_video(video_path, audio_path):
+# Audio format written by extract_audio_from_video: what Demucs expects
+EXTRACT_SAMPLE_RATE = 44100
+EXTRACT_CHANNELS = 2
+
+
+def extract_audio_from_video(video_path, audio_path, audioless_video_path=None):
     """
-    Extract audio from video file.
+    Extract audio from video file in a single ffmpeg demux pass.
+    
+    The audio is decoded straight to 16-bit PCM at the sample rate and channel
+    count the downstream stages need. Video frames are never decoded: if an
+    audioless copy is requested, the video stream is copied as-is.
     
     Args:
         video_path (str): Path to input video file
         audio_path (str): Path for extracted audio file
+        audioless_video_path (str): Optional path for the video without its audio track
     """
     try:
-        with VideoFileClip(video_path) as video_clip:
-            audio_clip = video_clip.audio
-            audio_clip.write_audiofile(audio_path)
-            
-            new_clip = video_clip.without_audio()
-            new_clip.write_videofile("audioless_video.mp4")
+        args = [
+            '-i', video_path,
+            '-map', '0:a:0',
+            '-c:a', 'pcm_s16le',
+            '-ar', str(EXTRACT_SAMPLE_RATE),
+            '-ac', str(EXTRACT_CHANNELS),
+            audio_path
+        ]
+        if audioless_video_path:
+            args += ['-map', '0:v:0', '-c:v', 'copy', '-an', audioless_video_path]
+        run_ffmpeg(args)
             
         print(f"Audio extracted and saved to {audio_path}")
         
@@ -229,6 +602,316 @@ def extract_audio_from_video(video_path, audio_path):
         raise Exception(f"Audio extraction failed: {e}")
 
 
+def separate_music_with_demucs(audio_file, output_dir='demucs_output'):
+    """
+    Separate the music stem from an audio file using the Demucs CLI.
+    
+    Args:
+        audio_file (str): Path to input audio file
+        output_dir (str): Directory Demucs writes its stems into
+        
+    Returns:
+        str: Path to the separated music (no vocals) stem
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    cmd = [
+        'demucs', '--two-stems=vocals', '-o', output_dir, audio_file
+    ]
+    subprocess.run(cmd, check=True)
+    # Find the model subfolder (e.g., htdemucs)
+    model_dir = next(
+        d for d in os.listdir(output_dir)
+        if os.path.isdir(os.path.join(output_dir, d))
+    )
+    # Search for no_vocals.wav in all subfolders
+    search_path = os.path.join(output_dir, model_dir, '*', 'no_vocals.wav')
+    matches = glob.glob(search_path)
+    if not matches:
+        raise FileNotFoundError(f"No 'no_vocals.wav' found in {search_path}")
+    return matches[0]
+
+
+# Streaming mix: music level between and under speech, and the sidechain envelope follower
+MIX_BLOCK_SECONDS = 1.0
+MUSIC_GAIN_DB = -4.0
+DUCKED_GAIN_DB = -14.0
+DUCK_THRESHOLD_DB = -45.0
+DUCK_ATTACK_MS = 30
+DUCK_RELEASE_MS = 400
+DUCK_CONTROL_MS = 10
+# The ducking gain forgets its past within five release time constants
+DUCK_SETTLE_SECONDS = 5 * DUCK_RELEASE_MS / 1000
+
+
+def wav_format(audio_file):
+    """Return (sample_rate, channels, frames) of a 16-bit PCM WAV, or None for other files."""
+    try:
+        with wave.open(audio_file, 'rb') as wav:
+            if wav.getsampwidth() != 2:
+                return None
+            return wav.getframerate(), wav.getnchannels(), wav.getnframes()
+    except (wave.Error, EOFError):
+        return None
+
+
+def wav_seconds(audio_file):
+    """Duration of a WAV file or file object from its header, 0 for other formats."""
+    audio_format = wav_format(audio_file)
+    return audio_format[2] / audio_format[0] if audio_format else 0.0
+
+
+def iter_audio_blocks(audio_file, sample_rate, channels, block_frames):
+    """
+    Decode audio as int16 blocks of shape (block_frames, channels).
+    
+    WAV files already in the requested format are served as zero-copy views
+    of their mapped samples; anything else is decoded and resampled through
+    an ffmpeg pipe. The last block may be shorter. Memory holds one block at
+    a time.
+    """
+    audio_format = wav_format(audio_file)
+    if audio_format and audio_format[:2] == (sample_rate, channels):
+        yield from open_audio(audio_file).blocks(block_frames)
+        return
+
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', audio_file,
+               '-f', 's16le', '-ac', str(channels), '-ar', str(sample_rate), '-']
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    frame_bytes = 2 * channels
+    exhausted = False
+    try:
+        while True:
+            data = process.stdout.read(block_frames * frame_bytes)
+            if len(data) < frame_bytes:
+                exhausted = True
+                break
+            data = data[:len(data) // frame_bytes * frame_bytes]
+            yield np.frombuffer(data, dtype=np.int16).reshape(-1, channels)
+    finally:
+        # Stopped early by the consumer: ffmpeg may still be writing
+        if not exhausted:
+            process.kill()
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        if process.wait() != 0 and exhausted:
+            raise Exception(f"FFMPEG error: {stderr.decode(errors='replace')}")
+
+
+def mix_music_and_tts(music_path, tts_path, output_path, duration=None,
+                      music_gain_db=MUSIC_GAIN_DB, ducked_gain_db=DUCKED_GAIN_DB):
+    """
+    Overlay TTS speech on the separated music stem, ducking the music while speech is present.
+    
+    Both inputs are streamed in fixed-size blocks and the mix is written as it
+    is produced, so memory stays constant regardless of length. An envelope
+    follower on the speech drives the music gain: ducked_gain_db under speech,
+    music_gain_db in the gaps, with a fast attack and a slow release. The
+    output is padded with silence or trimmed to duration in the same pass.
+    
+    Args:
+        music_path (str): Music stem; its sample rate and channels are used for the output
+        tts_path (str): Speech track in any format ffmpeg can decode
+        output_path (str): Output WAV path
+        duration (float): Output duration in seconds (defaults to the music length)
+        music_gain_db (float): Music gain where there is no speech
+        ducked_gain_db (float): Music gain under speech
+    """
+    music_format = wav_format(music_path)
+    sample_rate, channels = music_format[:2] if music_format else (EXTRACT_SAMPLE_RATE, EXTRACT_CHANNELS)
+    if duration is not None:
+        total = int(round(duration * sample_rate))
+    else:
+        total = music_format[2] if music_format else None
+
+    hop, block, ducking_gain = _ducker(sample_rate, music_gain_db, ducked_gain_db)
+
+    def padded(blocks):
+        for samples in blocks:
+            if samples.shape[0] < block:
+                samples = np.pad(samples, ((0, block - samples.shape[0]), (0, 0)))
+            yield samples
+        while True:
+            yield None
+
+    music_source = iter_audio_blocks(music_path, sample_rate, channels, block)
+    speech_source = iter_audio_blocks(tts_path, sample_rate, 1, block)
+    music_blocks = padded(music_source)
+    speech_blocks = padded(speech_source)
+    silence = np.zeros((block, channels), dtype=np.int16)
+    written = 0
+    with wave.open(output_path, 'wb') as out, closing(music_source), closing(speech_source):
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        while total is None or written < total:
+            music = next(music_blocks)
+            speech = next(speech_blocks)
+            if music is None:
+                if total is None:
+                    break
+                music = silence
+            speech = (speech if speech is not None else silence[:, :1]).astype(np.float32) / 32768.0
+            mixed = music.astype(np.float32) / 32768.0 * ducking_gain(speech[:, 0])[:, None] + speech
+            n = block if total is None else min(block, total - written)
+            out.writeframes((np.clip(mixed[:n], -1.0, 1.0) * 32767).astype(np.int16).tobytes())
+            written += n
+
+
+def _ducker(sample_rate, music_gain_db, ducked_gain_db):
+    """
+    Envelope follower turning speech into a music gain, block by block.
+
+    Returns:
+        tuple: (hop, block, ducking_gain). ducking_gain takes block mono float
+            speech samples and returns the linear music gain per sample; it keeps
+            its state between calls, so blocks must be passed in order.
+    """
+    hop = max(int(sample_rate * DUCK_CONTROL_MS / 1000), 1)
+    block = hop * max(int(MIX_BLOCK_SECONDS * 1000 / DUCK_CONTROL_MS), 1)
+    attack = 1 - np.exp(-DUCK_CONTROL_MS / DUCK_ATTACK_MS)
+    release = 1 - np.exp(-DUCK_CONTROL_MS / DUCK_RELEASE_MS)
+    ramp = np.arange(1, block + 1) / hop
+    gain_db = music_gain_db
+
+    def ducking_gain(speech):
+        # Speech level per control step -> target music gain -> attack/release smoothing
+        nonlocal gain_db
+        level = 10 * np.log10(np.mean(speech.reshape(-1, hop) ** 2, axis=1) + 1e-10)
+        targets = np.where(level > DUCK_THRESHOLD_DB, ducked_gain_db, music_gain_db)
+        steps = np.empty(targets.size + 1)
+        steps[0] = gain_db
+        for i, target in enumerate(targets):
+            gain_db += (target - gain_db) * (attack if target < gain_db else release)
+            steps[i + 1] = gain_db
+        # Interpolate linearly between control steps so the gain has no clicks
+        return 10 ** (np.interp(ramp, np.arange(steps.size), steps) / 20)
+
+    return hop, block, ducking_gain
+
+
+def remix_regions(music_path, tts_path, output_path, regions,
+                  music_gain_db=MUSIC_GAIN_DB, ducked_gain_db=DUCKED_GAIN_DB):
+    """
+    Redo the mix of mix_music_and_tts in some time ranges only, in place.
+    
+    Used after the speech track was patched in those ranges. Each range is
+    re-mixed from DUCK_SETTLE_SECONDS earlier, so the ducking gain has
+    caught up with the unchanged speech before it, and rewritten until
+    DUCK_SETTLE_SECONDS later, where the gain has settled back to what the
+    existing mix has. The rest of the mix is not touched.
+    
+    Args:
+        music_path (str): Music stem the mix was made from
+        tts_path (str): Patched speech track
+        output_path (str): Mix written by mix_music_and_tts; patched in place
+        regions (list): (start, end) ranges in seconds whose speech changed
+        music_gain_db (float): Music gain where there is no speech
+        ducked_gain_db (float): Music gain under speech
+    """
+    header = read_wav_header(output_path)
+    sample_rate, channels, total = header["sample_rate"], header["channels"], header["frames"]
+    hop = _ducker(sample_rate, music_gain_db, ducked_gain_db)[0]
+    settle = int(DUCK_SETTLE_SECONDS * sample_rate) // hop * hop
+
+    # Widened ranges, aligned on the control steps of the full mix, merged where they overlap
+    spans = []
+    for start, end in sorted(regions):
+        first = int(start * sample_rate) // hop * hop
+        span = [max(first - settle, 0), first, min(int(np.ceil(end * sample_rate)) + settle, total)]
+        if spans and span[0] <= spans[-1][2]:
+            spans[-1][2] = max(spans[-1][2], span[2])
+        else:
+            spans.append(span)
+
+    music = open_audio(music_path, sample_rate, channels)
+    speech = open_audio(tts_path, sample_rate, 1)
+    with open(output_path, "r+b") as f:
+        for warm_up, start, end in spans:
+            _, block, ducking_gain = _ducker(sample_rate, music_gain_db, ducked_gain_db)
+            for position in range(warm_up, end, block):
+                n = min(block, end - position)
+                music_block = np.zeros((block, channels), dtype=np.float32)
+                speech_block = np.zeros(block, dtype=np.float32)
+                music_samples = music.view(position, position + n)
+                speech_samples = speech.view(position, position + n)[:, 0]
+                music_block[:len(music_samples)] = music_samples / 32768.0
+                speech_block[:len(speech_samples)] = speech_samples / 32768.0
+                mixed = music_block * ducking_gain(speech_block)[:, None] + speech_block[:, None]
+                # The warm-up only brings the gain up to date
+                skip = max(start - position, 0)
+                if skip >= n:
+                    continue
+                f.seek(header["data_offset"] + 2 * channels * (position + skip))
+                f.write((np.clip(mixed[skip:n], -1.0, 1.0) * 32767).astype(np.int16).tobytes())
+
+
+def get_audio_duration(audio_file):
+    """Get the duration of an audio file in seconds."""
+    audio_format = wav_format(audio_file)
+    if audio_format:
+        # WAV: answer from the header instead of decoding the whole file
+        return audio_format[2] / audio_format[0]
+    try:
+        # Other formats: the container header, then a full decode as a last resort
+        duration = probe_media(audio_file)["duration"]
+        if duration is not None:
+            return duration
+        audio = AudioSegment.from_file(audio_file)
+        return len(audio) / 1000  # Convert milliseconds to seconds
+    except Exception as e:
+        print(f"Could not determine audio duration: {e}")
+        return None
+
+
+def select_transcription_model(audio_duration):
+    """Select the appropriate transcription model based on audio duration."""
+    if audio_duration is None:
+        # Default to short-form model if duration cannot be determined
+        return "Fanar-Aura-STT-1"
+    
+    # Use long-form model for audio longer than 30 seconds
+    if audio_duration > 30:
+        return "Fanar-Aura-STT-LF-1"
+    else:
+        return "Fanar-Aura-STT-1"
+
+
+def run_ffmpeg(args):
+    """
+    Run ffmpeg with the given arguments, overwriting outputs.
+    
+    Args:
+        args (list): Arguments following the ffmpeg executable
+    """
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y'] + list(args)
+    process = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise Exception(f"FFMPEG error: {process.stderr.decode(errors='replace')}")
+
+
+def save_wav(samples, sample_rate, output_file):
+    """
+    Save float audio in [-1, 1] as a 16-bit PCM WAV file.
+    
+    Args:
+        samples (numpy.ndarray): Audio of shape (n,) or (n, channels)
+        sample_rate (int): Sample rate in Hz
+        output_file (str): Output WAV path
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+    # Written aside and renamed: the old file may still be mapped by the audio store
+    temp_file = f"{output_file}.{os.getpid()}.tmp.wav"
+    with wave.open(temp_file, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    os.replace(temp_file, output_file)
+
+
 def save_text_to_file(text, file_path):
     """Save text to file with UTF-8 encoding."""
     try:
@@ -248,22 +931,42 @@ def load_text_from_file(file_path):
         raise Exception(f"Error reading text from file: {e}")
 
 
-def combine_audio_video(audio_file, video_file, output_file):
-    """Combine audio and video files into a single output file using FFMPEG directly."""
+def combine_audio_video(audio_file, video_file, output_file, languages=None):
+    """
+    Combine audio and video files into a single output file using FFMPEG directly.
+
+    Args:
+        audio_file (str or list): Audio track, or one track per dubbing language
+        video_file (str): Video whose frames are stream-copied
+        output_file (str): Output video path
+        languages (list): Optional (ISO 639-2 code, title) per audio track, written as
+            track metadata so players list the tracks by language; the first is the default
+    """
     
     try:
         print("Starting audio-video combination...")
+        audio_files = [audio_file] if isinstance(audio_file, str) else list(audio_file)
         # FFMPEG command to combine audio and video
-        command = [
-            'ffmpeg',
-            '-i', video_file,  
-            '-i', audio_file,  
+        command = ['ffmpeg', '-i', video_file]
+        for track in audio_files:
+            command += ['-i', track]
+        command += [
             '-c:v', 'copy',    
             '-c:a', 'aac',     
             '-b:a', '192k',    
             '-strict', 'experimental',
             '-map', '0:v',     
-            '-map', '1:a',     
+        ]
+        for index in range(len(audio_files)):
+            command += ['-map', f'{index + 1}:a']
+        for index, (code, title) in enumerate(languages or []):
+            command += [
+                f'-metadata:s:a:{index}', f'language={code}',
+                # MP4 keeps no track title; players show the handler name instead
+                f'-metadata:s:a:{index}', f'handler_name={title}',
+                f'-disposition:a:{index}', 'default' if index == 0 else '0',
+            ]
+        command += [
             '-shortest',       
             '-y',              
             output_file
@@ -0,0 +1,252 @@
+"""
+Per-job workspaces and a bounded background worker pool for dubbing jobs.
+
+Each job writes its intermediate and final files into its own directory,
+so several users on one Streamlit server no longer overwrite each other's
+files. Jobs run on a shared thread pool and the UI polls their status.
+"""
+
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import tracing
+
+
+DEFAULT_JOBS_DIR = "jobs"
+DEFAULT_MAX_WORKERS = 2
+
+STATUS_PENDING = "pending"
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+
+class JobWorkspace:
+    """Directory holding every file produced by a single job."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, *parts):
+        """Return a path inside the workspace."""
+        return os.path.join(self.root, *parts)
+
+    def remove(self):
+        """Delete the workspace and everything in it."""
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class Job:
+    """Status, progress messages and outputs of a dubbing job."""
+
+    def __init__(self, job_id, workspace):
+        self.job_id = job_id
+        self.workspace = workspace
+        self.status = STATUS_PENDING
+        self.stage = None
+        self.messages = []
+        self.outputs = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.trace = None
+        self.running_stages = []
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage):
+        """Record the stage the job is currently running."""
+        with self._lock:
+            self.stage = stage
+        if self.trace is not None:
+            self.trace.enter_stage(stage)
+            self.set_output("timings", self.trace.stage_breakdown())
+
+    def begin_stage(self, stage):
+        """
+        Record a stage that runs alongside the job's other stages (see
+        stage_graph); the job's stage lists every stage running. The stage
+        traces itself, as the trace keeps only one sequential stage open.
+        """
+        with self._lock:
+            self.running_stages.append(stage)
+            self.stage = " + ".join(self.running_stages)
+
+    def end_stage(self, stage):
+        """Record that a stage started with begin_stage completed."""
+        with self._lock:
+            self.running_stages.remove(stage)
+            self.stage = " + ".join(self.running_stages) or None
+        if self.trace is not None:
+            self.set_output("timings", self.trace.stage_breakdown())
+
+    @contextmanager
+    def traced(self):
+        """
+        Trace the stages run inside the block when tracing is enabled. The
+        per-stage timings are published as the "timings" output and the full
+        trace is written to trace.json in the workspace.
+        """
+        with tracing.trace(self.job_id) as trace:
+            self.trace = trace
+            try:
+                yield trace
+            finally:
+                self.trace = None
+                if trace is not None:
+                    trace.end_stage()
+                    self.set_output("timings", trace.stage_breakdown())
+                    trace_file = self.workspace.path(tracing.TRACE_FILE)
+                    trace.write(trace_file)
+                    self.set_output("trace", trace_file)
+
+    def log(self, level, message):
+        """
+        Record a progress message for the UI.
+
+        Args:
+            level (str): One of "info", "success", "warning"
+            message (str): Message text
+        """
+        with self._lock:
+            self.messages.append((level, message))
+        print(f"[job {self.job_id}] {message}")
+
+    def set_output(self, name, value):
+        """Publish an intermediate output (e.g. transcription text) for the UI."""
+        with self._lock:
+            self.outputs[name] = value
+
+    def snapshot(self):
+        """
+        Return a consistent copy of the job state.
+
+        Returns:
+            dict: Job status, stage, messages, outputs, result and error
+        """
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "stage": self.stage,
+                "messages": list(self.messages),
+                "outputs": dict(self.outputs),
+                "result": self.result,
+                "error": self.error,
+            }
+
+    @property
+    def is_active(self):
+        return self.status in (STATUS_QUEUED, STATUS_RUNNING)
+
+
+class JobManager:
+    """Creates jobs and runs them on a bounded background thread pool."""
+
+    def __init__(self, jobs_dir=DEFAULT_JOBS_DIR, max_workers=DEFAULT_MAX_WORKERS):
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dubbing-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def create_job(self):
+        """
+        Create a job with a fresh workspace. The job does not run until it is
+        submitted, so inputs can be placed in its workspace first.
+
+        Returns:
+            Job: The new job
+        """
+        job_id = uuid.uuid4().hex[:12]
+        job = Job(job_id, JobWorkspace(os.path.join(self.jobs_dir, job_id)))
+        with self._lock:
+            self._jobs[job_id] = job
+        return job
+
+    def get(self, job_id):
+        """Return the job with the given ID, or None."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def submit(self, job, fn, *args, **kwargs):
+        """
+        Queue a job for execution.
+
+        Args:
+            job (Job): Job created by create_job
+            fn (callable): Called as fn(job, *args, **kwargs); its return value
+                becomes job.result
+        """
+        # Checked and queued under the job's lock, so two concurrent submits cannot both start it
+        with job._lock:
+            if job.is_active:
+                raise ValueError(f"Job {job.job_id} is already {job.status}")
+            job.status = STATUS_QUEUED
+            job.stage = None
+            job.running_stages = []
+            job.messages = []
+            job.outputs = {}
+            job.result = None
+            job.error = None
+            job.finished = None
+        self._executor.submit(self._run, job, fn, args, kwargs)
+
+    def _run(self, job, fn, args, kwargs):
+        with job._lock:
+            job.status = STATUS_RUNNING
+        try:
+            with job.traced():
+                result = fn(job, *args, **kwargs)
+            with job._lock:
+                job.result = result
+                job.status = STATUS_COMPLETED
+        except Exception as e:
+            with job._lock:
+                job.error = str(e)
+                job.status = STATUS_FAILED
+            print(f"[job {job.job_id}] failed: {e}")
+        finally:
+            job.finished = time.time()
+
+    def queue_depth(self):
+        """Return the number of jobs waiting for a worker."""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == STATUS_QUEUED)
+
+    def remove(self, job_id):
+        """Forget a finished job and delete its workspace."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.is_active:
+                return False
+            del self._jobs[job_id]
+        job.workspace.remove()
+        return True
+
+    def prune(self, max_age):
+        """
+        Remove finished or never-submitted jobs older than max_age seconds.
+
+        Returns:
+            int: Number of jobs removed
+        """
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if not job.is_active and now - (job.finished or job.created) > max_age
+            ]
+        return sum(1 for job_id in expired if self.remove(job_id))
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and optionally wait for running ones."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,178 @@
+"""
+Streaming ingestion of uploaded videos and header-only media probing.
+
+Uploads are copied into a content-addressed store in fixed-size blocks and
+hashed in the same pass, so a large video is never held as one bytes object
+and the SHA-256 doubles as the stage cache key of the source. An upload
+whose content is already in the store is not kept a second time. Duration
+and stream layout are read from the container header instead of decoding
+the media.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+import uuid
+
+
+DEFAULT_UPLOAD_DIR = ".uploads"
+INGEST_CHUNK_SIZE = 8 * 1024 ** 2
+DEFAULT_MAX_AGE = 7 * 24 * 3600          # 7 days
+
+
+def ingest_upload(fileobj, upload_dir=DEFAULT_UPLOAD_DIR, suffix=".mp4", chunk_size=INGEST_CHUNK_SIZE):
+    """
+    Copy a file object into the upload store, hashing it while it is written.
+
+    The data goes to a temporary file in blocks of chunk_size; once the hash
+    is known the file is renamed to <sha256><suffix>, or dropped if the store
+    already holds that content.
+
+    Args:
+        fileobj: Readable binary file object (a Streamlit UploadedFile, an open file)
+        upload_dir (str): Directory of the content-addressed store
+        suffix (str): Extension of the stored file
+        chunk_size (int): Bytes copied per block
+
+    Returns:
+        tuple: (path of the stored file, SHA-256 hex digest, whether it was already stored)
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    if hasattr(fileobj, "seek"):
+        fileobj.seek(0)
+
+    digest = hashlib.sha256()
+    temp_file = os.path.join(upload_dir, f"{uuid.uuid4().hex}.part")
+    try:
+        with open(temp_file, "wb") as f:
+            for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+                digest.update(chunk)
+                f.write(chunk)
+
+        upload_hash = digest.hexdigest()
+        stored_file = os.path.join(upload_dir, f"{upload_hash}{suffix}")
+        existed = os.path.exists(stored_file)
+        if existed:
+            # Refresh the age of the stored copy so pruning keeps it
+            os.utime(stored_file, None)
+        else:
+            os.replace(temp_file, stored_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+    prune_uploads(upload_dir)
+    return stored_file, upload_hash, existed
+
+
+def prune_uploads(upload_dir=DEFAULT_UPLOAD_DIR, max_age=DEFAULT_MAX_AGE):
+    """Remove stored uploads not used for max_age seconds; returns the number removed."""
+    removed = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(upload_dir) if os.path.isdir(upload_dir) else []:
+        path = os.path.join(upload_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _ffprobe(media_path):
+    """Probe with ffprobe's JSON output."""
+    command = ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', media_path]
+    process = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise Exception(f"FFPROBE error: {process.stderr.decode(errors='replace')}")
+    probe = json.loads(process.stdout)
+
+    streams = []
+    for stream in probe.get("streams", []):
+        streams.append({
+            "type": stream.get("codec_type"),
+            "codec": stream.get("codec_name"),
+            "sample_rate": int(stream["sample_rate"]) if stream.get("sample_rate") else None,
+            "channels": stream.get("channels"),
+            "width": stream.get("width"),
+            "height": stream.get("height"),
+        })
+    media_format = probe.get("format", {})
+    duration = media_format.get("duration")
+    return {
+        "format": media_format.get("format_name"),
+        "duration": float(duration) if duration not in (None, "N/A") else None,
+        "streams": streams,
+    }
+
+
+_DURATION_PATTERN = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_STREAM_PATTERN = re.compile(r"Stream #\d+:\d+.*?: (Audio|Video|Subtitle|Data): (\w+)([^\n]*)")
+
+
+def _ffmpeg_header(media_path):
+    """Probe by parsing the input summary ffmpeg prints when given no output."""
+    command = ['ffmpeg', '-hide_banner', '-nostdin', '-i', media_path]
+    process = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output = process.stderr.decode(errors='replace')
+    if "Input #0" not in output:
+        raise Exception(f"FFMPEG error: {output}")
+
+    format_match = re.search(r"Input #0, ([^,]+(?:,[^,\s]+)*), from", output)
+    duration_match = _DURATION_PATTERN.search(output)
+    duration = None
+    if duration_match:
+        hours, minutes, seconds = duration_match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    streams = []
+    for kind, codec, details in _STREAM_PATTERN.findall(output):
+        sample_rate = re.search(r"(\d+) Hz", details)
+        size = re.search(r", (\d{2,5})x(\d{2,5})", details)
+        channels = re.search(r"Hz, (mono|stereo|[\d.]+)", details)
+        channel_count = None
+        if channels:
+            layout = channels.group(1)
+            channel_count = {"mono": 1, "stereo": 2}.get(layout) or sum(int(n) for n in layout.split(".") if n.isdigit())
+        streams.append({
+            "type": kind.lower(),
+            "codec": codec,
+            "sample_rate": int(sample_rate.group(1)) if sample_rate else None,
+            "channels": channel_count,
+            "width": int(size.group(1)) if size else None,
+            "height": int(size.group(2)) if size else None,
+        })
+    return {
+        "format": format_match.group(1) if format_match else None,
+        "duration": duration,
+        "streams": streams,
+    }
+
+
+def probe_media(media_path):
+    """
+    Read duration and streams from a media file's container header.
+
+    Nothing is decoded: ffprobe is used when installed, otherwise the input
+    summary of ffmpeg.
+
+    Args:
+        media_path (str): Path to a video or audio file
+
+    Returns:
+        dict: format, duration in seconds (None if unknown) and streams, a list of
+            {"type", "codec", "sample_rate", "channels", "width", "height"}
+    """
+    if shutil.which('ffprobe'):
+        return _ffprobe(media_path)
+    return _ffmpeg_header(media_path)
+
+
+def has_stream(probe, stream_type):
+    """Whether a probe_media result contains a stream of the given type ("audio", "video")."""
+    return any(stream["type"] == stream_type for stream in probe["streams"])
@@ -0,0 +1,180 @@
+"""
+Cheap music-presence detection, used to skip Demucs when there is no music.
+
+Lectures and talking-head videos have no background music, so separating
+and re-mixing a near-silent music stem is wasted CPU. This pre-check reads
+the audio once, block by block, decimates it to about 11 kHz mono, and
+scores three vectorized spectral features:
+
+- pause floor: music fills the pauses between words, so the quiet frames
+  stay close in level to the loud ones;
+- bass share: speech has little energy below 90 Hz, most music has bass;
+- tonal persistence: musical notes hold spectral peaks steady for longer
+  than speech harmonics do.
+"""
+
+import numpy as np
+
+from audio_store import open_audio, read_wav_header, is_pcm16
+
+
+ANALYSIS_SAMPLE_RATE = 11025
+FFT_SIZE = 512
+HOP_SIZE = 256
+PERSISTENCE_FRAMES = 8          # ~190 ms at 11 kHz with a 256-sample hop
+BLOCK_FRAMES = 2048             # ~48 s of audio transformed at a time
+BASS_CUTOFF_HZ = 90
+DEFAULT_THRESHOLD = 0.5
+
+# Weights of the pause floor, bass share and tonal persistence scores
+FEATURE_WEIGHTS = (0.4, 0.3, 0.3)
+
+
+def _sigmoid(x):
+    return float(1.0 / (1.0 + np.exp(-x)))
+
+
+def decimated_blocks(wav_file, target_rate=ANALYSIS_SAMPLE_RATE, block_seconds=10):
+    """
+    Read a 16-bit PCM WAV as mono float32 blocks, decimated by an integer
+    factor towards target_rate using block averaging.
+
+    Returns:
+        tuple: (generator of sample blocks, sample_rate)
+    """
+    if not is_pcm16(read_wav_header(wav_file)):
+        raise ValueError(f"Expected 16-bit PCM WAV: {wav_file}")
+    audio = open_audio(wav_file)
+    rate = audio.sample_rate
+    factor = max(1, rate // target_rate)
+    block = (rate * block_seconds // factor) * factor
+
+    def blocks():
+        for start in range(0, audio.frames, block):
+            mono = audio.mono(start, start + block)
+            usable = mono.size // factor * factor
+            yield mono[:usable].reshape(-1, factor).mean(axis=1).astype(np.float32)
+
+    return blocks(), rate / factor
+
+
+def _frame_blocks(chunks, block_frames):
+    """
+    Yield (windowed frames, owned) for consecutive runs of block_frames
+    analysis frames. Each run carries the next PERSISTENCE_FRAMES frames as
+    lookahead for the persistence test; those are owned by the next run.
+    """
+    window = np.hanning(FFT_SIZE).astype(np.float32)
+    span = (block_frames + PERSISTENCE_FRAMES - 1) * HOP_SIZE + FFT_SIZE
+
+    def windows(samples):
+        n_frames = 1 + (samples.size - FFT_SIZE) // HOP_SIZE
+        index = np.arange(FFT_SIZE)[None, :] + HOP_SIZE * np.arange(n_frames)[:, None]
+        return samples[index] * window
+
+    pending = np.zeros(0, dtype=np.float32)
+    for chunk in chunks:
+        pending = np.concatenate((pending, chunk))
+        while pending.size >= span:
+            yield windows(pending[:span]), block_frames
+            pending = pending[block_frames * HOP_SIZE:]
+    if pending.size >= FFT_SIZE:
+        frames = windows(pending)
+        yield frames, len(frames)
+
+
+def spectral_features(samples, sample_rate, block_frames=BLOCK_FRAMES):
+    """
+    Compute the music-presence features of mono audio.
+
+    The spectrum is computed for block_frames frames at a time, so memory
+    stays bounded however long the audio is; only one energy figure and
+    two peak counts per frame are kept for the whole track.
+
+    Args:
+        samples (np.ndarray or iterable): Mono samples, or consecutive blocks of them
+        sample_rate (float): Sample rate of the samples
+        block_frames (int): Analysis frames transformed at a time
+
+    Returns:
+        dict: pause_range_db, bass_ratio and tonal_persistence
+    """
+    chunks = [samples] if isinstance(samples, np.ndarray) else samples
+    bass = np.fft.rfftfreq(FFT_SIZE, 1.0 / sample_rate) < BASS_CUTOFF_HZ
+    energy_db, peak_counts, held_counts = [], [], []
+    bass_energy = total_energy = 0.0
+
+    for frames, owned in _frame_blocks(chunks, block_frames):
+        power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+        frame_energy = power[:owned].sum(axis=1)
+        energy_db.append(10 * np.log10(frame_energy + 1e-12))
+        bass_energy += power[:owned, bass].sum()
+        total_energy += frame_energy.sum()
+
+        # Spectral peaks: local maxima at least 10 dB above the frame's median
+        power_db = 10 * np.log10(power + 1e-12)
+        threshold = np.median(power_db, axis=1, keepdims=True) + 10
+        peaks = (
+            (power_db[:, 1:-1] > power_db[:, :-2])
+            & (power_db[:, 1:-1] >= power_db[:, 2:])
+            & (power_db[:, 1:-1] > threshold)
+        )
+        peak_counts.append(peaks[:owned].sum(axis=1))
+        n_held = max(min(owned, len(peaks) - PERSISTENCE_FRAMES), 0)
+        held = peaks[:n_held].copy()
+        for k in range(1, PERSISTENCE_FRAMES + 1):
+            held &= peaks[k:n_held + k]
+        held_counts.append(held.sum(axis=1))
+
+    energy_db = np.concatenate(energy_db) if energy_db else np.zeros(0)
+    n_frames = energy_db.size
+    if n_frames < PERSISTENCE_FRAMES + 1:
+        return {"pause_range_db": 60.0, "bass_ratio": 0.0, "tonal_persistence": 0.0}
+
+    loud = energy_db > energy_db.max() - 60
+    low, high = np.percentile(energy_db[loud], [10, 90]) if loud.any() else (0.0, 0.0)
+
+    bass_ratio = bass_energy / (total_energy + 1e-12)
+
+    # Peaks count in loud frames only, and are held only through loud frames
+    held_loud = np.lib.stride_tricks.sliding_window_view(loud, PERSISTENCE_FRAMES + 1).all(axis=1)
+    peak_count = (np.concatenate(peak_counts)[:-PERSISTENCE_FRAMES] * loud[:-PERSISTENCE_FRAMES]).sum()
+    held_count = (np.concatenate(held_counts) * held_loud).sum()
+    tonal_persistence = held_count / peak_count if peak_count else 0.0
+
+    return {
+        "pause_range_db": float(high - low),
+        "bass_ratio": float(bass_ratio),
+        "tonal_persistence": float(tonal_persistence),
+    }
+
+
+def detect_music(audio_file, threshold=DEFAULT_THRESHOLD):
+    """
+    Decide whether an audio file contains background music.
+
+    Args:
+        audio_file (str): Path to a 16-bit PCM WAV file
+        threshold (float): Score at or above which music is considered present
+
+    Returns:
+        dict: has_music (bool), score (0-1), confidence (0-1) and the raw features
+    """
+    blocks, sample_rate = decimated_blocks(audio_file)
+    features = spectral_features(blocks, sample_rate)
+
+    scores = (
+        _sigmoid((25.0 - features["pause_range_db"]) / 4.0),
+        _sigmoid((features["bass_ratio"] - 0.08) / 0.03),
+        _sigmoid((features["tonal_persistence"] - 0.25) / 0.07),
+    )
+    score = float(np.dot(FEATURE_WEIGHTS, scores))
+    has_music = score >= threshold
+    margin = (score - threshold) / (1 - threshold) if has_music else (threshold - score) / threshold
+
+    return {
+        "has_music": has_music,
+        "score": round(score, 3),
+        "confidence": round(min(max(margin, 0.0), 1.0), 3),
+        "features": {name: round(value, 4) for name, value in features.items()},
+    }
@@ -0,0 +1,275 @@
+"""
+Client-side rate limiting and adaptive concurrency for Fanar endpoints.
+
+Each endpoint gets a token bucket that caps the request rate and an AIMD
+concurrency limit: every successful response grows the limit by roughly
+one per window, and throttling (429, 502-504), a dropped connection or a
+timeout halves it. The limiters are shared by every client in the process,
+threaded or asyncio, so concurrent jobs back off together instead of each
+pushing the service over its quota.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+# (requests per second, burst) per endpoint; FANAR_RATE_LIMITS overrides them
+DEFAULT_RATE_LIMITS = {
+    "chat": (5.0, 10),
+    "transcription": (2.0, 4),
+    "translation": (5.0, 10),
+    "speech": (5.0, 10),
+}
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MAX_CONCURRENCY = 32
+
+# Responses that mean the service is overloaded or wants us to slow down
+THROTTLE_STATUS_CODES = {429, 502, 503, 504}
+
+# Failures that mean the service is overloaded: the connection was refused,
+# dropped or timed out. Any other exception is a bug or a bad request.
+THROTTLE_EXCEPTIONS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+    ConnectionError,
+    TimeoutError,
+) + ((aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) if aiohttp is not None else ())
+
+
+def parse_rate_limits(text):
+    """
+    Parse rate limits written as "endpoint=rate:burst" pairs separated by commas,
+    e.g. "chat=5:10,transcription=2:4".
+
+    Returns:
+        dict: (requests per second, burst) per endpoint
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        try:
+            endpoint, value = item.split("=")
+            rate, burst = value.split(":")
+            limits[endpoint.strip()] = (float(rate), int(burst))
+        except ValueError:
+            raise ValueError(f"Invalid rate limit {item!r}, expected endpoint=rate:burst")
+    return limits
+
+
+def configured_rate_limits():
+    """Return DEFAULT_RATE_LIMITS with the overrides from FANAR_RATE_LIMITS applied."""
+    return {**DEFAULT_RATE_LIMITS, **parse_rate_limits(os.getenv("FANAR_RATE_LIMITS", ""))}
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` requests per second with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take one token; returns the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the token now; a negative balance is the queue of waiting callers
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self):
+        """Take one token, sleeping until one is available."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: additive increase on success, multiplicative decrease on throttling."""
+
+    def __init__(self, initial=DEFAULT_INITIAL_CONCURRENCY, minimum=1, maximum=DEFAULT_MAX_CONCURRENCY,
+                 backoff=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.in_flight = 0
+        self.queued = 0
+        self.throttled = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        # (loop, future) of coroutines waiting in acquire_async
+        self._async_waiters = []
+
+    def acquire(self):
+        """Wait for a free slot; returns the time the slot was granted."""
+        with self._condition:
+            self.queued += 1
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.queued -= 1
+            self.in_flight += 1
+            return time.monotonic()
+
+    async def acquire_async(self):
+        """Coroutine counterpart of acquire; waits without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            self.queued += 1
+        try:
+            while True:
+                with self._condition:
+                    if self.in_flight < int(self.limit):
+                        self.in_flight += 1
+                        return time.monotonic()
+                    waiter = loop.create_future()
+                    self._async_waiters.append((loop, waiter))
+                await waiter
+        finally:
+            with self._condition:
+                self.queued -= 1
+
+    def release(self, started, throttled):
+        """
+        Free a slot and adapt the limit.
+
+        Args:
+            started (float): Value returned by acquire
+            throttled (bool): Whether the request was throttled or dropped, or None
+                if it failed for another reason, which leaves the limit unchanged
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                # Requests already in flight when the limit was cut report the
+                # same congestion; only the first one decreases the limit
+                if started >= self._last_decrease:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._last_decrease = time.monotonic()
+            elif throttled is not None:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            # Every waiter re-checks the limit, like the threads woken above
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                pass  # The waiter's event loop is closed
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class EndpointLimiter:
+    """Rate and concurrency limits of one endpoint."""
+
+    def __init__(self, endpoint, rate, burst, initial=DEFAULT_INITIAL_CONCURRENCY,
+                 maximum=DEFAULT_MAX_CONCURRENCY):
+        self.endpoint = endpoint
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveLimiter(initial=initial, maximum=maximum)
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold a request slot for the duration of one HTTP request.
+
+        Yields a callable that records the response status code. A slot left
+        without a status through a connection error or timeout counts as
+        throttled; any other exception frees the slot without changing the limit.
+        """
+        outcome = {"throttled": None}
+
+        def record(status_code):
+            outcome["throttled"] = status_code in THROTTLE_STATUS_CODES
+
+        started = self.concurrency.acquire()
+        try:
+            self.bucket.acquire()
+            yield record
+        except THROTTLE_EXCEPTIONS:
+            if outcome["throttled"] is None:
+                outcome["throttled"] = True
+            raise
+        finally:
+            self.concurrency.release(started, outcome["throttled"])
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """Coroutine counterpart of slot(), for asyncio clients."""
+        outcome = {"throttled": None}
+
+        def record(status_code):
+            outcome["throttled"] = status_code in THROTTLE_STATUS_CODES
+
+        started = await self.concurrency.acquire_async()
+        try:
+            delay = self.bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield record
+        except THROTTLE_EXCEPTIONS:
+            if outcome["throttled"] is None:
+                outcome["throttled"] = True
+            raise
+        finally:
+            self.concurrency.release(started, outcome["throttled"])
+
+    def stats(self):
+        """Current limits and queue depth."""
+        limiter = self.concurrency
+        return {
+            "rate": self.bucket.rate,
+            "concurrency_limit": int(limiter.limit),
+            "in_flight": limiter.in_flight,
+            "queued": limiter.queued,
+            "throttled": limiter.throttled,
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def shared_limiters(rate_limits=None):
+    """
+    Return the process-wide limiters, creating any that do not exist yet.
+
+    Args:
+        rate_limits (dict): (requests per second, burst) per endpoint, overriding
+            DEFAULT_RATE_LIMITS for limiters created by this call; defaults to
+            configured_rate_limits()
+
+    Returns:
+        dict: EndpointLimiter per endpoint name
+    """
+    limits = {**DEFAULT_RATE_LIMITS, **(configured_rate_limits() if rate_limits is None else rate_limits)}
+    with _limiters_lock:
+        for endpoint, (rate, burst) in limits.items():
+            if endpoint not in _limiters:
+                _limiters[endpoint] = EndpointLimiter(endpoint, rate, burst)
+        return dict(_limiters)
+
+
+def limiter_stats():
+    """Return the stats of every process-wide limiter, for monitoring."""
+    with _limiters_lock:
+        return {endpoint: limiter.stats() for endpoint, limiter in _limiters.items()}
@@ -0,0 +1,263 @@
+"""
+Persistent cache of Fanar API responses with in-flight request deduplication.
+
+The same prompt, text or phrase is often sent to the API more than once:
+recurring intros and outros, reruns after a later stage failed, several
+users dubbing the same video. ResponseCache stores successful response
+bodies in SQLite, keyed by endpoint, model and a hash of the normalized
+payload, and evicts least-recently-used entries beyond a byte budget.
+Concurrent identical requests, from threads or coroutines, are collapsed
+into one upstream call.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_CACHE_PATH = ".api_cache/responses.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2      # 512 MB
+DEFAULT_MAX_AGE = 30 * 24 * 3600         # 30 days
+
+
+def _normalize(value):
+    """Canonical form of a payload value: unified line endings, no surrounding whitespace."""
+    if isinstance(value, str):
+        return value.replace("\r\n", "\n").strip()
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+class _Flight:
+    """One upstream call that concurrent identical requests wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # Callbacks waking asyncio waiters, run once the call has finished
+        self.waiters = []
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ResponseCache:
+    """SQLite-backed response cache with LRU byte-size eviction and single-flight."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        """
+        Args:
+            path (str): SQLite database file
+            max_bytes (int): Total size of stored responses before LRU eviction
+            max_age (float): Seconds after which an entry is no longer served
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # One connection shared by every thread, serialized by the lock
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, endpoint TEXT, body BLOB, size INTEGER, created REAL, accessed REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def make_key(self, endpoint, model, payload):
+        """
+        Build a cache key from the endpoint, model and normalized payload.
+
+        Args:
+            endpoint (str): Endpoint name ("chat", "transcription", ...)
+            model (str): Model name
+            payload (dict): Request parameters that determine the response
+
+        Returns:
+            str: Hex digest identifying the request
+        """
+        canonical = json.dumps([endpoint, model, _normalize(payload)], sort_keys=True,
+                               ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the stored response body for key, or None."""
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        # Caller holds self._lock
+        now = time.time()
+        with self._db:
+            row = self._db.execute(
+                "SELECT body FROM responses WHERE key = ? AND created >= ?", (key, now - self.max_age)
+            ).fetchone()
+            if row is not None:
+                self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return row[0] if row is not None else None
+
+    def put(self, key, endpoint, body):
+        """Store a response body and evict least-recently-used entries over the byte budget."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, body, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, sqlite3.Binary(body), len(body), now, now)
+            )
+            self._evict()
+
+    def _evict(self):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def fetch(self, key, endpoint, request):
+        """
+        Return the cached body for key, or run request() once to produce it.
+
+        Concurrent callers with the same key while request() is running wait
+        for that call and share its result (or its exception) instead of
+        sending their own. Only successful results are stored.
+
+        Args:
+            key (str): Key from make_key
+            endpoint (str): Endpoint name, stored for inspection
+            request (callable): Performs the upstream call and returns the body as bytes
+
+        Returns:
+            bytes: Response body
+        """
+        body, flight, leader = self._join(key)
+        if body is not None:
+            return body
+        if not leader:
+            flight.done.wait()
+            return self._follow(flight)
+        try:
+            flight.result = request()
+            self.put(key, endpoint, flight.result)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            self._land(key, flight)
+
+    async def fetch_async(self, key, endpoint, request):
+        """
+        Coroutine counterpart of fetch, for asyncio clients.
+
+        Flights are shared with fetch: an asyncio caller can wait on a
+        request made from a thread, and the other way round.
+
+        Args:
+            key (str): Key from make_key
+            endpoint (str): Endpoint name, stored for inspection
+            request (coroutine function): Performs the upstream call and returns the body as bytes
+
+        Returns:
+            bytes: Response body
+        """
+        body, flight, leader = self._join(key)
+        if body is not None:
+            return body
+        if not leader:
+            loop = asyncio.get_running_loop()
+            landed = loop.create_future()
+            with self._lock:
+                if not flight.done.is_set():
+                    flight.waiters.append(lambda: loop.call_soon_threadsafe(_wake, landed))
+                else:
+                    landed.set_result(None)
+            await landed
+            return self._follow(flight)
+        try:
+            flight.result = await request()
+            self.put(key, endpoint, flight.result)
+            return flight.result
+        except asyncio.CancelledError:
+            flight.error = RuntimeError(f"Shared {endpoint} request was cancelled")
+            raise
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            self._land(key, flight)
+
+    def _join(self, key):
+        """Return (body, None, False) on a hit, else (None, flight, whether this caller leads it)."""
+        with self._lock:
+            # Looking up the entry and joining or starting a flight under one
+            # lock: a leader that stores its result and leaves between the two
+            # would otherwise let this caller send a duplicate request
+            body = self._get(key)
+            if body is not None:
+                self.hits += 1
+                return body, None, False
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            return None, flight, leader
+
+    def _follow(self, flight):
+        if flight.error is not None:
+            raise flight.error
+        with self._lock:
+            self.hits += 1
+        return flight.result
+
+    def _land(self, key, flight):
+        with self._lock:
+            del self._flights[key]
+            flight.done.set()
+            waiters = flight.waiters
+        for wake in waiters:
+            try:
+                wake()
+            except RuntimeError:
+                pass  # The waiter's event loop is closed
+
+    def stats(self):
+        """Return entry count, stored bytes, and hit/miss counters of this process."""
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        """Remove every stored response."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM responses")
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._db.close()
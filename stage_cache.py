@@ -0,0 +1,322 @@
+"""
+Content-addressed on-disk cache for pipeline stage artifacts.
+
+Every stage of the dubbing pipeline stores its outputs under a key derived
+from a hash of its inputs (source video hash, model name, prompt text,
+upstream stage key). When Streamlit reruns the script, stages whose inputs
+did not change are restored from disk instead of being recomputed.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+DEFAULT_CACHE_DIR = ".stage_cache"
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3        # 5 GB
+DEFAULT_MAX_AGE = 7 * 24 * 3600          # 7 days
+EVICT_EVERY = 64                         # puts between full directory scans
+EVICT_TARGET = 0.9                       # size eviction frees down to this share of max_bytes
+MAX_FILE_HASHES = 1024
+META_FILE = "meta.json"
+TEXT_FILE = "text.txt"
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """
+    Compute the SHA-256 hash of a file's contents.
+
+    Args:
+        file_path (str): Path to the file
+        chunk_size (int): Number of bytes read per iteration
+
+    Returns:
+        str: Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_text(text):
+    """Compute the SHA-256 hash of a UTF-8 string."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class StageCache:
+    """Persistent artifact cache for pipeline stages with size/age eviction."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._file_hashes = OrderedDict()
+        # Size of the entries on disk as of the last scan plus the entries
+        # stored since, so a put only rescans the directory when the cache
+        # may be over budget or every EVICT_EVERY puts (for max_age).
+        self._total_bytes = None
+        self._puts_since_evict = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, stage, *inputs):
+        """
+        Build a cache key from a stage name and its inputs.
+
+        Args:
+            stage (str): Stage name (e.g. "extract_audio")
+            *inputs: JSON-serializable stage inputs (hashes, model names, prompts)
+
+        Returns:
+            str: Hex digest identifying the stage invocation
+        """
+        payload = json.dumps([stage, *inputs], sort_keys=True, ensure_ascii=False)
+        return hash_text(payload)
+
+    def hash_file(self, file_path):
+        """
+        Hash a file, memoizing the result by path, size and modification time
+        so repeated reruns do not re-read large videos.
+        """
+        stat = os.stat(file_path)
+        memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            file_hash = self._file_hashes.get(memo_key)
+            if file_hash is not None:
+                self._file_hashes.move_to_end(memo_key)
+                return file_hash
+        file_hash = hash_file(file_path)
+        self._remember(memo_key, file_hash)
+        return file_hash
+
+    def remember_file_hash(self, file_path, file_hash):
+        """Record a hash computed elsewhere (e.g. while the file was written) so hash_file does not re-read it."""
+        stat = os.stat(file_path)
+        self._remember((os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns), file_hash)
+
+    def _remember(self, memo_key, file_hash):
+        with self._lock:
+            self._file_hashes[memo_key] = file_hash
+            self._file_hashes.move_to_end(memo_key)
+            while len(self._file_hashes) > MAX_FILE_HASHES:
+                self._file_hashes.popitem(last=False)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _touch(self, entry_dir):
+        try:
+            os.utime(entry_dir, None)
+        except OSError:
+            pass
+
+    def get_files(self, key, targets):
+        """
+        Restore cached files for a key.
+
+        Args:
+            key (str): Cache key from make_key
+            targets (dict): Mapping of artifact name to destination path
+
+        Returns:
+            bool: True if every artifact was found and restored
+        """
+        entry_dir = self._entry_dir(key)
+        sources = {name: os.path.join(entry_dir, name) for name in targets}
+        if not all(os.path.exists(path) for path in sources.values()):
+            return False
+
+        try:
+            for name, dest in targets.items():
+                dest_dir = os.path.dirname(dest)
+                if dest_dir:
+                    os.makedirs(dest_dir, exist_ok=True)
+                # Copy rather than hard-link: later stages overwrite some
+                # artifacts in place, which would corrupt a linked cache entry.
+                shutil.copyfile(sources[name], dest)
+        except OSError:
+            # Evicted by another job while being copied: a miss, so the stage recomputes
+            return False
+
+        self._touch(entry_dir)
+        return True
+
+    def put_files(self, key, sources):
+        """
+        Store files under a key.
+
+        Args:
+            key (str): Cache key from make_key
+            sources (dict): Mapping of artifact name to source path
+        """
+        self._store(key, lambda tmp_dir: [
+            shutil.copyfile(path, os.path.join(tmp_dir, name))
+            for name, path in sources.items()
+        ])
+
+    def get_text(self, key):
+        """Return cached text for a key, or None if absent."""
+        entry_dir = self._entry_dir(key)
+        text_path = os.path.join(entry_dir, TEXT_FILE)
+        if not os.path.exists(text_path):
+            return None
+        try:
+            with open(text_path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            # Evicted by another job since the check
+            return None
+        self._touch(entry_dir)
+        return text
+
+    def put_text(self, key, text):
+        """Store text under a key."""
+        def write(tmp_dir):
+            with open(os.path.join(tmp_dir, TEXT_FILE), "w", encoding="utf-8") as f:
+                f.write(text)
+        self._store(key, write)
+
+    def _store(self, key, write_contents):
+        entry_dir = self._entry_dir(key)
+        tmp_dir = os.path.join(self.cache_dir, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        stored = False
+        try:
+            write_contents(tmp_dir)
+            size = sum(
+                os.path.getsize(os.path.join(tmp_dir, name))
+                for name in os.listdir(tmp_dir)
+            )
+            with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+                json.dump({"created": time.time(), "size": size}, f)
+
+            # Rename is atomic, so readers never see a half-written entry. If
+            # a concurrent job already stored this key, its entry is kept.
+            if not os.path.exists(entry_dir):
+                try:
+                    os.replace(tmp_dir, entry_dir)
+                    stored = True
+                except OSError:
+                    pass
+        finally:
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        with self._lock:
+            if stored and self._total_bytes is not None:
+                self._total_bytes += size
+            self._puts_since_evict += 1
+            due = (
+                self._total_bytes is None
+                or self._puts_since_evict >= EVICT_EVERY
+                or (self.max_bytes is not None and self._total_bytes > self.max_bytes)
+            )
+        if due:
+            self.evict()
+
+    def cached_files(self, key, outputs, produce):
+        """
+        Restore a stage's output files from the cache, or run the stage and
+        cache its outputs.
+
+        Args:
+            key (str): Cache key from make_key
+            outputs (dict): Mapping of artifact name to the path the stage writes
+            produce (callable): Runs the stage, writing every path in outputs
+
+        Returns:
+            bool: True if the outputs came from the cache
+        """
+        if self.get_files(key, outputs):
+            return True
+        produce()
+        self.put_files(key, outputs)
+        return False
+
+    def cached_text(self, key, produce):
+        """
+        Return a stage's text output from the cache, or run the stage and
+        cache its result.
+
+        Args:
+            key (str): Cache key from make_key
+            produce (callable): Runs the stage and returns its text output
+
+        Returns:
+            tuple: (text, cache_hit)
+        """
+        text = self.get_text(key)
+        if text is not None:
+            return text, True
+        text = produce()
+        self.put_text(key, text)
+        return text, False
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            meta_path = os.path.join(entry_dir, META_FILE)
+            if name.startswith(".tmp-") or not os.path.exists(meta_path):
+                continue
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                last_used = os.path.getmtime(entry_dir)
+            except (OSError, ValueError):
+                continue
+            entries.append((last_used, meta.get("created", last_used), meta.get("size", 0), entry_dir))
+        return entries
+
+    def evict(self):
+        """
+        Remove entries older than max_age, then, if the cache exceeds
+        max_bytes, least recently used entries until it is back under
+        EVICT_TARGET of max_bytes.
+
+        Puts call this every EVICT_EVERY puts or when the running size total
+        goes over max_bytes, not on every put.
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self._lock:
+            self._puts_since_evict = 0
+        now = time.time()
+        removed = 0
+        kept = []
+        for last_used, created, size, entry_dir in self._entries():
+            if self.max_age is not None and now - created > self.max_age:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                removed += 1
+            else:
+                kept.append((last_used, size, entry_dir))
+
+        total = sum(size for _, size, _ in kept)
+        if self.max_bytes is not None and total > self.max_bytes:
+            # Free some headroom so the next few puts do not each trigger a scan
+            for last_used, size, entry_dir in sorted(kept):
+                if total <= self.max_bytes * EVICT_TARGET:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+                removed += 1
+
+        with self._lock:
+            self._total_bytes = total
+        return removed
+
+    def clear(self):
+        """Remove every cache entry."""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._lock:
+            self._total_bytes = 0
+            self._puts_since_evict = 0
@@ -0,0 +1,222 @@
+"""
+Dependency-graph scheduling of pipeline stages.
+
+Each stage declares the values it reads and the values it produces, and
+the graph starts a stage as soon as everything it reads is available. Stages
+that do not depend on each other therefore overlap: Demucs separation runs
+while transcription, translation and TTS wait on the Fanar API, and the
+branches of a multi-language job run side by side.
+
+Stages run on threads. The stages that are CPU-bound do their work outside
+the interpreter (Demucs in SeparationService worker processes or the Demucs
+CLI, ffmpeg), and the API stages spend their time waiting on the network,
+so a thread per running stage is enough to keep them all busy.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import tracing
+
+
+class PipelineError(Exception):
+    """Raised when a pipeline stage fails; carries the stage name."""
+
+    def __init__(self, stage, error):
+        self.stage = stage
+        super().__init__(f"{stage} failed: {error}")
+
+
+class Stage:
+    """One node of a StageGraph."""
+
+    def __init__(self, name, fn, inputs, outputs, when):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.when = when
+        self.started = self.finished = None
+        self.skipped = False
+
+    @property
+    def depends_on(self):
+        return self.inputs + ((self.when,) if self.when else ())
+
+
+class StageGraph:
+    """
+    Stages of one job and the values they pass to each other.
+
+    Stages are added in an order where every value a stage reads is either
+    given up front or produced by a stage added before it, so the graph can
+    have no cycles and no missing inputs.
+    """
+
+    def __init__(self, values=None):
+        """
+        Args:
+            values (dict): Values known before any stage runs
+        """
+        self.values = dict(values or {})
+        self.stages = []
+        self._producers = {}
+        self.started = self.finished = None
+
+    def add(self, name, fn, inputs=(), outputs=(), when=None):
+        """
+        Add a stage.
+
+        Args:
+            name (str): Stage name, as shown in progress, journals and traces
+            fn (callable): Called with the values named in inputs, in order; returns the
+                values named in outputs: nothing, a single value, or a tuple for several
+            inputs (tuple): Names of the values the stage reads
+            outputs (tuple): Names of the values the stage produces
+            when (str): Name of a value; the stage is skipped, producing None for each of
+                its outputs, if that value is false
+        """
+        stage = Stage(name, fn, inputs, outputs, when)
+        for value in stage.depends_on:
+            if value not in self.values and value not in self._producers:
+                raise ValueError(f"Stage {name!r} reads {value!r}, which no earlier stage produces")
+        for value in stage.outputs:
+            if value in self.values or value in self._producers:
+                raise ValueError(f"Stage {name!r} produces {value!r}, which is already produced")
+            self._producers[value] = stage
+        self.stages.append(stage)
+        return stage
+
+    def run(self, job):
+        """
+        Run every stage, each as soon as the values it reads are available.
+
+        A failing stage stops new stages from starting; the stages already
+        running are waited for, and the first failure is raised. A stage
+        that returns the wrong number of values fails, and so does the run
+        if some stage never gets all of its inputs.
+
+        Args:
+            job (Job): Job reporting the running stages
+
+        Returns:
+            dict: Every value, given and produced
+        """
+        values = self.values
+        pending = list(self.stages)
+        running = {}
+        error = None
+        self.started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, len(self.stages)), thread_name_prefix="stage") as executor:
+            while pending or running:
+                ready = [] if error else [s for s in pending if all(v in values for v in s.depends_on)]
+                for stage in ready:
+                    pending.remove(stage)
+                    if stage.when and not values[stage.when]:
+                        stage.skipped = True
+                        stage.started = stage.finished = time.perf_counter()
+                        values.update(dict.fromkeys(stage.outputs))
+                        continue
+                    args = [values[value] for value in stage.inputs]
+                    running[executor.submit(tracing.propagate(self._run_stage), job, stage, args)] = stage
+                if ready and not running:
+                    continue  # Skipped stages may have made others ready
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        values.update(future.result())
+                    except Exception as e:
+                        error = error or e
+        self.finished = time.perf_counter()
+        if error is not None:
+            raise error
+        if pending:
+            stuck = "; ".join(
+                f"{stage.name} (missing {', '.join(v for v in stage.depends_on if v not in values)})"
+                for stage in pending
+            )
+            raise PipelineError(pending[0].name, f"stages never became ready: {stuck}")
+        return values
+
+    @staticmethod
+    def _run_stage(job, stage, args):
+        job.begin_stage(stage.name)
+        stage.started = time.perf_counter()
+        try:
+            with tracing.span(stage.name, kind="stage"):
+                result = stage.fn(*args)
+        except PipelineError:
+            raise
+        except Exception as e:
+            # The stage stays listed as running, like a failed stage of a sequential job
+            raise PipelineError(stage.name, e)
+        finally:
+            stage.finished = time.perf_counter()
+        if len(stage.outputs) == 1:
+            result = (result,)
+        elif result is None:
+            result = ()
+        elif not isinstance(result, (tuple, list)):
+            result = (result,)
+        if len(result) != len(stage.outputs):
+            raise PipelineError(
+                stage.name,
+                f"returned {len(result)} value(s) for outputs {stage.outputs}",
+            )
+        job.end_stage(stage.name)
+        return dict(zip(stage.outputs, result))
+
+    def critical_path(self):
+        """
+        Return the chain of stages that set the length of the last run.
+
+        Starting from the stage that finished last, each step goes to the
+        producer of its inputs that finished last, i.e. the one the stage was
+        waiting for. Speeding up any other stage does not shorten the run.
+
+        Returns:
+            list: dicts with stage, start_s, wall_s and wait_s (time between the
+                previous stage on the path finishing and this one starting), in order
+        """
+        ran = [stage for stage in self.stages if stage.finished is not None]
+        if not ran:
+            return []
+        path = []
+        stage = max(ran, key=lambda s: s.finished)
+        while stage is not None:
+            path.append(stage)
+            producers = [self._producers[value] for value in stage.depends_on if value in self._producers]
+            stage = max(producers, key=lambda s: s.finished, default=None)
+        path.reverse()
+        rows = []
+        previous_end = self.started
+        for stage in path:
+            if not stage.skipped:
+                rows.append({
+                    "stage": stage.name,
+                    "start_s": round(stage.started - self.started, 3),
+                    "wall_s": round(stage.finished - stage.started, 3),
+                    "wait_s": round(stage.started - previous_end, 3),
+                })
+            previous_end = stage.finished
+        return rows
+
+    def summary(self):
+        """
+        Return the last run's length, critical path length and total stage time.
+
+        The difference between the stage time and the run length is the time
+        the scheduler saved by overlapping stages.
+
+        Returns:
+            dict: wall_s, critical_path_s and stage_s
+        """
+        ran = [stage for stage in self.stages if stage.finished is not None and not stage.skipped]
+        return {
+            "wall_s": round(self.finished - self.started, 3),
+            "critical_path_s": round(sum(row["wall_s"] for row in self.critical_path()), 3),
+            "stage_s": round(sum(stage.finished - stage.started for stage in ran), 3),
+        }
@@ -0,0 +1,203 @@
+"""
+Silence-aware chunking and parallel transcription.
+
+Long audio is resampled once to 16 kHz mono, split at silence boundaries
+into chunks of at most 30 seconds, and the chunks are transcribed
+concurrently with the short-form STT model. The results are merged into a
+timestamped segment list, so wall-clock STT time follows the slowest chunk
+rather than the length of the whole file.
+"""
+
+import os
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio_store import open_audio, read_wav_header, is_pcm16
+from dubbing_utils import run_ffmpeg, select_transcription_model
+from tracing import propagate
+
+
+STT_SAMPLE_RATE = 16000
+FRAME_MS = 30
+MAX_CHUNK_SECONDS = 30
+MIN_CHUNK_SECONDS = 5
+MIN_SILENCE_MS = 300
+DEFAULT_MAX_WORKERS = 4
+
+
+def resample_for_stt(audio_file, output_file):
+    """Convert audio to 16 kHz mono 16-bit PCM WAV."""
+    run_ffmpeg([
+        '-i', audio_file,
+        '-ac', '1',
+        '-ar', str(STT_SAMPLE_RATE),
+        '-c:a', 'pcm_s16le',
+        output_file
+    ])
+    return output_file
+
+
+def frame_energies(wav_file, frame_ms=FRAME_MS, block_frames=2000):
+    """
+    Compute per-frame RMS energy in dBFS of a mono 16-bit WAV, reading it in
+    blocks so memory stays constant regardless of duration.
+
+    Args:
+        wav_file (str): Path to mono 16-bit PCM WAV file
+        frame_ms (int): Analysis frame length in milliseconds
+        block_frames (int): Number of analysis frames read per block
+
+    Returns:
+        tuple: (energies_db as float32 array, samples per frame, sample rate, total samples)
+    """
+    header = read_wav_header(wav_file)
+    if not is_pcm16(header) or header["channels"] != 1:
+        raise ValueError(f"Expected mono 16-bit PCM WAV: {wav_file}")
+    audio = open_audio(wav_file)
+    sample_rate = audio.sample_rate
+    total_samples = audio.frames
+    frame_len = sample_rate * frame_ms // 1000
+
+    energies = []
+    for block in audio.blocks(frame_len * block_frames):
+        block = block[:, 0]
+        n_frames = -(-block.size // frame_len)
+        padded = np.zeros(n_frames * frame_len, dtype=np.float32)
+        padded[:block.size] = block / 32768.0
+        rms = np.sqrt(np.mean(padded.reshape(n_frames, frame_len) ** 2, axis=1))
+        energies.append(20 * np.log10(rms + 1e-10))
+
+    energies_db = np.concatenate(energies).astype(np.float32) if energies else np.zeros(0, dtype=np.float32)
+    return energies_db, frame_len, sample_rate, total_samples
+
+
+def speech_mask(energies_db, margin_db=10.0, headroom_db=20.0, floor_db=-60.0):
+    """
+    Classify frames as speech using an adaptive energy threshold: above the
+    estimated noise floor, but never closer than headroom_db to the loud
+    frames, so audio with little silence is not classified as all silence.
+
+    Returns:
+        numpy.ndarray: Boolean array, True for speech frames
+    """
+    if energies_db.size == 0:
+        return np.zeros(0, dtype=bool)
+    noise_floor, loud_level = np.percentile(energies_db, [10, 90])
+    threshold = max(min(noise_floor + margin_db, loud_level - headroom_db), floor_db)
+    return energies_db > threshold
+
+
+def plan_chunks(energies_db, frame_ms=FRAME_MS, max_chunk_seconds=MAX_CHUNK_SECONDS,
+                min_chunk_seconds=MIN_CHUNK_SECONDS, min_silence_ms=MIN_SILENCE_MS):
+    """
+    Choose chunk boundaries at silences so no chunk exceeds max_chunk_seconds.
+
+    Cuts are placed in the middle of the last long-enough silence before the
+    limit; if there is none, at the quietest frame in the second half of the
+    window. Chunks without any speech are dropped.
+
+    Returns:
+        list: (start_frame, end_frame) tuples
+    """
+    is_speech = speech_mask(energies_db)
+    n = is_speech.size
+    if n == 0:
+        return []
+
+    max_frames = max_chunk_seconds * 1000 // frame_ms
+    min_frames = min_chunk_seconds * 1000 // frame_ms
+    min_silence_frames = max(1, min_silence_ms // frame_ms)
+
+    # Midpoints of silent runs that are long enough to cut at
+    padded = np.concatenate(([True], is_speech, [True]))
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    run_starts, run_ends = edges[::2], edges[1::2]
+    long_runs = (run_ends - run_starts) >= min_silence_frames
+    cut_points = (run_starts[long_runs] + run_ends[long_runs]) // 2
+
+    chunks = []
+    start = 0
+    while start < n:
+        limit = start + max_frames
+        if limit >= n:
+            end = n
+        else:
+            candidates = cut_points[(cut_points > start + min_frames) & (cut_points <= limit)]
+            if candidates.size:
+                end = int(candidates[-1])
+            else:
+                window_start = start + max_frames // 2
+                end = window_start + int(np.argmin(energies_db[window_start:limit]))
+                end = max(end, start + 1)
+        if is_speech[start:end].any():
+            chunks.append((start, end))
+        start = end
+    return chunks
+
+
+def write_chunk(wav_file, output_file, start_sample, end_sample):
+    """Copy a sample range of a WAV file into a new WAV file, straight from its mapped samples."""
+    audio = open_audio(wav_file)
+    with wave.open(output_file, 'wb') as dst:
+        dst.setnchannels(audio.channels)
+        dst.setsampwidth(2)
+        dst.setframerate(audio.sample_rate)
+        dst.writeframes(audio.view(start_sample, end_sample))
+    return output_file
+
+
+def transcribe_chunked(client, audio_file, work_dir, max_chunk_seconds=MAX_CHUNK_SECONDS,
+                       max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Transcribe audio by splitting it at silences and transcribing the chunks
+    concurrently.
+
+    Args:
+        client (FanarAPIClient): Fanar API client
+        audio_file (str): Path to input audio file
+        work_dir (str): Directory for the resampled audio and chunk files
+        max_chunk_seconds (int): Maximum chunk duration
+        max_workers (int): Maximum number of concurrent transcription requests
+
+    Returns:
+        dict: {"text": full transcript, "segments": [{"start", "end", "text"}, ...]}
+              with times in seconds
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    stt_wav = resample_for_stt(audio_file, os.path.join(work_dir, "stt_16k.wav"))
+
+    energies_db, frame_len, sample_rate, total_samples = frame_energies(stt_wav)
+    chunks = plan_chunks(energies_db, max_chunk_seconds=max_chunk_seconds)
+    print(f"Split audio into {len(chunks)} chunks for transcription")
+
+    def transcribe(index_chunk):
+        index, (start_frame, end_frame) = index_chunk
+        start_sample = start_frame * frame_len
+        end_sample = min(end_frame * frame_len, total_samples)
+        chunk_file = write_chunk(
+            stt_wav, os.path.join(work_dir, f"chunk_{index:04d}.wav"), start_sample, end_sample
+        )
+        duration = (end_sample - start_sample) / sample_rate
+        try:
+            result = client.transcribe_audio_fanar(chunk_file, model=select_transcription_model(duration))
+        except Exception as e:
+            raise Exception(f"Chunk {index} ({start_sample / sample_rate:.1f}s) failed: {e}")
+        finally:
+            os.remove(chunk_file)
+        return {
+            "start": round(start_sample / sample_rate, 3),
+            "end": round(end_sample / sample_rate, 3),
+            "text": (result.get("text") or "").strip(),
+        }
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(propagate(transcribe), enumerate(chunks)))
+
+    os.remove(stt_wav)
+    segments = [segment for segment in results if segment["text"]]
+    return {
+        "text": " ".join(segment["text"] for segment in segments),
+        "segments": segments,
+    }
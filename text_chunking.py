@@ -0,0 +1,102 @@
+"""
+Token-budgeted chunking of long texts for the chat and translation steps.
+
+Sending a whole transcript as one request overflows the model context on
+long videos and makes latency grow with the length of a single generation.
+Texts are instead split on sentence boundaries and packed into chunks of at
+most a token budget, each chunk carries the end of the previous one as
+read-only context, the chunks are processed concurrently, and the results
+are joined back in order.
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+from tts_timeline import split_sentences
+from tracing import propagate
+
+
+DEFAULT_CHUNK_TOKENS = 1000
+DEFAULT_OVERLAP_SENTENCES = 1
+DEFAULT_MAX_WORKERS = 4
+
+# Conservative average for English and Arabic with the Fanar tokenizer
+CHARS_PER_TOKEN = 3.5
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in text from its length."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _split_long(sentence, max_tokens):
+    """Split a sentence over the budget at word boundaries."""
+    pieces, current = [], []
+    for word in sentence.split():
+        if current and estimate_tokens(" ".join(current + [word])) > max_tokens:
+            pieces.append(" ".join(current))
+            current = []
+        current.append(word)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def chunk_text(text, max_tokens=DEFAULT_CHUNK_TOKENS, overlap_sentences=DEFAULT_OVERLAP_SENTENCES):
+    """
+    Pack the sentences of text into chunks of at most max_tokens.
+
+    Args:
+        text (str): Text to split
+        max_tokens (int): Token budget of a chunk's own text
+        overlap_sentences (int): Sentences of the previous chunk passed along as context
+
+    Returns:
+        list: {"index", "text", "context"} dicts in order; "context" is empty for the first chunk
+    """
+    sentences = []
+    for sentence in split_sentences(text, min_chars=0):
+        sentences.extend(_split_long(sentence, max_tokens) if estimate_tokens(sentence) > max_tokens else [sentence])
+
+    groups, current, current_tokens = [], [], 0
+    for sentence in sentences:
+        tokens = estimate_tokens(sentence) + 1
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+
+    return [
+        {
+            "index": i,
+            "text": " ".join(group),
+            "context": " ".join(groups[i - 1][-overlap_sentences:]) if i > 0 and overlap_sentences else "",
+        }
+        for i, group in enumerate(groups)
+    ]
+
+
+def map_chunks(chunks, process, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Process chunks concurrently and return the results in chunk order.
+
+    Args:
+        chunks (list): Chunks from chunk_text
+        process (callable): Called with one chunk, returns its result
+        max_workers (int): Maximum number of concurrent requests
+
+    Returns:
+        list: Results in the same order as chunks
+    """
+    if len(chunks) <= 1:
+        return [process(chunk) for chunk in chunks]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        return list(executor.map(propagate(process), chunks))
+
+
+def join_chunks(results):
+    """Join processed chunk texts back into one text."""
+    return " ".join(result.strip() for result in results if result and result.strip())
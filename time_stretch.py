@@ -0,0 +1,145 @@
+"""
+Pitch-preserving time-stretch for fitting speech to a target duration.
+
+Implements WSOLA (waveform-similarity overlap-add) over NumPy arrays. Only
+the choice of each frame's source position is sequential, and it runs on a
+decimated mono copy of the signal. Gathering the frames and overlap-adding
+them is fully vectorized, because the synthesis hop is exactly half a frame.
+"""
+
+import numpy as np
+
+
+DEFAULT_FRAME_MS = 40
+DEFAULT_TOLERANCE_MS = 10
+DEFAULT_MAX_RATIO = 1.3
+SEARCH_SAMPLE_RATE = 8000
+
+
+def time_stretch(samples, factor, sample_rate, frame_ms=DEFAULT_FRAME_MS, tolerance_ms=DEFAULT_TOLERANCE_MS):
+    """
+    Change the duration of audio by factor without changing its pitch.
+
+    Args:
+        samples (numpy.ndarray): Audio of shape (n,) or (n, channels)
+        factor (float): Output duration divided by input duration (>1 slows down)
+        sample_rate (int): Sample rate in Hz
+        frame_ms (int): Analysis frame length in milliseconds
+        tolerance_ms (int): Maximum shift of a frame from its nominal position
+            when searching for the most similar waveform
+
+    Returns:
+        numpy.ndarray: float32 audio of round(n * factor) samples, same channel layout
+    """
+    x = np.asarray(samples, dtype=np.float32)
+    mono_input = x.ndim == 1
+    if mono_input:
+        x = x[:, None]
+    n = x.shape[0]
+    out_len = int(round(n * factor))
+    if factor <= 0:
+        raise ValueError("Stretch factor must be positive")
+
+    half = max(int(sample_rate * frame_ms / 2000), 8)
+    frame_len = 2 * half
+    synthesis_hop = half
+    analysis_hop = synthesis_hop / factor
+    tolerance = int(sample_rate * tolerance_ms / 1000)
+    if n < frame_len + 2 * tolerance or abs(factor - 1.0) < 1e-3:
+        return _fit_length(x, out_len)[:, 0] if mono_input else _fit_length(x, out_len)
+
+    n_frames = out_len // synthesis_hop + 2
+
+    # Pad so every candidate frame (nominal position +- tolerance, plus the
+    # natural continuation of the previous frame) stays in bounds
+    pad_front = tolerance
+    pad_back = frame_len + synthesis_hop + 2 * tolerance + int(np.ceil(analysis_hop)) + 1
+    xp = np.pad(x, ((pad_front, pad_back), (0, 0)))
+
+    positions = _select_positions(xp.mean(axis=1), n_frames, analysis_hop, synthesis_hop,
+                                  frame_len, tolerance, pad_front, sample_rate)
+
+    # Gather all frames at once: (n_frames, frame_len, channels)
+    window = np.hanning(frame_len + 2)[1:-1].astype(np.float32)
+    frames = xp[positions[:, None] + np.arange(frame_len)] * window[None, :, None]
+
+    # With hop = frame_len / 2, output block k is the first half of frame k
+    # plus the second half of frame k - 1
+    heads = frames[:, :half]
+    tails = np.concatenate([np.zeros_like(frames[:1, half:]), frames[:-1, half:]])
+    output = (heads + tails).reshape(-1, x.shape[1])
+
+    norm = window[:half] + window[half:]
+    output /= np.tile(np.maximum(norm, 1e-3), n_frames)[:, None]
+
+    # The first half-frame only has one window contributing; skip it
+    output = _fit_length(output[half:], out_len)
+    return output[:, 0] if mono_input else output
+
+
+def _select_positions(mono, n_frames, analysis_hop, synthesis_hop, frame_len, tolerance, offset, sample_rate):
+    """Pick each frame's source position by maximizing waveform similarity."""
+    # Search on a decimated copy: similarity only needs the low-frequency shape
+    step = max(1, sample_rate // SEARCH_SAMPLE_RATE)
+    guide = mono[::step]
+    frame_d = max(frame_len // step, 1)
+    tol_d = max(tolerance // step, 1)
+    hop_d = synthesis_hop / step
+
+    positions = np.empty(n_frames, dtype=np.int64)
+    positions[0] = offset
+    prev = offset / step
+    for k in range(1, n_frames):
+        nominal = offset + k * analysis_hop
+        natural = int(round(prev + hop_d))
+        template = guide[natural:natural + frame_d]
+        lo = max(int(round(nominal / step)) - tol_d, 0)
+        region = guide[lo:lo + 2 * tol_d + frame_d]
+        if template.size < frame_d or region.size < frame_d:
+            best = int(round(nominal / step))
+        else:
+            scores = np.correlate(region, template, mode='valid')
+            best = lo + int(np.argmax(scores))
+        prev = best
+        # Keep full-rate positions within the tolerance of the nominal position
+        positions[k] = min(max(best * step, int(nominal) - tolerance), int(nominal) + tolerance)
+    return positions
+
+
+def _fit_length(x, length):
+    """Pad with silence or trim to exactly length samples."""
+    if x.shape[0] >= length:
+        return np.ascontiguousarray(x[:length])
+    return np.pad(x, ((0, length - x.shape[0]), (0, 0)))
+
+
+def fit_to_duration(samples, target_length, sample_rate, max_ratio=DEFAULT_MAX_RATIO, expand=True):
+    """
+    Time-stretch audio towards target_length samples, limited to max_ratio,
+    then pad with silence or trim any remaining difference.
+
+    Args:
+        samples (numpy.ndarray): Audio of shape (n,) or (n, channels)
+        target_length (int): Desired number of samples
+        sample_rate (int): Sample rate in Hz
+        max_ratio (float): Maximum speed-up or slow-down (e.g. 1.3 = 30%)
+        expand (bool): Whether audio shorter than the target may be slowed down
+
+    Returns:
+        tuple: (float32 audio of exactly target_length samples, applied stretch factor)
+    """
+    x = np.asarray(samples, dtype=np.float32)
+    if x.shape[0] == 0 or target_length <= 0:
+        shape = (max(target_length, 0),) + x.shape[1:]
+        return np.zeros(shape, dtype=np.float32), 1.0
+
+    factor = target_length / x.shape[0]
+    factor = min(max(factor, 1.0 / max_ratio), max_ratio if expand else 1.0)
+    if abs(factor - 1.0) >= 0.01:
+        x = time_stretch(x, factor, sample_rate)
+    else:
+        factor = 1.0
+
+    mono_input = x.ndim == 1
+    fitted = _fit_length(x[:, None] if mono_input else x, target_length)
+    return (fitted[:, 0] if mono_input else fitted), factor
@@ -0,0 +1,458 @@
+"""
+Per-stage tracing and process-wide metrics for the dubbing pipeline.
+
+A trace covers one job. Every pipeline stage becomes a span recording wall
+time, the CPU time of its thread and the process's peak RSS while it ran,
+and every Fanar API call becomes a child span
+of the stage that made it, with bytes sent and received, audio seconds
+processed and retries. Finished traces are written as JSON in the Chrome
+trace event format (open in chrome://tracing or Perfetto), and latency
+histograms per endpoint and model are served as Prometheus text.
+
+Tracing is off unless DUBBING_TRACING is set or set_enabled(True) is called;
+while off, span() returns a shared no-op span and nothing is measured.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+TRACE_FILE = "trace.json"
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+STAGE_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+RSS_SAMPLE_INTERVAL = 0.05
+COUNTERS = ("bytes_in", "bytes_out", "audio_seconds", "retries")
+
+_enabled = os.getenv("DUBBING_TRACING", "").lower() in ("1", "true", "yes")
+
+# (trace, span) of the code running in this context
+_current = contextvars.ContextVar("tracing_current", default=(None, None))
+
+
+def enabled():
+    """Whether spans are being recorded."""
+    return _enabled
+
+
+def set_enabled(flag):
+    """Turn tracing on or off for the whole process."""
+    global _enabled
+    _enabled = bool(flag)
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None if it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        # High-water mark rather than current size; kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return None
+
+
+class _RssSampler:
+    """Background thread raising the peak process RSS seen by open stage spans."""
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._spans = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, span):
+        with self._lock:
+            self._spans.add(span)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+
+    def unwatch(self, span):
+        with self._lock:
+            self._spans.discard(span)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                spans = list(self._spans)
+                if not spans:
+                    self._thread = None
+                    return
+            rss = current_rss()
+            if rss is not None:
+                for span in spans:
+                    span.peak_rss = max(span.peak_rss or 0, rss)
+            time.sleep(self.interval)
+
+
+_sampler = _RssSampler()
+
+
+class Span:
+    """Timed section of work with counters; use as a context manager."""
+
+    def __init__(self, trace, parent, name, kind, attrs):
+        self.trace = trace
+        self.parent = parent
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.children = []
+        self.thread_id = threading.get_ident()
+        self.started = self.wall = self.cpu = self.peak_rss = None
+        self._token = None
+
+    def add(self, **counters):
+        """Increase counters (bytes_in, bytes_out, audio_seconds, retries)."""
+        for name, value in counters.items():
+            self.counters[name] += value
+
+    def set(self, **attrs):
+        """Set attributes describing the span."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.started = time.time()
+        self._wall_start = time.perf_counter()
+        # CPU time of this thread only: other stages and jobs run on other
+        # threads, so process CPU time would include their work too
+        self._cpu_start = time.thread_time()
+        self._token = _current.set((self.trace, self))
+        if self.kind == "stage":
+            self.peak_rss = current_rss()
+            _sampler.watch(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall = time.perf_counter() - self._wall_start
+        # A span closed from another thread than the one it was opened on
+        # has no meaningful thread CPU time
+        self.cpu = time.thread_time() - self._cpu_start if threading.get_ident() == self.thread_id else None
+        _current.reset(self._token)
+        if self.kind == "stage":
+            _sampler.unwatch(self)
+            rss = current_rss()
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss or 0, rss)
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc_value}"
+        if self.parent is not None:
+            self.parent._add_child(self)
+        if self.trace is not None:
+            self.trace._add(self)
+        metrics.record(self)
+        return False
+
+    def _add_child(self, span):
+        # Children may finish on worker threads
+        with _children_lock:
+            self.children.append(span)
+
+
+_children_lock = threading.Lock()
+
+
+class _NullSpan:
+    """Span returned while tracing is off; every operation is a no-op."""
+
+    def add(self, **counters):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def span(name, kind="stage", **attrs):
+    """
+    Create a span that becomes a child of the span active in this context.
+
+    Args:
+        name (str): Span name
+        kind (str): "stage" (samples the process's peak RSS), "api", or any other category
+        **attrs: Attributes stored with the span (endpoint, model, ...)
+
+    Returns:
+        Span: Context manager, or NULL_SPAN while tracing is off
+    """
+    if not _enabled:
+        return NULL_SPAN
+    trace, parent = _current.get()
+    return Span(trace, parent, name, kind, attrs)
+
+
+def current_span():
+    """Return the innermost open span of this context, or NULL_SPAN."""
+    if not _enabled:
+        return NULL_SPAN
+    return _current.get()[1] or NULL_SPAN
+
+
+def propagate(fn):
+    """
+    Wrap fn so that calls on pool threads record their spans under the span
+    that is active here, where the work was submitted.
+    """
+    if not _enabled:
+        return fn
+    current = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(current)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return run
+
+
+class Trace:
+    """Spans of one job, with one stage open at a time."""
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.started = time.time()
+        self.spans = []
+        self._stage = None
+        self._lock = threading.Lock()
+
+    def _add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def enter_stage(self, name):
+        """Close the open stage span and, unless name is None, open the next one."""
+        self.end_stage()
+        if name:
+            self._stage = span(name, kind="stage")
+            self._stage.__enter__()
+
+    def end_stage(self):
+        """Close the open stage span, if any."""
+        if self._stage is not None:
+            stage, self._stage = self._stage, None
+            stage.__exit__(None, None, None)
+
+    def stage_breakdown(self):
+        """
+        Return the timings of the finished stages in order, with the API calls
+        made from each stage summed up.
+
+        Returns:
+            list: dicts with stage, wall_s, cpu_s (the stage thread's CPU time),
+                process_rss_mb (peak RSS of the whole process while the stage ran),
+                api_calls, api_s, bytes_in, bytes_out, audio_s and retries
+        """
+        with self._lock:
+            stages = [s for s in self.spans if s.kind == "stage"]
+        rows = []
+        for stage in sorted(stages, key=lambda s: s.started):
+            calls = []
+            pending = list(stage.children)
+            while pending:
+                child = pending.pop()
+                if child.kind == "api":
+                    calls.append(child)
+                pending.extend(child.children)
+            rows.append({
+                "stage": stage.name,
+                "wall_s": round(stage.wall, 3),
+                "cpu_s": round(stage.cpu, 3) if stage.cpu is not None else None,
+                "process_rss_mb": round(stage.peak_rss / 1024 ** 2, 1) if stage.peak_rss else None,
+                "api_calls": len(calls),
+                "api_s": round(sum(call.wall for call in calls), 3),
+                "bytes_in": sum(call.counters["bytes_in"] for call in calls),
+                "bytes_out": sum(call.counters["bytes_out"] for call in calls),
+                "audio_s": round(sum(call.counters["audio_seconds"] for call in calls), 2),
+                "retries": sum(call.counters["retries"] for call in calls),
+            })
+        return rows
+
+    def to_chrome_trace(self):
+        """Return the spans as a Chrome trace event document."""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        events = []
+        for s in spans:
+            args = {**s.attrs, **{name: value for name, value in s.counters.items() if value}}
+            if s.cpu is not None:
+                args["thread_cpu_s"] = round(s.cpu, 4)
+            if s.peak_rss:
+                args["process_rss_mb"] = round(s.peak_rss / 1024 ** 2, 1)
+            events.append({
+                "name": s.name,
+                "cat": s.kind,
+                "ph": "X",
+                "ts": int(s.started * 1e6),
+                "dur": int(s.wall * 1e6),
+                "pid": pid,
+                "tid": s.thread_id,
+                "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"trace_id": self.trace_id}}
+
+    def write(self, path):
+        """Write the trace as JSON, atomically."""
+        temp_file = f"{path}.{os.getpid()}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False, default=str)
+        os.replace(temp_file, path)
+
+
+@contextmanager
+def trace(trace_id):
+    """
+    Collect the spans created in this context into a Trace.
+
+    Yields:
+        Trace: The trace, or None while tracing is off
+    """
+    if not _enabled:
+        yield None
+        return
+    job_trace = Trace(trace_id)
+    token = _current.set((job_trace, None))
+    try:
+        yield job_trace
+    finally:
+        job_trace.end_stage()
+        _current.reset(token)
+
+
+class Metrics:
+    """Process-wide histograms, counters and gauges fed by finished spans."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def _observe(self, name, labels, value, buckets):
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets),
+                                                 "sum": 0.0, "count": 0}
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram["counts"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+    def _increment(self, name, labels, value):
+        self._counters[(name, labels)] = self._counters.get((name, labels), 0) + value
+
+    def record(self, span):
+        """Update the metrics from a finished span."""
+        with self._lock:
+            if span.kind == "api":
+                endpoint = span.attrs.get("endpoint", span.name)
+                model = span.attrs.get("model") or ""
+                cached = bool(span.attrs.get("cached"))
+                self._increment("fanar_requests_total",
+                                (("endpoint", endpoint), ("model", model), ("cached", str(cached).lower())), 1)
+                if not cached:
+                    # Upstream latency only; cache hits would skew the distribution
+                    self._observe("fanar_request_duration_seconds", (("endpoint", endpoint), ("model", model)),
+                                  span.wall, LATENCY_BUCKETS)
+                for counter in COUNTERS:
+                    if span.counters[counter]:
+                        self._increment(f"fanar_request_{counter}_total", (("endpoint", endpoint),),
+                                        span.counters[counter])
+            elif span.kind == "stage":
+                labels = (("stage", span.name),)
+                self._observe("dubbing_stage_duration_seconds", labels, span.wall, STAGE_BUCKETS)
+                if span.cpu is not None:
+                    self._increment("dubbing_stage_thread_cpu_seconds_total", labels, span.cpu)
+                if span.peak_rss:
+                    # RSS is a property of the process, not of the stage, so
+                    # it is kept as one process-wide high-water mark
+                    key = ("process_resident_memory_peak_bytes", ())
+                    self._gauges[key] = max(self._gauges.get(key, 0), span.peak_rss)
+
+    def prometheus_text(self):
+        """Render every metric in the Prometheus text exposition format."""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+            return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} histogram")
+                    seen.add(name)
+                for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                    lines.append(f"{name}_bucket{label_text(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{label_text(labels, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{name}_sum{label_text(labels)} {histogram['sum']:.6f}")
+                lines.append(f"{name}_count{label_text(labels)} {histogram['count']}")
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                for (name, labels), value in sorted(values.items()):
+                    if name not in seen:
+                        lines.append(f"# TYPE {name} {kind}")
+                        seen.add(name)
+                    lines.append(f"{name}{label_text(labels)} {value if isinstance(value, int) else round(value, 6)}")
+        rss = current_rss()
+        if rss is not None:
+            lines.append("# TYPE process_resident_memory_bytes gauge")
+            lines.append(f"process_resident_memory_bytes {rss}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """
+    Serve the metrics as Prometheus text on http://host:port/metrics from a
+    daemon thread. Only local clients can connect unless host is set to an
+    external interface (e.g. "0.0.0.0").
+
+    Returns:
+        ThreadingHTTPServer: The running server (call shutdown() to stop it)
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,374 @@
+"""
+Sentence-level parallel TTS with timeline placement.
+
+The TTS text is split into sentences, each sentence is given a start time
+on the source timeline, the sentences are synthesized concurrently, and the
+clips are written into a single speech track at their start times as they
+complete. Synthesis latency scales with concurrency instead of text length,
+and speech stays aligned with the video instead of drifting and being cut
+off at the end.
+"""
+
+import difflib
+import os
+import re
+import wave
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio_store import open_audio, read_wav_header
+from time_stretch import time_stretch
+from tracing import propagate
+
+
+TTS_MODEL = "Fanar-Aura-TTS-1"
+TTS_VOICE = "default"
+DEFAULT_MAX_WORKERS = 4
+MIN_SENTENCE_CHARS = 20
+
+# A sentence runs up to and including its terminal punctuation (Latin or Arabic)
+SENTENCE_PATTERN = re.compile(r'[^.!?؟\n]+[.!?؟]*')
+
+
+def split_sentences(text, min_chars=MIN_SENTENCE_CHARS):
+    """
+    Split text into sentences, merging fragments shorter than min_chars into
+    the previous sentence so very short clips are not synthesized alone.
+
+    Args:
+        text (str): Text to split
+        min_chars (int): Minimum sentence length
+
+    Returns:
+        list: Sentence strings in order
+    """
+    sentences = []
+    for match in SENTENCE_PATTERN.finditer(text):
+        sentence = match.group().strip()
+        if not sentence:
+            continue
+        if sentences and len(sentence) < min_chars:
+            sentences[-1] = f"{sentences[-1]} {sentence}"
+        else:
+            sentences.append(sentence)
+    return sentences
+
+
+def align_sentences(sentences, total_duration, segments=None):
+    """
+    Assign each sentence a start and end time on the source timeline.
+
+    Sentences are spread over the speech regions of the source in proportion
+    to their character length: a sentence starting at fraction f of the text
+    starts at fraction f of the total speech time. Without transcription
+    segments the whole track counts as speech.
+
+    Args:
+        sentences (list): Sentence strings
+        total_duration (float): Duration of the source audio in seconds
+        segments (list): Optional transcription segments with "start"/"end" in seconds
+
+    Returns:
+        list: {"index", "text", "start", "end"} dicts
+    """
+    regions = [(s["start"], s["end"]) for s in (segments or []) if s["end"] > s["start"]]
+    if not regions:
+        regions = [(0.0, total_duration)]
+    region_lengths = np.array([end - start for start, end in regions])
+    region_offsets = np.concatenate(([0.0], np.cumsum(region_lengths)))
+    speech_time = region_offsets[-1]
+
+    lengths = np.array([len(sentence) for sentence in sentences], dtype=np.float64)
+    char_offsets = np.concatenate(([0.0], np.cumsum(lengths)))
+    fractions = char_offsets / max(char_offsets[-1], 1.0)
+
+    def to_timeline(speech_offset):
+        # Map an offset in concatenated speech time back onto the timeline
+        region = min(int(np.searchsorted(region_offsets, speech_offset, side='right')) - 1, len(regions) - 1)
+        return regions[region][0] + (speech_offset - region_offsets[region])
+
+    times = [to_timeline(fraction * speech_time) for fraction in fractions]
+    return [
+        {"index": i, "text": sentence, "start": round(times[i], 3), "end": round(times[i + 1], 3)}
+        for i, sentence in enumerate(sentences)
+    ]
+
+
+def realign_sentences(previous, sentences, total_duration):
+    """
+    Assign times to an edited list of sentences, keeping the placement of
+    every sentence whose text did not change.
+
+    The edit is diffed sentence by sentence against the previous timeline.
+    Unchanged sentences keep their slot and the position their audio was
+    placed at. Each run of changed sentences gets the gap between the
+    neighbouring unchanged clips: the new sentences are spread over the
+    slots of the sentences they replace, and may use the whole gap.
+
+    Args:
+        previous (list): Entries of the previous timeline, with "text", "start", "end",
+            "placed_start" and "placed_end"
+        sentences (list): Sentence strings of the edited text
+        total_duration (float): Duration of the speech track in seconds
+
+    Returns:
+        tuple: (timeline, gaps). Unchanged timeline entries carry their previous
+            fields; changed ones have "index", "text", "start" and "end" and no
+            "placed_start". gaps are (start, end, entries) with the changed entries
+            to write between two unchanged clips.
+    """
+    matcher = difflib.SequenceMatcher(None, [entry["text"] for entry in previous], sentences, autojunk=False)
+    timeline, gaps = [], []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            timeline.extend({**previous[i1 + k], "index": j1 + k} for k in range(j2 - j1))
+            continue
+        gap_start = previous[i1 - 1]["placed_end"] if i1 > 0 else 0.0
+        gap_end = previous[i2]["placed_start"] if i2 < len(previous) else total_duration
+        # New sentences take the slots of the replaced ones, or the whole gap for an insertion
+        slot_start = previous[i1]["start"] if i1 < i2 else gap_start
+        slot_end = previous[i2 - 1]["end"] if i1 < i2 else gap_end
+        slot_start = max(slot_start, gap_start)
+        if slot_end > slot_start:
+            entries = align_sentences(sentences[j1:j2], slot_end, [{"start": slot_start, "end": slot_end}])
+        else:
+            # No room was left: the clips go right after the previous one, at their natural speed
+            entries = [{"index": i, "text": sentence, "start": round(slot_start, 3), "end": round(slot_start, 3)}
+                       for i, sentence in enumerate(sentences[j1:j2])]
+        entries = [{**entry, "index": j1 + entry["index"]} for entry in entries]
+        timeline.extend(entries)
+        gaps.append((gap_start, gap_end, entries))
+    return timeline, gaps
+
+
+def _synthesize_clip(client, entry, work_dir, stage_cache, model, voice, on_samples=None):
+    """Synthesize one timeline entry into work_dir; returns the entry with "audio" and "key" added."""
+    clip_file = os.path.join(work_dir, f"sentence_{entry['index']:04d}.wav")
+    key = None
+    if stage_cache is not None:
+        key = stage_cache.make_key("tts", model, voice, entry["text"])
+        stage_cache.cached_files(
+            key,
+            {"speech.wav": clip_file},
+            lambda: client.text_to_speech(entry["text"], clip_file, model=model, voice=voice, on_samples=on_samples)
+        )
+    else:
+        client.text_to_speech(entry["text"], clip_file, model=model, voice=voice, on_samples=on_samples)
+    return {**entry, "audio": clip_file, "key": key}
+
+
+def synthesize_sentences(client, timeline, work_dir, stage_cache=None, model=TTS_MODEL,
+                         voice=TTS_VOICE, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Synthesize every sentence concurrently.
+
+    Args:
+        client (FanarAPIClient): Fanar API client
+        timeline (list): Sentences from align_sentences
+        work_dir (str): Directory for the per-sentence audio clips
+        stage_cache (StageCache): Optional cache, so repeated sentences are not re-synthesized
+        model (str): TTS model to use
+        voice (str): Voice to use
+        max_workers (int): Maximum number of concurrent TTS requests
+
+    Returns:
+        list: Timeline entries with "audio" (clip path) and "key" (cache key) added
+    """
+    os.makedirs(work_dir, exist_ok=True)
+
+    def synthesize(entry):
+        return _synthesize_clip(client, entry, work_dir, stage_cache, model, voice)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(propagate(synthesize), timeline))
+
+
+def load_clip(clip_file, sample_rate):
+    """Mono 16-bit samples of a clip at the given sample rate (a mapped view when no conversion is needed)."""
+    return open_audio(clip_file, sample_rate, 1).view()[:, 0]
+
+
+def fit_clip(samples, slot, sample_rate, max_stretch):
+    """Speed up int16 clip samples longer than slot samples by at most max_stretch, keeping the pitch."""
+    if max_stretch and 0 < slot < samples.size:
+        factor = max(slot / samples.size, 1.0 / max_stretch)
+        stretched = time_stretch(samples / 32768.0, factor, sample_rate)
+        samples = (np.clip(stretched, -1.0, 1.0) * 32767).astype(np.int16)
+    return samples
+
+
+class _SpeechTrack:
+    """
+    Mono 16-bit WAV written front to back, one clip at a time.
+
+    A clip starts at its start time, or right after the previous clip if
+    that one is still playing; the gaps are filled with silence and the
+    track is padded or trimmed to total_duration when it is closed.
+    """
+
+    def __init__(self, output_file, sample_rate, total_duration, max_stretch=None):
+        self.sample_rate = sample_rate
+        self.max_stretch = max_stretch
+        self.total_samples = int(round(total_duration * sample_rate)) if total_duration else None
+        self.position = 0
+        self._out = wave.open(output_file, 'wb')
+        self._out.setnchannels(1)
+        self._out.setsampwidth(2)
+        self._out.setframerate(sample_rate)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None and self.total_samples is not None:
+                self._write_silence(self.total_samples - self.position)
+        finally:
+            self._out.close()
+
+    def _write(self, samples):
+        if self.total_samples is not None:
+            samples = samples[:max(self.total_samples - self.position, 0)]
+        self._out.writeframes(samples.tobytes())
+        self.position += samples.size
+
+    def _write_silence(self, n_samples):
+        # Bounded blocks keep memory constant across long gaps
+        block = np.zeros(self.sample_rate, dtype=np.int16)
+        while n_samples > 0:
+            self._write(block[:min(n_samples, block.size)])
+            n_samples -= block.size
+
+    def place(self, clip, samples):
+        """Write a clip's mono samples; returns (start, end) in seconds where it was placed."""
+        start = max(int(round(clip["start"] * self.sample_rate)), self.position)
+        self._write_silence(start - self.position)
+        slot = int(round((clip.get("end", clip["start"]) - clip["start"]) * self.sample_rate))
+        samples = fit_clip(samples, slot, self.sample_rate, self.max_stretch)
+        placed_start = self.position
+        self._write(samples)
+        return placed_start / self.sample_rate, (placed_start + samples.size) / self.sample_rate
+
+
+def synthesize_and_place(client, timeline, work_dir, total_duration, output_file, stage_cache=None,
+                         model=TTS_MODEL, voice=TTS_VOICE, max_workers=DEFAULT_MAX_WORKERS, max_stretch=None):
+    """
+    Synthesize every sentence concurrently and write the clips into one mono
+    speech track at their start times, as they complete.
+
+    Clips are placed in start order. A clip longer than its slot ("end" -
+    "start") is sped up by at most max_stretch without changing pitch. A clip
+    that would still overlap the previous one starts right after it instead;
+    the track is padded with silence or trimmed to total_duration.
+
+    Each clip's samples are collected from the TTS stream as they arrive, so
+    a finished clip is written without reading it back, while the sentences
+    after it are still being synthesized. At most 2 * max_workers clips are
+    submitted ahead of the last one placed, which bounds the samples held.
+
+    Args:
+        client (FanarAPIClient): Fanar API client
+        timeline (list): Sentences from align_sentences
+        work_dir (str): Directory for the per-sentence audio clips
+        total_duration (float): Track duration in seconds, or None to end after the last clip
+        output_file (str): Output WAV path, at the first clip's sample rate
+        stage_cache (StageCache): Optional cache, so repeated sentences are not re-synthesized
+        model (str): TTS model to use
+        voice (str): Voice to use
+        max_workers (int): Maximum number of concurrent TTS requests
+        max_stretch (float): Maximum speed-up for clips longer than their slot, or None
+
+    Returns:
+        tuple: (clips, placements) - timeline entries with "audio" and "key" added,
+            and (start, end) in seconds where each was placed, in start order
+    """
+    os.makedirs(work_dir, exist_ok=True)
+
+    def synthesize(entry):
+        blocks = []
+        clip = _synthesize_clip(client, entry, work_dir, stage_cache, model, voice, on_samples=blocks.append)
+        return clip, blocks
+
+    def clip_samples(clip, blocks, sample_rate):
+        # Clips restored from the stage cache, or needing conversion, are read from disk
+        header = read_wav_header(clip["audio"]) if blocks else None
+        if (header is None or header["sample_rate"] != sample_rate or header["channels"] != 1
+                or header["frames"] != sum(block.shape[0] for block in blocks)):
+            return load_clip(clip["audio"], sample_rate)
+        return np.concatenate(blocks)[:, 0]
+
+    entries = iter(sorted(timeline, key=lambda entry: entry["start"]))
+    pending = deque()
+    clips, placements = [], []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, ExitStack() as stack:
+        def submit():
+            for entry in entries:
+                pending.append(executor.submit(propagate(synthesize), entry))
+                if len(pending) >= 2 * max_workers:
+                    return
+
+        submit()
+        track = None
+        while pending:
+            clip, blocks = pending.popleft().result()
+            submit()
+            if track is None:
+                sample_rate = open_audio(clip["audio"]).sample_rate
+                track = stack.enter_context(_SpeechTrack(output_file, sample_rate, total_duration, max_stretch))
+            placements.append(track.place(clip, clip_samples(clip, blocks, track.sample_rate)))
+            clips.append(clip)
+        if track is None:
+            stack.enter_context(_SpeechTrack(output_file, 24000, total_duration, max_stretch))
+    return clips, placements
+
+
+def patch_timeline(track_file, gaps, max_stretch=None):
+    """
+    Rewrite only the gaps of an existing speech track that hold changed clips.
+
+    Each gap is cleared and its clips are placed as synthesize_and_place would,
+    starting at their slot and one after the other. Nothing is written unless
+    every clip fits in its gap, since a clip running into the next unchanged
+    one would need everything after it moved.
+
+    Args:
+        track_file (str): Mono 16-bit WAV written by synthesize_and_place; patched in place
+        gaps (list): (start, end, clips) from realign_sentences, clips with "audio" added
+        max_stretch (float): Maximum speed-up for clips longer than their slot, or None
+
+    Returns:
+        list: (start, end) in seconds where each patched clip was placed, in gap
+            order, or None if a clip does not fit and the track must be rebuilt
+    """
+    header = read_wav_header(track_file)
+    sample_rate, total_samples = header["sample_rate"], header["frames"]
+
+    # Clips of the changed sentences only, so all of them are prepared before writing
+    writes, placements = [], []
+    for gap_start, gap_end, clips in gaps:
+        start = int(round(gap_start * sample_rate))
+        end = min(int(round(gap_end * sample_rate)), total_samples)
+        position = start
+        placed = []
+        for clip in clips:
+            slot = int(round((clip["end"] - clip["start"]) * sample_rate))
+            samples = fit_clip(load_clip(clip["audio"], sample_rate), slot, sample_rate, max_stretch)
+            clip_start = max(int(round(clip["start"] * sample_rate)), position)
+            if clip_start + samples.size > end:
+                return None
+            placed.append((clip_start, samples))
+            placements.append((clip_start / sample_rate, (clip_start + samples.size) / sample_rate))
+            position = clip_start + samples.size
+        writes.append((start, end, placed))
+
+    with open(track_file, "r+b") as f:
+        for start, end, placed in writes:
+            f.seek(header["data_offset"] + 2 * start)
+            f.write(bytes(2 * (end - start)))
+            for clip_start, samples in placed:
+                f.seek(header["data_offset"] + 2 * clip_start)
+                f.write(samples.tobytes())
+    return placements
@@ -0,0 +1,346 @@
+"""
+YouTube download and output file naming helpers, shared by the Streamlit
+UI and the batch runner.
+
+Downloads are audio-first: the audio-only adaptive stream is fetched first
+so audio extraction and transcription can start right away, while the
+video-only stream keeps downloading in the background in parallel byte
+ranges. Metadata is fetched once per video ID, and finished downloads are
+kept per video ID so repeat URLs do not download anything again, until
+prune_downloads removes videos unused for a week or beyond a size budget.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from pytubefix import YouTube, extract
+from pytubefix.cli import on_progress
+
+from dubbing_utils import run_ffmpeg
+
+
+DEFAULT_DOWNLOAD_DIR = ".youtube_cache"
+RANGE_CHUNK_SIZE = 8 * 1024 ** 2
+DEFAULT_RANGE_WORKERS = 4
+METADATA_FILE = "metadata.json"
+DEFAULT_MAX_AGE = 7 * 24 * 3600          # 7 days
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3       # 20 GB
+# Downloads used more recently than this are never evicted for size: a job may be reading them
+MIN_EVICT_AGE = 3600
+# Stream URLs are signed and expire after a few hours; fetch them again well before
+STREAM_URL_TTL = 30 * 60
+
+
+def youtube_video_id(url):
+    """Return the video ID of a YouTube URL, raising ValueError for anything else."""
+    # Basic URL validation
+    if not url or 'youtube.com' not in url and 'youtu.be' not in url:
+        raise ValueError("Please provide a valid YouTube URL")
+    try:
+        return extract.video_id(url)
+    except Exception:
+        raise ValueError("Please provide a valid YouTube URL")
+
+
+_youtube_objects = {}
+_youtube_lock = threading.Lock()
+
+
+def _youtube(video_id, refresh=False):
+    """
+    One YouTube object per video, so metadata and stream lists share a single
+    fetch. Objects are kept for STREAM_URL_TTL only, as their stream URLs expire.
+    """
+    now = time.time()
+    with _youtube_lock:
+        for key, (fetched, _) in list(_youtube_objects.items()):
+            if now - fetched > STREAM_URL_TTL:
+                del _youtube_objects[key]
+        if refresh:
+            _youtube_objects.pop(video_id, None)
+        if video_id not in _youtube_objects:
+            yt = YouTube(f"https://www.youtube.com/watch?v={video_id}", on_progress_callback=on_progress)
+            _youtube_objects[video_id] = (now, yt)
+        return _youtube_objects[video_id][1]
+
+
+def _download_selected(video_id, select, output_file, workers):
+    """
+    Download the stream chosen by select(streams) into output_file. A failed
+    download is retried once with freshly fetched stream URLs, in case the
+    cached ones expired (403).
+    """
+    for attempt in range(2):
+        stream = select(_youtube(video_id, refresh=attempt > 0).streams)
+        try:
+            download_stream(stream, output_file, workers)
+            return stream
+        except Exception as e:
+            if attempt:
+                raise
+            print(f"[youtube {video_id}] Download failed ({e}), retrying with fresh stream URLs")
+
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def prune_downloads(cache_dir=DEFAULT_DOWNLOAD_DIR, max_age=DEFAULT_MAX_AGE, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Remove downloaded videos not used for max_age seconds, then the least
+    recently used ones until the cache fits in max_bytes. A video counts as
+    used when a YouTubeDownload is created for it.
+
+    Returns:
+        int: Number of videos removed
+    """
+    now = time.time()
+    entries = []
+    for name in os.listdir(cache_dir) if os.path.isdir(cache_dir) else []:
+        path = os.path.join(cache_dir, name)
+        try:
+            entries.append((os.path.getmtime(path), _directory_size(path), path))
+        except OSError:
+            pass
+    entries.sort()
+
+    removed = 0
+    total = sum(size for _, size, _ in entries)
+    for used, size, path in entries:
+        expired = now - used > max_age
+        over_budget = total > max_bytes and now - used > MIN_EVICT_AGE
+        if not (expired or over_budget):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def _download_error(e):
+    """Translate a pytubefix failure into a readable error."""
+    error_msg = str(e)
+    if "HTTP Error 400" in error_msg:
+        return RuntimeError("YouTube API error. This might be due to region restrictions or video availability. Try a different video or check if the video is publicly available.")
+    elif "Video unavailable" in error_msg:
+        return RuntimeError("This video is not available for download. It might be private, age-restricted, or region-blocked.")
+    else:
+        return RuntimeError(f"Failed to download YouTube video: {error_msg}")
+
+
+def get_youtube_metadata(url, cache_dir=DEFAULT_DOWNLOAD_DIR):
+    """
+    Return the title, duration and author of a YouTube video, fetched once
+    per video ID and kept next to its downloads.
+
+    Returns:
+        dict: video_id, title, length (seconds) and author
+    """
+    video_id = youtube_video_id(url)
+    metadata_file = os.path.join(cache_dir, video_id, METADATA_FILE)
+    if os.path.exists(metadata_file):
+        with open(metadata_file, encoding="utf-8") as f:
+            return json.load(f)
+
+    yt = _youtube(video_id)
+    metadata = {"video_id": video_id, "title": yt.title, "length": yt.length, "author": yt.author}
+    os.makedirs(os.path.dirname(metadata_file), exist_ok=True)
+    temp_file = f"{metadata_file}.{uuid.uuid4().hex}"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False)
+    os.replace(temp_file, metadata_file)
+    return metadata
+
+
+def download_stream(stream, output_file, workers=DEFAULT_RANGE_WORKERS, chunk_size=RANGE_CHUNK_SIZE):
+    """
+    Download a stream into output_file, fetching byte ranges in parallel.
+
+    Falls back to pytubefix's sequential download when the size is unknown
+    or the stream is small. The file only appears under its final name once
+    it is complete.
+
+    Args:
+        stream (pytubefix.Stream): Stream to download
+        output_file (str): Destination path
+        workers (int): Number of ranges fetched concurrently
+        chunk_size (int): Bytes per range request
+
+    Returns:
+        str: output_file
+    """
+    partial_file = f"{output_file}.{uuid.uuid4().hex}.part"
+    try:
+        size = stream.filesize
+    except Exception:
+        size = 0
+
+    try:
+        if not size or workers <= 1 or size <= chunk_size:
+            stream.download(output_path=os.path.dirname(partial_file) or ".",
+                            filename=os.path.basename(partial_file), skip_existing=False, max_retries=2)
+        else:
+            with open(partial_file, "wb") as f:
+                f.truncate(size)
+
+            with requests.Session() as session:
+                def fetch(start):
+                    end = min(start + chunk_size, size) - 1
+                    response = session.get(stream.url, headers={"Range": f"bytes={start}-{end}"}, timeout=(10, 60))
+                    response.raise_for_status()
+                    if len(response.content) != end - start + 1:
+                        raise RuntimeError(f"Incomplete range {start}-{end} ({len(response.content)} bytes)")
+                    with open(partial_file, "r+b") as f:
+                        f.seek(start)
+                        f.write(response.content)
+
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    list(executor.map(fetch, range(0, size, chunk_size)))
+        os.replace(partial_file, output_file)
+    finally:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+    return output_file
+
+
+class YouTubeDownload:
+    """
+    Audio-first download of one YouTube video into cache_dir/<video id>/.
+
+    Creating the object starts the video-only stream downloading in the
+    background; download_audio() fetches the audio-only stream meanwhile.
+    Files that already exist from an earlier download are reused.
+    """
+
+    def __init__(self, url, cache_dir=DEFAULT_DOWNLOAD_DIR, workers=DEFAULT_RANGE_WORKERS, log=print):
+        """
+        Args:
+            url (str): YouTube URL
+            cache_dir (str): Directory keeping downloads and metadata per video ID
+            workers (int): Parallel range requests per stream
+            log (callable): Receives progress messages (st.info in the UI, print on the command line)
+        """
+        self.video_id = youtube_video_id(url)
+        self.directory = os.path.join(cache_dir, self.video_id)
+        self.workers = workers
+        self.log = log
+        try:
+            self.metadata = get_youtube_metadata(url, cache_dir)
+        except Exception as e:
+            raise _download_error(e)
+        # Marks the video as used, for prune_downloads
+        os.utime(self.directory)
+        log(f"Video Title: {self.metadata['title']}")
+        log(f"Duration: {self.metadata['length']} seconds")
+
+        self.audio_path = os.path.join(self.directory, "audio.m4a")
+        self.video_path = os.path.join(self.directory, "video.mp4")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"youtube-{self.video_id}")
+        self._video = self._executor.submit(self._download_video)
+        self._executor.shutdown(wait=False)
+
+    def _download_video(self):
+        if os.path.exists(self.video_path):
+            return self.video_path
+        def select(streams):
+            stream = (
+                streams.filter(adaptive=True, only_video=True, file_extension="mp4").order_by("resolution").desc().first()
+                or streams.get_highest_resolution()
+            )
+            if not stream:
+                raise RuntimeError("No suitable video stream found")
+            print(f"[youtube {self.video_id}] Downloading video: {stream.resolution} quality")
+            return stream
+
+        try:
+            _download_selected(self.video_id, select, self.video_path, self.workers)
+        except Exception as e:
+            raise _download_error(e)
+        return self.video_path
+
+    def download_audio(self):
+        """Download the audio-only stream (or reuse it) and return its path."""
+        if os.path.exists(self.audio_path):
+            self.log("Audio already downloaded")
+            return self.audio_path
+        def select(streams):
+            stream = streams.get_audio_only()
+            if not stream:
+                raise RuntimeError("No audio stream found")
+            self.log(f"Downloading audio: {stream.abr}")
+            return stream
+
+        try:
+            _download_selected(self.video_id, select, self.audio_path, self.workers)
+        except Exception as e:
+            raise _download_error(e)
+        file_size = os.path.getsize(self.audio_path) / (1024 * 1024)  # MB
+        self.log(f"Audio downloaded! File size: {file_size:.2f} MB")
+        return self.audio_path
+
+    @property
+    def video_done(self):
+        return self._video.done()
+
+    def wait_video(self):
+        """Block until the video stream is downloaded and return its path."""
+        return self._video.result()
+
+    def muxed_path(self):
+        """Return the video with its original audio, muxing it once without re-encoding."""
+        muxed_file = os.path.join(self.directory, "muxed.mp4")
+        if not os.path.exists(muxed_file):
+            temp_file = os.path.join(self.directory, f"muxed.{uuid.uuid4().hex}.mp4")
+            run_ffmpeg(['-i', self.wait_video(), '-i', self.download_audio(),
+                        '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy', temp_file])
+            os.replace(temp_file, muxed_file)
+        return muxed_file
+
+
+def get_video_title(input_video_path, youtube_url=None, log=print):
+    """Extract video title from YouTube URL or use filename for uploaded videos."""
+    if youtube_url:
+        try:
+            # Served from the metadata cache after the first fetch
+            title = get_youtube_metadata(youtube_url)["title"]
+            if title and title.strip():
+                return title.strip()
+        except Exception as e:
+            log(f"Could not extract YouTube title: {e}")
+
+    # For uploaded videos, use the filename without extension
+    if input_video_path:
+        base_name = os.path.splitext(os.path.basename(input_video_path))[0]
+        # Remove common prefixes/suffixes
+        base_name = base_name.replace("uploaded_video", "").replace("downloaded_youtube_video", "")
+        if base_name.strip():
+            return base_name.strip()
+
+    return "video"
+
+
+def sanitize_filename(filename):
+    """Remove invalid characters from filename."""
+    # Remove or replace invalid characters
+    invalid_chars = '<>:"/\\|?*'
+    for char in invalid_chars:
+        filename = filename.replace(char, '_')
+
+    # Limit length
+    if len(filename) > 100:
+        filename = filename[:100]
+
+    return filename